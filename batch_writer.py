@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按批写入的错误隔离（保存点 + 二分）
+
+psycopg2 中一条语句失败会使整个事务进入中止状态，之后的语句全部失败，
+一行坏数据（超长字段、与其他租户的主键冲突等）就会让整次写入回滚。
+write_isolated() 把每批包在一个保存点里：
+
+- 正常的批次只多两条语句（SAVEPOINT / RELEASE），仍然是一条多行语句批量写入
+- 批次失败时回滚到保存点，把批次一分为二分别重试，直到定位到单行；
+  一批中只有一行坏数据时额外执行的语句数为 O(log n)
+- 定位到的坏行连同错误写入 tmp_sync_quarantine（与正常数据在同一事务中提交），
+  同步继续写入其余数据
+
+只隔离数据类错误（DataError、IntegrityError），连接断开、语句超时等错误照常抛出。
+asyncpg 后端使用 write_isolated_async()，以嵌套事务（conn.transaction()，即保存点）实现相同的二分。
+"""
+
+import json
+import logging
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+
+# 可以通过二分隔离的错误（与具体行的数据有关）
+ISOLATED_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+# 保存点名称
+SAVEPOINT = 'sync_batch'
+
+
+def write_isolated(cur, rows: Sequence, write: Callable[[Sequence], Optional[List]],
+                   quarantined: List[Tuple], savepoint: str = SAVEPOINT) -> List:
+    """
+    在保存点中写入一批数据，失败时二分定位坏行
+
+    Args:
+        cur: psycopg2 游标（在调用方的事务中）
+        rows: 本批数据
+        write: 写入若干行的函数，返回 RETURNING 的结果
+        quarantined: 定位到的坏行以 (行, 异常) 追加到该列表
+        savepoint: 保存点名称
+
+    Returns:
+        所有写入成功的子批次 RETURNING 结果的合并
+    """
+    if not rows:
+        return []
+    cur.execute(f"SAVEPOINT {savepoint}")
+    try:
+        returned = write(rows)
+    except ISOLATED_ERRORS as e:
+        cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+        cur.execute(f"RELEASE SAVEPOINT {savepoint}")
+        if len(rows) == 1:
+            quarantined.append((rows[0], e))
+            return []
+        middle = len(rows) // 2
+        return (write_isolated(cur, rows[:middle], write, quarantined, savepoint) +
+                write_isolated(cur, rows[middle:], write, quarantined, savepoint))
+    cur.execute(f"RELEASE SAVEPOINT {savepoint}")
+    return list(returned or [])
+
+
+def _async_isolated_errors() -> Tuple:
+    # asyncpg 是可选依赖，只在使用 asyncpg 后端时导入
+    from asyncpg.exceptions import DataError, IntegrityConstraintViolationError
+    return DataError, IntegrityConstraintViolationError
+
+
+async def write_isolated_async(conn, rows: Sequence, write: Callable, quarantined: List[Tuple]) -> List:
+    """
+    write_isolated 的 asyncpg 版本：在嵌套事务（保存点）中写入一批数据，失败时二分定位坏行
+
+    Args:
+        conn: asyncpg 连接（在调用方的事务中）
+        rows: 本批数据
+        write: 写入若干行的协程函数，返回 RETURNING 的结果
+        quarantined: 定位到的坏行以 (行, 异常) 追加到该列表
+
+    Returns:
+        所有写入成功的子批次 RETURNING 结果的合并
+    """
+    if not rows:
+        return []
+    try:
+        async with conn.transaction():
+            returned = await write(rows)
+    except _async_isolated_errors() as e:
+        if len(rows) == 1:
+            quarantined.append((rows[0], e))
+            return []
+        middle = len(rows) // 2
+        return (await write_isolated_async(conn, rows[:middle], write, quarantined) +
+                await write_isolated_async(conn, rows[middle:], write, quarantined))
+    return list(returned or [])
+
+
+def error_text(error: BaseException) -> str:
+    return str(error).strip() or type(error).__name__
+
+
+def quarantine_exists(cur) -> bool:
+    cur.execute("SELECT to_regclass('tmp_sync_quarantine') IS NOT NULL")
+    return cur.fetchone()[0]
+
+
+def quarantine_rows(cur, tenant_id: str, table: str, columns: Sequence[str], key_column: str,
+                    quarantined: List[Tuple]) -> int:
+    """
+    将坏行写入 tmp_sync_quarantine（在调用方的事务中，由调用方提交）
+
+    Args:
+        cur: psycopg2 游标
+        tenant_id: 租户ID
+        table: 目标表
+        columns: 行的列名（idc_records.USER_COLUMNS 等）
+        key_column: 用于定位记录的列（user_name / org_code）
+        quarantined: write_isolated 收集的 (行, 异常)
+
+    Returns:
+        写入的记录数，表不存在时为 0（只输出警告）
+    """
+    if not quarantined:
+        return 0
+    _log_quarantined(table, columns, key_column, quarantined)
+    if not quarantine_exists(cur):
+        logger.warning("tmp_sync_quarantine 表不存在，隔离的数据只输出到日志（请执行 init_tables.sql）")
+        return 0
+    records = _quarantine_records(tenant_id, table, columns, key_column, quarantined)
+    execute_values(cur, """
+        INSERT INTO tmp_sync_quarantine (tenant_id, table_name, record_key, row_data, error, sqlstate)
+        VALUES %s
+    """, records)
+    return len(records)
+
+
+async def quarantine_rows_async(conn, tenant_id: str, table: str, columns: Sequence[str], key_column: str,
+                                quarantined: List[Tuple]) -> int:
+    """quarantine_rows 的 asyncpg 版本（在调用方的事务中）"""
+    if not quarantined:
+        return 0
+    _log_quarantined(table, columns, key_column, quarantined)
+    if not await conn.fetchval("SELECT to_regclass('tmp_sync_quarantine') IS NOT NULL"):
+        logger.warning("tmp_sync_quarantine 表不存在，隔离的数据只输出到日志（请执行 init_tables.sql）")
+        return 0
+    records = _quarantine_records(tenant_id, table, columns, key_column, quarantined)
+    await conn.executemany("""
+        INSERT INTO tmp_sync_quarantine (tenant_id, table_name, record_key, row_data, error, sqlstate)
+        VALUES ($1, $2, $3, $4::jsonb, $5, $6)
+    """, records)
+    return len(records)
+
+
+def _log_quarantined(table: str, columns: Sequence[str], key_column: str, quarantined: List[Tuple]):
+    for row, error in quarantined[:5]:
+        logger.warning(f"{table} 写入失败，已隔离 {str(dict(zip(columns, row)).get(key_column))[:64]}: "
+                       f"{error_text(error).splitlines()[0]}")
+
+
+def _quarantine_records(tenant_id: str, table: str, columns: Sequence[str], key_column: str,
+                        quarantined: List[Tuple]) -> List[Tuple]:
+    records = []
+    for row, error in quarantined:
+        data = dict(zip(columns, row))
+        # 坏行的键本身可能超长，截断到 record_key 的长度；psycopg2 的 SQLSTATE 为 pgcode，asyncpg 为 sqlstate
+        sqlstate = getattr(error, 'pgcode', None) or getattr(error, 'sqlstate', None) or ''
+        records.append((tenant_id, table, str(data.get(key_column) or '')[:256],
+                        json.dumps(data, ensure_ascii=False, default=str), error_text(error), sqlstate))
+    return records
+
+
+def prune_quarantine(cur, retention_days: int, tenant_id: Optional[str] = None) -> int:
+    """删除超过保留天数的隔离记录（由调用方提交）"""
+    if not quarantine_exists(cur):
+        return 0
+    query = "DELETE FROM tmp_sync_quarantine WHERE created_time < NOW() - make_interval(days => %s)"
+    params = [retention_days]
+    if tenant_id is not None:
+        query += " AND tenant_id = %s"
+        params.append(tenant_id)
+    cur.execute(query, params)
+    return cur.rowcount
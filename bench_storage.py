@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+临时表写入后端的基准测试
+
+使用合成数据，在独立的测试租户下对各个数据库后端执行相同的写入场景并输出耗时：
+- 首次写入: 全部为新增
+- 无变化同步: 再次写入相同数据
+- 部分更新: 10% 的用户/组织字段变化，10% 的用户组织关系变化
+- 标记删除: 5% 的用户不在本次同步中
+
+使用方法：
+    python bench_storage.py --users 50000 --backends psycopg2,asyncpg,sqlite
+    python bench_storage.py --backends sqlite --sqlite-path bench.db
+"""
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+import logging
+
+import psycopg2
+from dotenv import load_dotenv
+
+from db_utils import get_tmp_db_config
+from storage import DB_BACKENDS, TABLES, Psycopg2Storage, AsyncpgStorage, SqliteStorage, connect_sqlite
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def make_dataset(user_count: int, org_count: int, seed: int):
+    """生成合成的用户行、组织行和 (user_id, org_id) 关系"""
+    rnd = random.Random(seed)
+    orgs = [(f"bench_org_{i:05d}", f"组织{i}", f"bench_org_{i:05d}", '') for i in range(org_count)]
+    users = []
+    relations = set()
+    for i in range(user_count):
+        user_id = f"bench_{i:07d}"
+        users.append((user_id, user_id, f"用户{i}", f"{user_id}@example.com", f"138{i:08d}", 1))
+        for org in rnd.sample(orgs, 2):
+            relations.add((user_id, org[0]))
+    return users, orgs, relations
+
+
+def mutate(users, orgs, relations, ratio: float, seed: int):
+    """按比例修改用户显示名称、组织名称和用户组织关系"""
+    rnd = random.Random(seed)
+    users = [(u[0], u[1], u[2] + '*', u[3], u[4], u[5]) if rnd.random() < ratio else u for u in users]
+    orgs = [(o[0], o[1] + '*', o[2], o[3]) if rnd.random() < ratio else o for o in orgs]
+    org_ids = [o[0] for o in orgs]
+    relations = {(user_id, rnd.choice(org_ids)) if rnd.random() < ratio else (user_id, org_id)
+                 for user_id, org_id in relations}
+    return users, orgs, relations
+
+
+def cleanup(backend: str, db_config, sqlite_path: str, tenant_id: str):
+    if backend == 'sqlite':
+        if sqlite_path != ':memory:':
+            conn = connect_sqlite(sqlite_path)
+            for table in TABLES + ('tmp_change_log',):
+                conn.execute(f"DELETE FROM {table} WHERE tenant_id = ?", (tenant_id,))
+            conn.close()
+        return
+    conn = psycopg2.connect(**db_config)
+    try:
+        cur = conn.cursor()
+        for table in TABLES:
+            cur.execute(f"DELETE FROM {table} WHERE tenant_id = %s", (tenant_id,))
+        cur.execute("SELECT to_regclass('tmp_change_log') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("DELETE FROM tmp_change_log WHERE tenant_id = %s", (tenant_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class _Runner:
+    """以同步方式调用存储后端的方法，异步后端的协程在同一个事件循环中执行"""
+
+    def __init__(self, backend: str, db_config, sqlite_path: str, tenant_id: str, batch_size: int):
+        self.loop = asyncio.new_event_loop()
+        if backend == 'sqlite':
+            self.storage = SqliteStorage(sqlite_path, tenant_id, batch_size=batch_size)
+        elif backend == 'asyncpg':
+            self.storage = AsyncpgStorage(db_config, tenant_id, batch_size=batch_size)
+            self.loop.run_until_complete(self.storage.open())
+        else:
+            self.storage = Psycopg2Storage(lambda: psycopg2.connect(**db_config), tenant_id, batch_size=batch_size)
+
+    def call(self, method: str, *args, **kwargs):
+        result = getattr(self.storage, method)(*args, **kwargs)
+        if asyncio.iscoroutine(result):
+            result = self.loop.run_until_complete(result)
+        return result
+
+    def close(self):
+        self.call('close')
+        self.loop.close()
+
+
+def run_scenarios(backend: str, db_config, sqlite_path: str, tenant_id: str, users, orgs, relations,
+                  batch_size: int):
+    """执行所有场景，返回 [(场景, 耗时, 结果)]"""
+    runner = _Runner(backend, db_config, sqlite_path, tenant_id, batch_size)
+    results = []
+
+    def timed(name, *calls):
+        start = time.perf_counter()
+        outcome = [runner.call(method, *args) for method, *args in calls]
+        results.append((name, time.perf_counter() - start, outcome))
+
+    def full_sync(users, orgs, relations):
+        return (('upsert_users', users), ('upsert_organizations', orgs), ('sync_relations', relations))
+
+    try:
+        timed('首次写入', *full_sync(users, orgs, relations))
+        timed('无变化同步', *full_sync(users, orgs, relations))
+        changed = mutate(users, orgs, relations, 0.1, seed=1)
+        timed('部分更新(10%)', *full_sync(*changed))
+        keep = [u[0] for u in changed[0][:int(len(users) * 0.95)]]
+        timed('标记删除(5%)', ('mark_missing_users_deleted', keep))
+    finally:
+        runner.close()
+    return results
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='临时表写入后端基准测试')
+    parser.add_argument('--users', type=int, default=20000, help='用户数量（默认：20000）')
+    parser.add_argument('--orgs', type=int, default=500, help='组织数量（默认：500）')
+    parser.add_argument('--backends', type=str, default=','.join(DB_BACKENDS),
+                        help=f"逗号分隔的后端列表（默认：{','.join(DB_BACKENDS)}）")
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的行数（默认：1000）')
+    parser.add_argument('--sqlite-path', type=str, default=':memory:', help='sqlite 后端的数据库文件（默认：内存数据库）')
+    parser.add_argument('--tenant-id', type=str, default='__bench__', help='测试使用的租户ID，测试前后会清空该租户的数据')
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    unknown = [b for b in backends if b not in DB_BACKENDS]
+    if unknown:
+        parser.error(f"不支持的后端: {', '.join(unknown)}")
+
+    db_config = get_tmp_db_config()
+    users, orgs, relations = make_dataset(args.users, args.orgs, seed=0)
+    print(f"数据集: 用户 {len(users)}, 组织 {len(orgs)}, 关系 {len(relations)}, 批大小 {args.batch_size}")
+
+    summary = {}
+    for backend in backends:
+        cleanup(backend, db_config, args.sqlite_path, args.tenant_id)
+        try:
+            summary[backend] = run_scenarios(backend, db_config, args.sqlite_path, args.tenant_id,
+                                             users, orgs, relations, args.batch_size)
+        except Exception as e:
+            print(f"{backend} 执行失败: {e}")
+        finally:
+            cleanup(backend, db_config, args.sqlite_path, args.tenant_id)
+
+    if not summary:
+        sys.exit(1)
+    scenarios = [name for name, _, _ in next(iter(summary.values()))]
+    print(f"\n{'场景':<16}" + ''.join(f"{backend:>14}" for backend in summary))
+    for i, scenario in enumerate(scenarios):
+        print(f"{scenario:<16}" + ''.join(f"{results[i][1]:>13.2f}s" for results in summary.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+同步变更日志（tmp_change_log 发件箱表）
+
+同步过程中对用户、组织、用户-组织关系的每一次新增、更新、软删除，都在写入数据的同一事务中
+追加到 tmp_change_log，seq 单调递增。下游增量消费者保存上次读取到的 seq，
+之后只读取 seq 更大的变更，工作量与变更量成正比，不需要比较整张表。
+
+operation 取值：
+- insert / update / delete: 单条记录的变更，data 为变更后的字段（delete 时为删除前的关键字段）
+- reload: 影子表发布模式下整表被替换，消费者应重新全量读取该表
+"""
+
+import json
+import logging
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+
+# 写入变更日志时持有的事务级咨询锁，保证 seq 的分配顺序与事务提交顺序一致，
+# 读取方按 seq 分页时不会漏掉晚提交但 seq 更小的变更
+CHANGE_LOG_LOCK_KEY = 0x6869_6c6f67  # "hilog"
+
+_COLUMNS = ('seq', 'table_name', 'operation', 'record_id', 'data', 'created_time')
+
+
+def encode_change(tenant_id: str, change: Tuple[str, str, str, Optional[Dict]]) -> Tuple:
+    """将 (表名, 操作, 记录ID, 数据) 转换为 tmp_change_log 的 (tenant_id, table_name, operation, record_id, data) 行"""
+    table, operation, record_id, data = change
+    return (tenant_id, table, operation, record_id, json.dumps(data, ensure_ascii=False) if data is not None else None)
+
+
+def change_log_exists(cur) -> bool:
+    cur.execute("SELECT to_regclass('tmp_change_log') IS NOT NULL")
+    return cur.fetchone()[0]
+
+
+def append_changes(cur, tenant_id: str, changes: Sequence[Tuple[str, str, str, Optional[Dict]]]) -> int:
+    """
+    在当前事务中追加变更记录（由调用方提交事务，应在提交前最后调用以缩短持锁时间）
+
+    Args:
+        cur: 数据库游标
+        tenant_id: 租户ID
+        changes: (表名, 操作, 记录ID, 数据) 列表
+
+    Returns:
+        追加的记录数，tmp_change_log 表不存在时返回 0
+    """
+    if not changes:
+        return 0
+    if not change_log_exists(cur):
+        logger.debug("tmp_change_log 表不存在，跳过变更日志")
+        return 0
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (CHANGE_LOG_LOCK_KEY,))
+    execute_values(cur, """
+        INSERT INTO tmp_change_log (tenant_id, table_name, operation, record_id, data)
+        VALUES %s
+    """, [encode_change(tenant_id, change) for change in changes], page_size=1000)
+    return len(changes)
+
+
+def read_changes(conn, tenant_id: str, after_seq: int = 0, limit: int = 1000,
+                 tables: Optional[Sequence[str]] = None) -> List[Dict]:
+    """
+    读取 after_seq 之后的变更（按 seq 升序的键集分页）
+
+    Args:
+        conn: 数据库连接
+        tenant_id: 租户ID
+        after_seq: 上次读取到的最大 seq，首次读取传 0
+        limit: 每页最大条数
+        tables: 只读取指定表的变更
+
+    Returns:
+        变更记录列表，下一页以最后一条的 seq 作为 after_seq
+    """
+    query = """
+        SELECT seq, table_name, operation, record_id, data, created_time
+        FROM tmp_change_log
+        WHERE tenant_id = %s AND seq > %s
+    """
+    params = [tenant_id, after_seq]
+    if tables:
+        query += " AND table_name = ANY(%s)"
+        params.append(list(tables))
+    query += " ORDER BY seq LIMIT %s"
+    params.append(limit)
+
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return [dict(zip(_COLUMNS, row)) for row in cur.fetchall()]
+
+
+def iter_changes(conn, tenant_id: str, after_seq: int = 0, page_size: int = 1000,
+                 tables: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+    """逐页读取 after_seq 之后的所有变更"""
+    while True:
+        page = read_changes(conn, tenant_id, after_seq, page_size, tables)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_seq = page[-1]['seq']
+
+
+def prune_changes(conn, retention_days: int, tenant_id: Optional[str] = None) -> int:
+    """
+    删除超过保留天数的变更记录
+
+    Args:
+        conn: 数据库连接（由调用方提交事务）
+        retention_days: 保留天数
+        tenant_id: 只清理指定租户，为空时清理所有租户
+
+    Returns:
+        删除的记录数
+    """
+    with conn.cursor() as cur:
+        if not change_log_exists(cur):
+            return 0
+        query = "DELETE FROM tmp_change_log WHERE created_time < NOW() - make_interval(days => %s)"
+        params = [retention_days]
+        if tenant_id is not None:
+            query += " AND tenant_id = %s"
+            params.append(tenant_id)
+        cur.execute(query, params)
+        return cur.rowcount
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+同步变更通知（PostgreSQL LISTEN/NOTIFY）
+
+同步提交成功且数据确实发生变化时，OrgSyncFromIDC 在递增同步版本号的同一事务中发送 NOTIFY，
+下游（如 iam-adapter）监听通知后只重新加载发生变化的表，不再定时全量读取。
+
+通知内容（JSON）：
+    {"tenant_id": "...", "generation": 12, "full_reload": false,
+     "tables": {"tmp_user": {"inserted": 3, "updated": 1, "deleted": 0}, ...}}
+
+影子表发布模式下整表被替换，full_reload 为 true，tables 中为各表的行数。
+"""
+
+import os
+import json
+import time
+import select
+import logging
+from typing import Callable, Dict, List, Optional
+
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CHANNEL = 'hiagent_org_sync'
+
+# 通知涉及的表（full_reload 时需要全部重新加载）
+NOTIFY_TABLES = ('tmp_user', 'tmp_organization', 'tmp_org_user_relation')
+
+# 重连失败时的最长等待时间（秒），从1秒开始按指数退避
+RECONNECT_MAX_DELAY = 60
+
+
+def get_notify_channel() -> str:
+    """通知频道名称（环境变量 SYNC_NOTIFY_CHANNEL）"""
+    return os.getenv('SYNC_NOTIFY_CHANNEL', DEFAULT_CHANNEL)
+
+
+def build_payload(tenant_id: str, generation: Optional[int], tables: Dict[str, Dict[str, int]],
+                  full_reload: bool = False) -> Dict:
+    """构建通知内容，只包含有变化的表"""
+    return {
+        'tenant_id': tenant_id,
+        'generation': generation,
+        'full_reload': full_reload,
+        'tables': {table: counts for table, counts in tables.items() if full_reload or any(counts.values())},
+    }
+
+
+def send_change_notification(cur, channel: str, payload: Dict):
+    """发送通知（在当前事务中排队，事务提交时才会投递给监听方）"""
+    cur.execute("SELECT pg_notify(%s, %s)", (channel, json.dumps(payload, ensure_ascii=False)))
+
+
+def changed_tables(payload: Dict) -> List[str]:
+    """返回通知中需要重新加载的表（full_reload 时为全部表）"""
+    if payload.get('full_reload'):
+        return list(NOTIFY_TABLES)
+    return list(payload.get('tables', {}))
+
+
+class ChangeListener:
+    """
+    监听同步变更通知
+
+    用法：
+        listener = ChangeListener(get_connection, tenant_id='your_tenant_id')
+        listener.run(lambda payload: reload(changed_tables(payload)))
+    """
+
+    def __init__(self, get_connection: Callable, channel: Optional[str] = None, tenant_id: Optional[str] = None):
+        """
+        Args:
+            get_connection: 获取数据库连接的函数
+            channel: 通知频道，默认读取环境变量 SYNC_NOTIFY_CHANNEL
+            tenant_id: 只接收指定租户的通知，为空时接收所有租户
+        """
+        self.get_connection = get_connection
+        self.channel = channel or get_notify_channel()
+        self.tenant_id = tenant_id
+        self._conn = None
+
+    def listen(self):
+        """建立连接并开始监听"""
+        self.close()
+        self._conn = self.get_connection()
+        self._conn.autocommit = True
+        with self._conn.cursor() as cur:
+            cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+        logger.info(f"开始监听同步变更通知: {self.channel}")
+
+    def wait(self, timeout: float = 60) -> List[Dict]:
+        """
+        等待通知
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            收到的通知内容列表，超时时返回空列表
+        """
+        if self._conn is None:
+            self.listen()
+        if select.select([self._conn], [], [], timeout) == ([], [], []):
+            return []
+        self._conn.poll()
+        payloads = []
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            try:
+                payload = json.loads(notify.payload)
+            except ValueError:
+                logger.warning(f"忽略无法解析的通知: {notify.payload}")
+                continue
+            if self.tenant_id and payload.get('tenant_id') != self.tenant_id:
+                continue
+            payloads.append(payload)
+        return payloads
+
+    def run(self, callback: Callable[[Dict], None], poll_timeout: float = 60):
+        """
+        持续监听并对每条通知调用 callback，连接断开时自动重连
+
+        重连期间发送的通知会丢失，重连后以 generation 为空的全量通知调用一次 callback，
+        由调用方重新加载全部数据。数据库仍不可用时按指数退避（最长 RECONNECT_MAX_DELAY 秒）重试。
+        """
+        import psycopg2
+
+        disconnected = False
+        delay = 1
+        while True:
+            if self._conn is None:
+                try:
+                    self.listen()
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                    self.close()
+                    logger.warning(f"连接通知监听失败，{delay} 秒后重试: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                    continue
+                delay = 1
+                if disconnected:
+                    disconnected = False
+                    callback({'tenant_id': self.tenant_id, 'generation': None, 'full_reload': True, 'tables': {}})
+            try:
+                for payload in self.wait(poll_timeout):
+                    callback(payload)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                logger.warning(f"通知监听连接断开，重新连接: {e}")
+                self.close()
+                disconnected = True
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+def main():
+    """监听并打印同步变更通知（用于调试）"""
+    import argparse
+    import psycopg2
+    from dotenv import load_dotenv
+    from db_utils import get_tmp_db_config
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='监听组织架构同步变更通知')
+    parser.add_argument('--channel', type=str, help=f'通知频道（默认：{DEFAULT_CHANNEL}）')
+    parser.add_argument('--tenant-id', type=str, default=os.getenv('TENANT_ID'), help='只显示指定租户的通知')
+    args = parser.parse_args()
+
+    listener = ChangeListener(lambda: psycopg2.connect(**get_tmp_db_config()), args.channel, args.tenant_id)
+    try:
+        listener.run(lambda payload: logger.info(f"收到变更通知: {json.dumps(payload, ensure_ascii=False)}"))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+同步后的数据库维护（ANALYZE、死元组统计、按阈值 VACUUM）
+
+每晚的大量 upsert 和关系删除会留下过期的统计信息和死元组，autovacuum 跟上之前，
+第二天早上 iam-adapter 的查询可能使用很差的执行计划。同步结束后（--maintenance / SYNC_MAINTENANCE=1）：
+
+1. 对本次有写入的表执行 ANALYZE
+2. 从 pg_stat_user_tables 读取存活元组和死元组数量
+3. 死元组比例和数量都超过阈值时执行 VACUUM (ANALYZE)
+4. 每张表记录一行到 tmp_table_stats_history，用于观察膨胀趋势
+
+也可以单独执行：
+    python db_maintenance.py                 # 维护所有临时表
+    python db_maintenance.py --history 14    # 查看最近14天的统计
+"""
+
+import os
+import sys
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+# 维护的表（同步写入的三张临时表和变更日志）
+MAINTENANCE_TABLES = ('tmp_user', 'tmp_organization', 'tmp_org_user_relation', 'tmp_change_log')
+
+# 死元组比例超过该值时执行 VACUUM
+DEFAULT_VACUUM_DEAD_RATIO = 0.2
+
+# 死元组数量少于该值时不执行 VACUUM（小表的比例波动没有意义）
+DEFAULT_VACUUM_MIN_DEAD_TUPLES = 1000
+
+
+def _table_stats(cur, table: str) -> Optional[Dict]:
+    cur.execute("""
+        SELECT n_live_tup, n_dead_tup, pg_total_relation_size(relid), last_autovacuum, last_vacuum
+        FROM pg_stat_user_tables
+        WHERE schemaname = current_schema() AND relname = %s
+    """, (table,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    live, dead, size, last_autovacuum, last_vacuum = row
+    total = live + dead
+    return {'live': live, 'dead': dead, 'dead_ratio': dead / total if total else 0.0, 'bytes': size,
+            'last_autovacuum': last_autovacuum, 'last_vacuum': last_vacuum}
+
+
+def _history_exists(cur) -> bool:
+    cur.execute("SELECT to_regclass('tmp_table_stats_history') IS NOT NULL")
+    return cur.fetchone()[0]
+
+
+def run_maintenance(get_connection: Callable, tables: Sequence[str] = MAINTENANCE_TABLES,
+                    vacuum_dead_ratio: Optional[float] = None, vacuum_min_dead: Optional[int] = None,
+                    tenant_id: str = '') -> List[Dict]:
+    """
+    对指定的表执行 ANALYZE，死元组超过阈值时执行 VACUUM，并记录统计历史
+
+    失败只记录警告，不影响已完成的同步
+
+    Args:
+        get_connection: 获取数据库连接的函数
+        tables: 要维护的表
+        vacuum_dead_ratio: 死元组比例阈值，默认读取环境变量 VACUUM_DEAD_RATIO
+        vacuum_min_dead: 死元组数量阈值，默认读取环境变量 VACUUM_MIN_DEAD_TUPLES
+        tenant_id: 触发维护的租户（记录到历史表）
+
+    Returns:
+        每张表的统计结果
+    """
+    if vacuum_dead_ratio is None:
+        vacuum_dead_ratio = float(os.getenv('VACUUM_DEAD_RATIO', str(DEFAULT_VACUUM_DEAD_RATIO)))
+    if vacuum_min_dead is None:
+        vacuum_min_dead = int(os.getenv('VACUUM_MIN_DEAD_TUPLES', str(DEFAULT_VACUUM_MIN_DEAD_TUPLES)))
+
+    results = []
+    conn = get_connection()
+    # VACUUM 不能在事务中执行
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        has_history = _history_exists(cur)
+        for table in tables:
+            if table not in MAINTENANCE_TABLES:
+                raise ValueError(f"不支持维护的表: {table}")
+            try:
+                start = time.perf_counter()
+                cur.execute(f"ANALYZE {table}")
+                stats = _table_stats(cur, table)
+                if stats is None:
+                    logger.debug(f"{table} 不存在，跳过维护")
+                    continue
+                before_dead = stats['dead']
+                vacuumed = stats['dead_ratio'] >= vacuum_dead_ratio and stats['dead'] >= vacuum_min_dead
+                if vacuumed:
+                    logger.info(f"{table} 死元组 {stats['dead']}（{stats['dead_ratio']:.0%}）超过阈值，执行 VACUUM...")
+                    cur.execute(f"VACUUM (ANALYZE) {table}")
+                    stats = _table_stats(cur, table)
+                stats.update(table=table, dead_before=before_dead, vacuumed=vacuumed,
+                             seconds=time.perf_counter() - start)
+                results.append(stats)
+                dead = f"{before_dead} -> {stats['dead']}" if vacuumed else str(before_dead)
+                logger.info(f"维护 {table}: 存活 {stats['live']}, 死元组 {dead}（{stats['dead_ratio']:.0%}）, "
+                            f"大小 {stats['bytes'] / 1024 / 1024:.1f}MB, "
+                            f"{'已 VACUUM' if vacuumed else '只 ANALYZE'}，耗时 {stats['seconds']:.1f}s")
+                if has_history:
+                    cur.execute("""
+                        INSERT INTO tmp_table_stats_history
+                            (table_name, tenant_id, live_tuples, dead_tuples, dead_tuples_after, table_bytes,
+                             vacuumed, duration_ms)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """, (table, tenant_id, stats['live'], before_dead, stats['dead'], stats['bytes'], vacuumed,
+                          int(stats['seconds'] * 1000)))
+            except Exception as e:
+                logger.warning(f"维护 {table} 失败: {e}")
+        if not has_history:
+            logger.info("tmp_table_stats_history 表不存在，不记录统计历史（请执行 init_tables.sql）")
+    finally:
+        conn.close()
+    return results
+
+
+def read_history(conn, days: int = 14) -> List[Dict]:
+    """读取最近 days 天的统计历史（按时间升序）"""
+    cur = conn.cursor()
+    if not _history_exists(cur):
+        return []
+    cur.execute("""
+        SELECT created_time, table_name, live_tuples, dead_tuples, dead_tuples_after, table_bytes, vacuumed
+        FROM tmp_table_stats_history
+        WHERE created_time >= NOW() - make_interval(days => %s)
+        ORDER BY created_time, table_name
+    """, (days,))
+    columns = ('created_time', 'table_name', 'live', 'dead', 'dead_after', 'bytes', 'vacuumed')
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    import psycopg2
+    from dotenv import load_dotenv
+
+    from db_utils import get_tmp_db_config
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='临时表维护：ANALYZE、死元组统计、按阈值 VACUUM')
+    parser.add_argument('--tables', type=str, default=','.join(MAINTENANCE_TABLES),
+                        help=f"逗号分隔的表名（默认：{','.join(MAINTENANCE_TABLES)}）")
+    parser.add_argument('--vacuum-dead-ratio', type=float, help='死元组比例阈值（默认读取环境变量 VACUUM_DEAD_RATIO）')
+    parser.add_argument('--vacuum-min-dead', type=int, help='死元组数量阈值（默认读取环境变量 VACUUM_MIN_DEAD_TUPLES）')
+    parser.add_argument('--history', type=int, metavar='DAYS', help='只输出最近 DAYS 天的统计历史，不执行维护')
+    args = parser.parse_args()
+
+    db_config = get_tmp_db_config()
+    if args.history:
+        conn = psycopg2.connect(**db_config)
+        try:
+            for row in read_history(conn, args.history):
+                print(f"{row['created_time']:%Y-%m-%d %H:%M}  {row['table_name']:<24}  存活 {row['live']:>10}  "
+                      f"死元组 {row['dead']:>9} -> {row['dead_after']:<9}  {row['bytes'] / 1024 / 1024:>8.1f}MB"
+                      f"{'  VACUUM' if row['vacuumed'] else ''}")
+        finally:
+            conn.close()
+        return
+
+    tables = [t.strip() for t in args.tables.split(',') if t.strip()]
+    unknown = [t for t in tables if t not in MAINTENANCE_TABLES]
+    if unknown:
+        parser.error(f"不支持维护的表: {', '.join(unknown)}")
+    try:
+        run_maintenance(lambda: psycopg2.connect(**db_config), tables, args.vacuum_dead_ratio, args.vacuum_min_dead)
+    except Exception as e:
+        logger.error(f"维护失败: {e}", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+临时数据库（PostgreSQL）通用工具函数
+"""
+
+import csv
+import io
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+# COPY 每批写入的行数，避免一次性在内存中拼接过大的缓冲区
+COPY_CHUNK_SIZE = 10000
+
+
+def get_tmp_db_config() -> Dict:
+    """从环境变量读取临时数据库连接配置（psycopg2.connect 参数）"""
+    return {
+        "host": os.getenv('TMP_DB_HOST', 'localhost'),
+        "port": int(os.getenv('TMP_DB_PORT', '5432')),
+        "database": os.getenv('TMP_DB_NAME', 'tmp_sync_db'),
+        "user": os.getenv('TMP_DB_USER', 'tmp_user'),
+        "password": os.getenv('TMP_DB_PASSWORD', '')
+    }
+
+
+def get_sqlite_path() -> str:
+    """SQLite 后端（TMP_DB_BACKEND=sqlite）的数据库文件路径，:memory: 表示内存数据库"""
+    return os.getenv('TMP_DB_SQLITE_PATH', 'tmp_org_sync.db')
+
+
+def copy_rows(cur, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    """
+    使用 COPY FROM STDIN 批量写入数据
+
+    使用CSV格式并对所有字段加引号，保证空字符串不会被当作NULL写入。
+
+    Args:
+        cur: psycopg2 游标
+        table: 目标表名
+        columns: 列名列表，与每行数据顺序对应
+        rows: 行数据
+
+    Returns:
+        写入的行数
+    """
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    pending = 0
+
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= COPY_CHUNK_SIZE:
+            buffer.seek(0)
+            cur.copy_expert(sql, buffer)
+            total += pending
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n')
+            pending = 0
+
+    if pending:
+        buffer.seek(0)
+        cur.copy_expert(sql, buffer)
+        total += pending
+
+    return total
+
+
+def create_snapshot_tables(cur, snapshot: Dict[str, List[Tuple]], relations: bool = False):
+    """
+    将快照写入当前会话的临时表（事务结束时自动删除）
+
+    创建 _snapshot_user、_snapshot_org，relations=True 时同时创建 _snapshot_relation，
+    列与 idc_records 中规范化后的行字段一致。
+    """
+    cur.execute("CREATE TEMP TABLE _snapshot_user (id VARCHAR(64), user_name VARCHAR(128), display_name VARCHAR(255), "
+                "email VARCHAR(256), mobile VARCHAR(256), status SMALLINT) ON COMMIT DROP")
+    cur.execute("CREATE TEMP TABLE _snapshot_org (id VARCHAR(64), name VARCHAR(128), org_code VARCHAR(128), "
+                "pid VARCHAR(64)) ON COMMIT DROP")
+    copy_rows(cur, '_snapshot_user', ('id', 'user_name', 'display_name', 'email', 'mobile', 'status'), snapshot['users'])
+    copy_rows(cur, '_snapshot_org', ('id', 'name', 'org_code', 'pid'), snapshot['organizations'])
+    if relations:
+        cur.execute("CREATE TEMP TABLE _snapshot_relation (id VARCHAR(64), org_id VARCHAR(64), user_id VARCHAR(64)) "
+                    "ON COMMIT DROP")
+        copy_rows(cur, '_snapshot_relation', ('id', 'org_id', 'user_id'), snapshot['relations'])
+    for table in ('_snapshot_user', '_snapshot_org') + (('_snapshot_relation',) if relations else ()):
+        cur.execute(f"ANALYZE {table}")
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式导出同步后的组织架构（用户、组织、用户-组织关系）
+
+审计和其他系统需要完整的导出文件，直接用普通游标执行查询示例.sql 中的查询会把整个结果集
+读入客户端内存（百万级关系会耗尽跳板机内存）。这里使用服务端命名游标（DECLARE CURSOR）
+按批读取，每批写出后即丢弃，内存占用与结果集大小无关：
+
+    python directory_export.py memberships -o memberships.csv.gz
+    python directory_export.py users --format jsonl -o - | jq ...
+    python directory_export.py organizations --format parquet -o orgs.parquet   # 需要安装 pyarrow
+
+输出文件名以 .gz 结尾或指定 --gzip 时使用 gzip 压缩（parquet 格式使用列内 gzip 压缩）。
+"""
+
+import os
+import csv
+import sys
+import gzip
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+
+# 输出格式
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+# 每批从服务端游标读取的行数
+DEFAULT_BATCH_SIZE = 10000
+
+# 可导出的视图：(列定义, 查询)，列类型 str/int/timestamp 用于 parquet 的 schema
+# 查询按主键排序，导出结果稳定，可以直接 diff
+EXPORT_VIEWS: Dict[str, Tuple[Sequence[Tuple[str, str]], str]] = {
+    'users': (
+        (('id', 'str'), ('user_name', 'str'), ('display_name', 'str'), ('email', 'str'), ('mobile', 'str'),
+         ('status', 'int'), ('is_deleted', 'int'), ('created_time', 'timestamp'), ('updated_time', 'timestamp')),
+        """
+        SELECT id, user_name, display_name, email, mobile, status, is_deleted, created_time, updated_time
+        FROM tmp_user
+        WHERE tenant_id = %(tenant_id)s {deleted_filter}
+        ORDER BY id
+        """,
+    ),
+    'organizations': (
+        (('id', 'str'), ('name', 'str'), ('org_code', 'str'), ('pid', 'str'), ('is_deleted', 'int'),
+         ('created_time', 'timestamp'), ('updated_time', 'timestamp')),
+        """
+        SELECT id, name, org_code, pid, is_deleted, created_time, updated_time
+        FROM tmp_organization
+        WHERE tenant_id = %(tenant_id)s {deleted_filter}
+        ORDER BY id
+        """,
+    ),
+    # 查询示例.sql 中的关系查询，附带用户名和显示名称
+    'memberships': (
+        (('relation_id', 'str'), ('user_id', 'str'), ('user_name', 'str'), ('display_name', 'str'),
+         ('org_id', 'str'), ('org_name', 'str'), ('org_code', 'str'),
+         ('created_time', 'timestamp'), ('updated_time', 'timestamp')),
+        """
+        SELECT r.id, r.user_id, u.user_name, u.display_name, r.org_id, o.name, o.org_code,
+               r.created_time, r.updated_time
+        FROM tmp_org_user_relation r
+        LEFT JOIN tmp_user u ON r.user_id = u.id AND r.tenant_id = u.tenant_id
+        LEFT JOIN tmp_organization o ON r.org_id = o.id AND r.tenant_id = o.tenant_id
+        WHERE r.tenant_id = %(tenant_id)s {deleted_filter}
+        ORDER BY r.user_id, r.org_id, r.id
+        """,
+    ),
+}
+
+# 不导出已删除数据时的过滤条件
+_DELETED_FILTERS = {
+    'users': "AND is_deleted = 0",
+    'organizations': "AND is_deleted = 0",
+    'memberships': "AND COALESCE(u.is_deleted, 0) = 0 AND COALESCE(o.is_deleted, 0) = 0",
+}
+
+
+def iter_view_batches(conn, view: str, tenant_id: str, include_deleted: bool = False,
+                      batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[tuple]]:
+    """
+    使用服务端命名游标按批读取视图（只读事务中执行，整个导出看到同一个快照）
+
+    Args:
+        conn: psycopg2 连接（导出结束后由调用方回滚或关闭）
+        view: EXPORT_VIEWS 中的视图名称
+        tenant_id: 租户ID
+        include_deleted: 是否包含已软删除的用户和组织
+        batch_size: 每批行数
+    """
+    if view not in EXPORT_VIEWS:
+        raise ValueError(f"不支持的导出视图: {view}，可选值: {', '.join(EXPORT_VIEWS)}")
+    _, query = EXPORT_VIEWS[view]
+    query = query.format(deleted_filter='' if include_deleted else _DELETED_FILTERS[view])
+
+    conn.set_session(readonly=True)
+    cur = conn.cursor(name=f'directory_export_{view}')
+    cur.itersize = batch_size
+    try:
+        cur.execute(query, {'tenant_id': tenant_id})
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def _open_text(path: str, compress: bool):
+    if path == '-':
+        if compress:
+            raise ValueError("输出到标准输出时不支持 gzip 压缩")
+        return sys.stdout
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+class _CsvWriter:
+    def __init__(self, f, columns: Sequence[str]):
+        self.writer = csv.writer(f)
+        self.writer.writerow(columns)
+
+    def write(self, rows: List[tuple]):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class _JsonlWriter:
+    def __init__(self, f, columns: Sequence[str]):
+        self.f = f
+        self.columns = columns
+
+    def write(self, rows: List[tuple]):
+        columns = self.columns
+        self.f.writelines(
+            json.dumps({column: _json_value(value) for column, value in zip(columns, row)}, ensure_ascii=False) + '\n'
+            for row in rows)
+
+    def close(self):
+        pass
+
+
+class _ParquetWriter:
+    """每批写一个行组"""
+
+    def __init__(self, path: str, columns: Sequence[Tuple[str, str]], compress: bool):
+        types = {'str': pyarrow.string(), 'int': pyarrow.int64(), 'timestamp': pyarrow.timestamp('us')}
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema,
+                                                    compression='gzip' if compress else 'snappy')
+
+    def write(self, rows: List[tuple]):
+        arrays = [pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), self.schema)]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def export_view(conn, view: str, tenant_id: str, output: str, fmt: str = 'csv', compress: Optional[bool] = None,
+                include_deleted: bool = False, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    将视图流式导出到文件
+
+    Args:
+        conn: psycopg2 连接
+        view: 视图名称（users/organizations/memberships）
+        tenant_id: 租户ID
+        output: 输出文件路径，'-' 表示标准输出（csv/jsonl）
+        fmt: 输出格式（csv/jsonl/parquet）
+        compress: 是否 gzip 压缩，默认根据文件名是否以 .gz 结尾判断
+        include_deleted: 是否包含已软删除的用户和组织
+        batch_size: 每批从服务端游标读取的行数
+
+    Returns:
+        导出的行数
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选值: {', '.join(EXPORT_FORMATS)}")
+    if view not in EXPORT_VIEWS:
+        raise ValueError(f"不支持的导出视图: {view}，可选值: {', '.join(EXPORT_VIEWS)}")
+    if compress is None:
+        compress = output.endswith('.gz')
+    columns, _ = EXPORT_VIEWS[view]
+
+    start = time.time()
+    count = 0
+    if fmt == 'parquet':
+        if pyarrow is None:
+            raise RuntimeError("导出 parquet 格式需要安装 pyarrow（pip install pyarrow）")
+        if output == '-':
+            raise ValueError("parquet 格式不支持输出到标准输出")
+        f = None
+        writer = _ParquetWriter(output, columns, compress)
+    else:
+        f = _open_text(output, compress)
+        names = [name for name, _ in columns]
+        writer = _CsvWriter(f, names) if fmt == 'csv' else _JsonlWriter(f, names)
+    try:
+        for rows in iter_view_batches(conn, view, tenant_id, include_deleted, batch_size):
+            writer.write(rows)
+            count += len(rows)
+            logger.debug(f"已导出 {count} 行")
+        writer.close()
+    finally:
+        conn.rollback()
+        if f is not None and f is not sys.stdout:
+            f.close()
+        elif f is sys.stdout:
+            f.flush()
+
+    logger.info(f"已导出 {view} {count} 行到 {output}（{fmt}{', gzip' if compress else ''}），"
+                f"耗时 {time.time() - start:.1f}s")
+    return count
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    import psycopg2
+    from dotenv import load_dotenv
+
+    from db_utils import get_tmp_db_config
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        stream=sys.stderr)
+
+    parser = argparse.ArgumentParser(description='流式导出同步后的组织架构（用户、组织、用户-组织关系）')
+    parser.add_argument('view', choices=tuple(EXPORT_VIEWS), help='导出的视图')
+    parser.add_argument('-o', '--output', type=str, default='-',
+                        help="输出文件路径，以 .gz 结尾时使用 gzip 压缩（默认：- 标准输出）")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help='输出格式（默认根据文件扩展名判断，否则为 csv）')
+    parser.add_argument('--gzip', action='store_true', default=None, help='使用 gzip 压缩')
+    parser.add_argument('--include-deleted', action='store_true', help='包含已软删除的用户和组织')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'每批从服务端游标读取的行数（默认：{DEFAULT_BATCH_SIZE}）')
+    parser.add_argument('--tenant-id', type=str, help='租户ID（默认读取环境变量 TENANT_ID）')
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        name = args.output[:-3] if args.output.endswith('.gz') else args.output
+        fmt = next((f for f in EXPORT_FORMATS if name.endswith('.' + f)), 'csv')
+    tenant_id = args.tenant_id or os.getenv('TENANT_ID', '0')
+
+    conn = psycopg2.connect(**get_tmp_db_config())
+    try:
+        export_view(conn, args.view, tenant_id, args.output, fmt, compress=args.gzip,
+                    include_deleted=args.include_deleted, batch_size=args.batch_size)
+    except Exception as e:
+        logger.error(f"导出失败: {e}", exc_info=True)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+组织架构二进制索引文件
+
+每次同步完成后从临时表导出一个紧凑的只读索引文件，多个 SSO 工作进程通过 mmap
+打开同一个文件，查询时直接读取映射的内存，不需要在启动时查询数据库，
+操作系统页缓存在进程之间共享，不会因进程数增加而占用更多内存。
+
+文件布局（小端序，每个区段按8字节对齐）：
+- 文件头: 魔数、版本、同步版本号、生成时间、各类数量、各区段的 (偏移, 长度)
+- 字符串表: 所有ID/名称去重后按字典序排列，string_offsets[i]..string_offsets[i+1] 为第i个字符串的UTF-8字节
+- 用户: 按ID排序的字符串下标数组（user_ids）及用户名、显示名称
+- 组织: 按ID排序的字符串下标数组（org_ids）及名称、父组织下标（-1 表示根组织）
+- 邻接表（CSR）: 用户->组织、组织->成员、组织->子组织，offsets[i]..offsets[i+1] 为第i个节点的邻居下标
+
+由于字符串表有序，字符串下标的大小顺序与字符串本身一致，按ID查找时先在字符串表中二分查找
+得到下标，再在 user_ids/org_ids 中二分查找。
+"""
+
+import os
+import sys
+import mmap
+import time
+import bisect
+import struct
+import logging
+import tempfile
+from array import array
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b'HIDX'
+FORMAT_VERSION = 1
+
+# 区段名称及数组类型（B=字节，I=无符号32位，i=有符号32位）
+SECTIONS = (
+    ('string_offsets', 'I'),
+    ('string_data', 'B'),
+    ('user_ids', 'I'),
+    ('user_names', 'I'),
+    ('user_display_names', 'I'),
+    ('user_org_offsets', 'I'),
+    ('user_org_targets', 'I'),
+    ('org_ids', 'I'),
+    ('org_names', 'I'),
+    ('org_parents', 'i'),
+    ('org_child_offsets', 'I'),
+    ('org_child_targets', 'I'),
+    ('org_member_offsets', 'I'),
+    ('org_member_targets', 'I'),
+)
+
+# 魔数、版本、同步版本号、生成时间、字符串数、用户数、组织数、关系数，以及每个区段的 (偏移, 长度)
+_HEADER = struct.Struct('<4sIqqIIII' + 'QQ' * len(SECTIONS))
+
+_ALIGNMENT = 8
+
+
+def _csr(adjacency: List[List[int]]):
+    """将邻接列表转换为 (offsets, targets) 数组"""
+    offsets = array('I', [0])
+    targets = array('I')
+    for neighbours in adjacency:
+        targets.extend(sorted(neighbours))
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+def build_directory_index(conn, tenant_id: str, path: str, generation: Optional[int] = None) -> Dict[str, int]:
+    """
+    从临时表导出租户的组织架构索引文件（先写临时文件再原子替换，已打开旧文件的进程不受影响）
+
+    Args:
+        conn: 数据库连接
+        tenant_id: 租户ID
+        path: 索引文件路径
+        generation: 同步版本号，写入文件头供读取方判断数据版本
+
+    Returns:
+        用户数、组织数、关系数和文件大小
+    """
+    if sys.byteorder != 'little':
+        raise RuntimeError("目录索引文件只支持小端序平台")
+
+    start = time.time()
+    cur = conn.cursor()
+    cur.execute("SELECT id, user_name, display_name FROM tmp_user WHERE tenant_id = %s AND is_deleted = 0",
+                (tenant_id,))
+    users = sorted(cur.fetchall())
+    cur.execute("SELECT id, name, pid FROM tmp_organization WHERE tenant_id = %s AND is_deleted = 0",
+                (tenant_id,))
+    orgs = sorted(cur.fetchall())
+    cur.execute("SELECT DISTINCT user_id, org_id FROM tmp_org_user_relation WHERE tenant_id = %s", (tenant_id,))
+    relations = cur.fetchall()
+    cur.close()
+
+    # 字符串表：Python 字符串按码点排序与UTF-8字节序一致
+    strings = sorted({value for row in users for value in row} | {value for row in orgs for value in row[:2]})
+    string_index = {value: i for i, value in enumerate(strings)}
+    string_offsets = array('I', [0])
+    string_data = bytearray()
+    for value in strings:
+        string_data += value.encode('utf-8')
+        string_offsets.append(len(string_data))
+
+    user_index = {row[0]: i for i, row in enumerate(users)}
+    org_index = {row[0]: i for i, row in enumerate(orgs)}
+
+    user_orgs = [[] for _ in users]
+    org_members = [[] for _ in orgs]
+    relation_count = 0
+    for user_id, org_id in relations:
+        u = user_index.get(user_id)
+        o = org_index.get(org_id)
+        # 忽略指向已删除用户或组织的关系
+        if u is None or o is None:
+            continue
+        user_orgs[u].append(o)
+        org_members[o].append(u)
+        relation_count += 1
+
+    org_parents = array('i', [org_index.get(pid, -1) if pid else -1 for _, _, pid in orgs])
+    org_children = [[] for _ in orgs]
+    for child, parent in enumerate(org_parents):
+        if parent >= 0:
+            org_children[parent].append(child)
+
+    user_org_offsets, user_org_targets = _csr(user_orgs)
+    org_member_offsets, org_member_targets = _csr(org_members)
+    org_child_offsets, org_child_targets = _csr(org_children)
+
+    sections = {
+        'string_offsets': string_offsets,
+        'string_data': bytes(string_data),
+        'user_ids': array('I', (string_index[row[0]] for row in users)),
+        'user_names': array('I', (string_index[row[1]] for row in users)),
+        'user_display_names': array('I', (string_index[row[2]] for row in users)),
+        'user_org_offsets': user_org_offsets,
+        'user_org_targets': user_org_targets,
+        'org_ids': array('I', (string_index[row[0]] for row in orgs)),
+        'org_names': array('I', (string_index[row[1]] for row in orgs)),
+        'org_parents': org_parents,
+        'org_child_offsets': org_child_offsets,
+        'org_child_targets': org_child_targets,
+        'org_member_offsets': org_member_offsets,
+        'org_member_targets': org_member_targets,
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.directory_index.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'\0' * _HEADER.size)
+            locations = []
+            for name, _ in SECTIONS:
+                padding = -f.tell() % _ALIGNMENT
+                f.write(b'\0' * padding)
+                data = sections[name]
+                payload = data.tobytes() if isinstance(data, array) else data
+                locations.extend((f.tell(), len(payload)))
+                f.write(payload)
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, generation or 0, int(time.time()),
+                                 len(strings), len(users), len(orgs), relation_count, *locations))
+            size = f.seek(0, os.SEEK_END)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    logger.info(f"目录索引已写入 {path}: 用户 {len(users)}, 组织 {len(orgs)}, 关系 {relation_count}, "
+                f"{size / 1024:.0f} KiB，耗时 {time.time() - start:.2f}s")
+    return {'users': len(users), 'organizations': len(orgs), 'relations': relation_count, 'size': size}
+
+
+class DirectoryIndex:
+    """
+    通过 mmap 读取组织架构索引文件
+
+    所有数组都是映射内存上的 memoryview，查询不复制整块数据。
+    文件被新一次同步替换后，可调用 is_stale() 判断并重新打开。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+        try:
+            header = _HEADER.unpack_from(self._mmap, 0)
+            magic, version = header[0], header[1]
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"不是有效的目录索引文件（版本 {version}）: {path}")
+            (self.generation, self.built_at, self.string_count,
+             self.user_count, self.org_count, self.relation_count) = header[2:8]
+
+            buffer = memoryview(self._mmap)
+            self._views.append(buffer)
+            locations = header[8:]
+            for i, (name, typecode) in enumerate(SECTIONS):
+                offset, length = locations[2 * i], locations[2 * i + 1]
+                view = buffer[offset:offset + length]
+                if typecode != 'B':
+                    view = view.cast(typecode)
+                self._views.append(view)
+                setattr(self, '_' + name, view)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """释放所有 memoryview 后关闭映射"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def is_stale(self) -> bool:
+        """索引文件是否已被新文件替换"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns) != (self._stat.st_ino, self._stat.st_mtime_ns)
+
+    def _string(self, i: int) -> str:
+        return str(self._string_data[self._string_offsets[i]:self._string_offsets[i + 1]], 'utf-8')
+
+    def _find_string(self, value: str) -> int:
+        """在有序字符串表中二分查找，返回下标，不存在时返回 -1"""
+        target = value.encode('utf-8')
+        data, offsets = self._string_data, self._string_offsets
+        lo, hi = 0, self.string_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(data[offsets[mid]:offsets[mid + 1]]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.string_count and bytes(data[offsets[lo]:offsets[lo + 1]]) == target:
+            return lo
+        return -1
+
+    def _find(self, ids, value: str) -> int:
+        """在按ID排序的下标数组中查找，返回用户/组织下标，不存在时返回 -1"""
+        sidx = self._find_string(value)
+        if sidx < 0:
+            return -1
+        i = bisect.bisect_left(ids, sidx)
+        return i if i < len(ids) and ids[i] == sidx else -1
+
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        """按用户ID查询用户名和显示名称"""
+        u = self._find(self._user_ids, user_id)
+        if u < 0:
+            return None
+        return {
+            'id': user_id,
+            'user_name': self._string(self._user_names[u]),
+            'display_name': self._string(self._user_display_names[u]),
+        }
+
+    def get_user_orgs(self, user_id: str) -> List[str]:
+        """查询用户所属的组织ID"""
+        u = self._find(self._user_ids, user_id)
+        if u < 0:
+            return []
+        targets = self._user_org_targets[self._user_org_offsets[u]:self._user_org_offsets[u + 1]]
+        return [self._string(self._org_ids[o]) for o in targets]
+
+    def get_org_name(self, org_id: str) -> Optional[str]:
+        o = self._find(self._org_ids, org_id)
+        return self._string(self._org_names[o]) if o >= 0 else None
+
+    def get_org_parent(self, org_id: str) -> Optional[str]:
+        """查询父组织ID，根组织或组织不存在时返回 None"""
+        o = self._find(self._org_ids, org_id)
+        if o < 0 or self._org_parents[o] < 0:
+            return None
+        return self._string(self._org_ids[self._org_parents[o]])
+
+    def get_org_ancestors(self, org_id: str) -> List[str]:
+        """从父组织到根组织依次返回所有上级组织ID"""
+        o = self._find(self._org_ids, org_id)
+        ancestors = []
+        seen = set()
+        while o >= 0 and self._org_parents[o] >= 0 and o not in seen:
+            seen.add(o)
+            o = self._org_parents[o]
+            ancestors.append(self._string(self._org_ids[o]))
+        return ancestors
+
+    def get_org_children(self, org_id: str) -> List[str]:
+        """查询直接子组织ID"""
+        o = self._find(self._org_ids, org_id)
+        if o < 0:
+            return []
+        targets = self._org_child_targets[self._org_child_offsets[o]:self._org_child_offsets[o + 1]]
+        return [self._string(self._org_ids[c]) for c in targets]
+
+    def get_org_members(self, org_id: str) -> List[str]:
+        """查询组织下的用户ID"""
+        o = self._find(self._org_ids, org_id)
+        if o < 0:
+            return []
+        targets = self._org_member_targets[self._org_member_offsets[o]:self._org_member_offsets[o + 1]]
+        return [self._string(self._user_ids[u]) for u in targets]
+
+
+def main():
+    """从临时表导出索引文件，或查询已有的索引文件"""
+    import argparse
+    import psycopg2
+    from dotenv import load_dotenv
+    from db_utils import get_tmp_db_config
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='导出或查询组织架构索引文件')
+    parser.add_argument('path', nargs='?', default=os.getenv('DIRECTORY_INDEX_FILE', 'directory.idx'),
+                        help='索引文件路径（默认读取环境变量 DIRECTORY_INDEX_FILE）')
+    parser.add_argument('--build', action='store_true', help='从临时表重新导出索引文件')
+    parser.add_argument('--user', type=str, help='查询用户所属的组织')
+    parser.add_argument('--org', type=str, help='查询组织的上级组织、子组织和成员数')
+    args = parser.parse_args()
+
+    if args.build:
+        conn = psycopg2.connect(**get_tmp_db_config())
+        try:
+            build_directory_index(conn, os.getenv('TENANT_ID', '0'), args.path)
+        finally:
+            conn.close()
+
+    with DirectoryIndex(args.path) as index:
+        print(f"同步版本号: {index.generation}, 生成时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(index.built_at))}")
+        print(f"用户: {index.user_count}, 组织: {index.org_count}, 关系: {index.relation_count}")
+        if args.user:
+            print(f"用户 {args.user}: {index.get_user(args.user)}")
+            print(f"所属组织: {index.get_user_orgs(args.user)}")
+        if args.org:
+            print(f"组织 {args.org}: {index.get_org_name(args.org)}")
+            print(f"上级组织: {index.get_org_ancestors(args.org)}")
+            print(f"子组织: {index.get_org_children(args.org)}")
+            print(f"成员数: {len(index.get_org_members(args.org))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登录时的组织架构查询服务
+
+基于 tmp_user、tmp_organization、tmp_org_user_relation 提供：
+- get_user(user_name): 按用户名查询用户
+- get_user_orgs(user_id): 查询用户所属的组织（查询示例.sql 中的查询2）
+- get_org_members(org_id): 查询组织下的用户（查询示例.sql 中的查询3）
+
+查询结果缓存在进程内的 LRU 缓存中，并带有过期时间。每次同步完成后
+OrgSyncFromIDC.run() 会递增 tmp_sync_generation 中的版本号，查询服务定期检查版本号，
+发现变化时清空缓存，因此登录路径上绝大多数查询只是一次字典查找。
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+
+_GET_USER_SQL = """
+    SELECT id, user_name, display_name, email, mobile, status
+    FROM tmp_user
+    WHERE tenant_id = %s AND user_name = %s AND is_deleted = 0
+"""
+
+_GET_USER_ORGS_SQL = """
+    SELECT r.org_id, o.name AS org_name, o.org_code, o.pid
+    FROM tmp_org_user_relation r
+    JOIN tmp_organization o ON r.org_id = o.id AND r.tenant_id = o.tenant_id
+    WHERE r.user_id = %s
+      AND r.tenant_id = %s
+      AND o.is_deleted = 0
+    ORDER BY o.name
+"""
+
+_GET_ORG_MEMBERS_SQL = """
+    SELECT u.id, u.user_name, u.display_name, u.email, u.mobile
+    FROM tmp_org_user_relation r
+    JOIN tmp_organization o ON r.org_id = o.id AND r.tenant_id = o.tenant_id
+    JOIN tmp_user u ON r.user_id = u.id AND r.tenant_id = u.tenant_id
+    WHERE r.org_id = %s
+      AND r.tenant_id = %s
+      AND u.is_deleted = 0
+      AND o.is_deleted = 0
+    ORDER BY u.display_name
+"""
+
+
+def bump_generation(conn, tenant_id: str) -> Optional[int]:
+    """
+    递增租户的同步版本号（在调用方的事务中执行，由调用方提交）
+
+    Returns:
+        新的版本号，tmp_sync_generation 表不存在时返回 None
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('tmp_sync_generation') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        logger.warning("tmp_sync_generation 表不存在，跳过版本号更新（请执行 init_tables.sql）")
+        return None
+    cur.execute("""
+        INSERT INTO tmp_sync_generation (tenant_id, generation, updated_time)
+        VALUES (%s, 1, NOW())
+        ON CONFLICT (tenant_id)
+        DO UPDATE SET generation = tmp_sync_generation.generation + 1, updated_time = NOW()
+        RETURNING generation
+    """, (tenant_id,))
+    generation = cur.fetchone()[0]
+    cur.close()
+    return generation
+
+
+class _LRUCache:
+    """带过期时间的 LRU 缓存（非线程安全，由 DirectoryLookup 加锁）"""
+
+    _MISSING = object()
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """返回缓存值，不存在或已过期时返回 _MISSING"""
+        entry = self._data.get(key)
+        if entry is None:
+            return self._MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return self._MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    """同一个键进行中的数据库查询，等待的线程共享其结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class DirectoryLookup:
+    """
+    带进程内缓存的组织架构查询
+
+    可在多线程的登录服务中共享同一个实例。返回的字典/列表为缓存对象，调用方不应修改。
+    """
+
+    def __init__(self, get_connection: Callable, tenant_id: str, max_entries: int = 10000,
+                 ttl_seconds: float = 300, generation_check_seconds: float = 5):
+        """
+        Args:
+            get_connection: 获取数据库连接的函数
+            tenant_id: 租户ID
+            max_entries: 缓存的最大条目数（用户、用户组织、组织成员三类查询合计）
+            ttl_seconds: 缓存过期时间（秒），版本号不可用时作为兜底
+            generation_check_seconds: 检查同步版本号的最小间隔（秒）
+        """
+        self.get_connection = get_connection
+        self.tenant_id = tenant_id
+        self.generation_check_seconds = generation_check_seconds
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._cache = _LRUCache(max_entries, ttl_seconds)
+        # _lock 保护缓存和状态，_db_lock 串行化长连接上的查询，两者不会同时持有
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._generation = None
+        self._generation_checked_at = 0.0
+        self._generation_checking = False
+        # 缓存被清空的次数，用于丢弃清空前开始的查询结果
+        self._epoch = 0
+        # 进行中的未命中查询: 键 -> _Flight
+        self._inflight: Dict[tuple, _Flight] = {}
+
+    def get_user(self, user_name: str) -> Optional[Dict]:
+        """按用户名查询未删除的用户，不存在时返回 None"""
+        def load(cur):
+            cur.execute(_GET_USER_SQL, (self.tenant_id, user_name))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return dict(zip(('id', 'user_name', 'display_name', 'email', 'mobile', 'status'), row))
+        return self._lookup(('user', user_name), load)
+
+    def get_user_orgs(self, user_id: str) -> List[Dict]:
+        """查询用户所属的所有未删除组织"""
+        def load(cur):
+            cur.execute(_GET_USER_ORGS_SQL, (user_id, self.tenant_id))
+            return [dict(zip(('org_id', 'org_name', 'org_code', 'pid'), row)) for row in cur.fetchall()]
+        return self._lookup(('user_orgs', user_id), load)
+
+    def get_org_members(self, org_id: str) -> List[Dict]:
+        """查询组织下所有未删除的用户"""
+        def load(cur):
+            cur.execute(_GET_ORG_MEMBERS_SQL, (org_id, self.tenant_id))
+            return [dict(zip(('id', 'user_name', 'display_name', 'email', 'mobile'), row)) for row in cur.fetchall()]
+        return self._lookup(('org_members', org_id), load)
+
+    def invalidate(self):
+        """清空缓存"""
+        with self._lock:
+            self._clear_cache()
+            self.stats['invalidations'] += 1
+
+    def close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _clear_cache(self):
+        """清空缓存并使进行中的查询结果作废（调用方持有 _lock）"""
+        self._cache.clear()
+        self._epoch += 1
+
+    def _lookup(self, key, load: Callable):
+        """
+        查询缓存，未命中时查询数据库
+
+        _lock 只保护缓存和状态，不在持有期间访问数据库：缓存命中不会等待其他线程的数据库查询。
+        同一个键同时未命中时只有一个线程查询数据库（single-flight），其他线程等待其结果。
+        """
+        self._check_generation()
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not _LRUCache._MISSING:
+                self.stats['hits'] += 1
+                return value
+            self.stats['misses'] += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                epoch = self._epoch
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = self._query(load)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                # 查询期间缓存被清空（同步版本号变化）时，结果可能是旧数据，不写入缓存
+                if flight.error is None and epoch == self._epoch:
+                    self._cache.set(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def _check_generation(self):
+        """
+        定期读取同步版本号，版本号变化时清空缓存
+
+        同一时间只有一个线程检查；检查失败（数据库不可用）时记录警告，继续使用缓存的数据，
+        到下一个检查间隔再重试。
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._generation_checked_at < self.generation_check_seconds or self._generation_checking:
+                return
+            self._generation_checked_at = now
+            self._generation_checking = True
+
+        def load(cur):
+            cur.execute("SELECT to_regclass('tmp_sync_generation') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                return None
+            cur.execute("SELECT generation FROM tmp_sync_generation WHERE tenant_id = %s", (self.tenant_id,))
+            row = cur.fetchone()
+            return row[0] if row else 0
+
+        try:
+            generation = self._query(load)
+        except Exception as e:
+            logger.warning(f"检查同步版本号失败，继续使用缓存的组织架构数据: {e}")
+            with self._lock:
+                self._generation_checking = False
+            return
+
+        with self._lock:
+            self._generation_checking = False
+            if generation != self._generation:
+                if self._generation is not None:
+                    logger.info(f"同步版本号变化 {self._generation} -> {generation}，清空组织架构查询缓存")
+                    self.stats['invalidations'] += 1
+                self._clear_cache()
+                self._generation = generation
+
+    def _query(self, load: Callable):
+        """在长连接上执行查询（由 _db_lock 串行化），连接断开时重连一次"""
+        with self._db_lock:
+            for attempt in range(2):
+                if self._conn is None or self._conn.closed:
+                    self._conn = self.get_connection()
+                    self._conn.autocommit = True
+                try:
+                    with self._conn.cursor() as cur:
+                        return load(cur)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+                    if attempt:
+                        raise
+                    logger.warning("组织架构查询连接已断开，正在重连...")
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分布式获取身份中台用户（协调者 + 多个工作节点）
+
+身份中台按客户端限流，单个进程逐页获取大租户的全部用户耗时很长。分布式模式下：
+
+1. 协调者（coordinator）读取第一页的 page.total，把页码范围切分为工作单元写入 tmp_fetch_unit
+2. 部署在多台主机上的工作节点（worker）用 FOR UPDATE SKIP LOCKED 领取工作单元，
+   获取对应页的用户，规范化为用户/组织/关系行后写入 tmp_fetch_staging，并在同一事务中将单元标记为完成
+3. 所有单元完成后，协调者按单元顺序合并暂存数据（与全量同步相同的去重规则），
+   按发布模式写入临时表并发送变更通知
+
+工作单元有租约：执行中的节点每获取一页续约一次（最多每 lease_seconds/3 秒写一次数据库），
+节点退出或卡住超过 lease_seconds 后单元可以被其他节点重新领取；完成时只有仍持有租约的节点才能提交，
+同一单元的数据不会重复写入。协调者等待期间定期更新任务时间，超过 job_expire_seconds 没有更新的
+running 任务（协调者已退出）标记为 expired 并删除暂存数据。
+
+使用方法：
+    python distributed_fetch.py coordinator --pages-per-unit 20
+    python distributed_fetch.py worker            # 在其他主机上启动，可启动多个
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import socket
+import logging
+from typing import Dict, List, Optional
+
+from psycopg2.extras import execute_values
+
+from sync_org_from_idc import OrgSyncFromIDC, IdentityPageRequest
+from idc_records import get_attr, build_snapshot
+from org_extract import extract_organizations
+from run_coordination import ON_CONFLICT_MODES
+
+logger = logging.getLogger(__name__)
+
+
+# 每个工作单元包含的页数
+DEFAULT_PAGES_PER_UNIT = 20
+
+# 工作单元租约（秒），超过后可被其他节点重新领取
+DEFAULT_LEASE_SECONDS = 300
+
+# 单个工作单元的最大尝试次数，超过后整个任务失败
+DEFAULT_MAX_ATTEMPTS = 3
+
+# running 状态的任务超过该时间（秒）没有更新时视为协调者已退出，标记为 expired
+DEFAULT_JOB_EXPIRE_SECONDS = 1800
+
+_STAGING_KINDS = ('users', 'organizations', 'relations')
+
+
+def _worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseLost(Exception):
+    """工作单元的租约已被其他节点接管，或任务已不在运行"""
+
+
+class DistributedFetch:
+    """分布式获取任务的协调与执行"""
+
+    def __init__(self, sync: OrgSyncFromIDC, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, job_expire_seconds: int = DEFAULT_JOB_EXPIRE_SECONDS):
+        """
+        Args:
+            sync: 同步实例（提供身份中台客户端、数据库连接、租户ID和发布逻辑）
+            lease_seconds: 工作单元租约（秒）
+            max_attempts: 单个工作单元的最大尝试次数
+            job_expire_seconds: running 任务超过该时间没有更新时标记为 expired（秒）
+        """
+        if sync.db_backend == 'sqlite':
+            raise ValueError("分布式获取使用 PostgreSQL 作为工作队列，不支持 sqlite 数据库后端")
+        if job_expire_seconds <= lease_seconds:
+            raise ValueError("job_expire_seconds 必须大于 lease_seconds")
+        self.sync = sync
+        self.tenant_id = sync.tenant_id
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.job_expire_seconds = job_expire_seconds
+        self.worker = _worker_name()
+        self._last_expire_check = 0.0
+
+    # ------------------------------------------------------------------
+    # 协调者
+    # ------------------------------------------------------------------
+
+    def create_job(self, page_size: int = 100, pages_per_unit: int = DEFAULT_PAGES_PER_UNIT) -> Optional[str]:
+        """
+        读取用户总数并创建工作单元
+
+        Returns:
+            任务ID，身份中台没有返回用户总数时返回 None（无法切分页码范围）
+        """
+        response = self.sync.identity_client.get_identity_list(IdentityPageRequest(current=0, size=page_size))
+        page_info = get_attr(response.data, 'page') if response and response.data else None
+        total_count = int(get_attr(page_info, 'total', 0) or 0) if page_info else 0
+        if total_count <= 0:
+            logger.warning("身份中台没有返回用户总数（page.total），无法切分工作单元")
+            return None
+
+        total_pages = math.ceil(total_count / page_size)
+        job_id = str(uuid.uuid4())
+        units = [(job_id, unit_no, start, min(start + pages_per_unit, total_pages))
+                 for unit_no, start in enumerate(range(0, total_pages, pages_per_unit))]
+        conn = self.sync.get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO tmp_fetch_job (job_id, tenant_id, page_size, total_pages)
+                VALUES (%s, %s, %s, %s)
+            """, (job_id, self.tenant_id, page_size, total_pages))
+            execute_values(cur, "INSERT INTO tmp_fetch_unit (job_id, unit_no, page_start, page_end) VALUES %s",
+                           units, page_size=1000)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        logger.info(f"已创建分布式获取任务 {job_id}: 用户 {total_count}, 共 {total_pages} 页, "
+                    f"{len(units)} 个工作单元（每单元 {pages_per_unit} 页）")
+        return job_id
+
+    def expire_jobs(self) -> List[str]:
+        """
+        将超过 job_expire_seconds 没有更新的 running 任务标记为 expired 并删除其暂存数据
+
+        Returns:
+            过期的任务ID
+        """
+        self._last_expire_check = time.monotonic()
+        conn = self.sync.get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE tmp_fetch_job SET status = 'expired', updated_time = NOW()
+                WHERE tenant_id = %s AND status = 'running'
+                  AND updated_time < NOW() - make_interval(secs => %s)
+                RETURNING job_id
+            """, (self.tenant_id, self.job_expire_seconds))
+            expired = [row[0] for row in cur.fetchall()]
+            if expired:
+                cur.execute("DELETE FROM tmp_fetch_staging WHERE job_id = ANY(%s)", (expired,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        for job_id in expired:
+            logger.warning(f"分布式获取任务 {job_id} 超过 {self.job_expire_seconds} 秒没有更新（协调者已退出），"
+                           f"已标记为 expired 并删除暂存数据")
+        return expired
+
+    def _job_progress(self, job_id: str) -> Dict[str, int]:
+        conn = self.sync.get_db_connection()
+        try:
+            cur = conn.cursor()
+            # 协调者仍在等待，更新任务时间避免被当作已放弃的任务过期
+            cur.execute("UPDATE tmp_fetch_job SET updated_time = NOW() WHERE job_id = %s AND status = 'running'",
+                        (job_id,))
+            if cur.rowcount == 0:
+                conn.commit()
+                raise Exception(f"分布式获取任务 {job_id} 已不在运行（已过期或被终止）")
+            # 租约过期且已达到最大尝试次数的单元不会再被领取，标记为失败
+            cur.execute("""
+                UPDATE tmp_fetch_unit
+                SET status = 'failed', error = '租约过期且已达到最大尝试次数', finished_time = NOW()
+                WHERE job_id = %s AND status = 'claimed' AND attempts >= %s
+                  AND claimed_time < NOW() - make_interval(secs => %s)
+            """, (job_id, self.max_attempts, self.lease_seconds))
+            cur.execute("SELECT status, COUNT(*) FROM tmp_fetch_unit WHERE job_id = %s GROUP BY status", (job_id,))
+            progress = dict(cur.fetchall())
+            conn.commit()
+            return progress
+        finally:
+            conn.close()
+
+    def _set_job_status(self, job_id: str, status: str):
+        conn = self.sync.get_db_connection()
+        try:
+            cur = conn.cursor()
+            # 已过期的任务保持 expired 状态
+            cur.execute("UPDATE tmp_fetch_job SET status = %s, updated_time = NOW() WHERE job_id = %s "
+                        "AND status = 'running'", (status, job_id))
+            if status != 'running':
+                cur.execute("DELETE FROM tmp_fetch_staging WHERE job_id = %s", (job_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def wait_for_job(self, job_id: str, participate: bool = True, poll_seconds: float = 5,
+                     timeout_seconds: float = 3600):
+        """
+        等待所有工作单元完成
+
+        Args:
+            participate: 协调者自身是否也领取并执行工作单元
+            poll_seconds: 检查进度的间隔（秒）
+            timeout_seconds: 最长等待时间（秒）
+        """
+        deadline = time.monotonic() + timeout_seconds
+        last_report = None
+        while True:
+            progress = self._job_progress(job_id)
+            total = sum(progress.values())
+            done = progress.get('done', 0)
+            if progress.get('failed'):
+                raise Exception(f"分布式获取任务 {job_id} 有 {progress['failed']} 个工作单元失败")
+            if done == total:
+                logger.info(f"分布式获取任务 {job_id} 的 {total} 个工作单元已全部完成")
+                return
+            if time.monotonic() > deadline:
+                raise Exception(f"分布式获取任务 {job_id} 超时: 已完成 {done}/{total}")
+            if progress != last_report:
+                logger.info(f"工作单元进度: {done}/{total}（{progress}）")
+                last_report = progress
+            if not (participate and self.run_one(job_id)):
+                time.sleep(poll_seconds)
+
+    def merge(self, job_id: str) -> Dict[str, List]:
+        """按单元顺序合并暂存数据，去重规则与 build_snapshot 相同（后出现的为准）"""
+        users, organizations, relations = {}, {}, {}
+        conn = self.sync.get_db_connection()
+        try:
+            with conn.cursor(name='fetch_staging') as cur:
+                cur.itersize = 100
+                cur.execute("SELECT kind, rows FROM tmp_fetch_staging WHERE job_id = %s ORDER BY unit_no, kind",
+                            (job_id,))
+                for kind, rows in cur:
+                    if kind == 'users':
+                        users.update((row[1], tuple(row)) for row in rows)
+                    elif kind == 'organizations':
+                        organizations.update((row[2], tuple(row)) for row in rows)
+                    else:
+                        relations.update((tuple(row), None) for row in rows)
+        finally:
+            conn.rollback()
+            conn.close()
+        return {
+            'users': list(users.values()),
+            'organizations': list(organizations.values()),
+            'relations': [(str(uuid.uuid4()), org_id, user_id) for user_id, org_id in relations],
+        }
+
+    def run_coordinator(self, page_size: int = 100, pages_per_unit: int = DEFAULT_PAGES_PER_UNIT,
+                        participate: bool = True, poll_seconds: float = 5, timeout_seconds: float = 3600) -> bool:
+        """
+        创建任务、等待工作节点完成、合并并发布
+
+        Returns:
+            是否成功发布（身份中台没有返回用户总数时返回 False，调用方可改用单进程全量同步）
+        """
+        self.expire_jobs()
+        job_id = self.create_job(page_size, pages_per_unit)
+        if job_id is None:
+            return False
+        try:
+            self.wait_for_job(job_id, participate=participate, poll_seconds=poll_seconds,
+                              timeout_seconds=timeout_seconds)
+            snapshot = self.merge(job_id)
+            logger.info(f"合并完成: 用户 {len(snapshot['users'])}, 组织 {len(snapshot['organizations'])}, "
+                        f"用户-组织关系 {len(snapshot['relations'])}")
+            self.sync.publish_snapshot(snapshot)
+        except Exception:
+            self._set_job_status(job_id, 'failed')
+            raise
+        self._set_job_status(job_id, 'merged')
+        return True
+
+    # ------------------------------------------------------------------
+    # 工作节点
+    # ------------------------------------------------------------------
+
+    def claim_unit(self, job_id: Optional[str] = None) -> Optional[Dict]:
+        """领取一个待执行（或租约已过期）的工作单元，没有可领取的单元时返回 None"""
+        query = """
+            UPDATE tmp_fetch_unit u
+            SET status = 'claimed', worker = %s, attempts = u.attempts + 1, claimed_time = NOW()
+            FROM tmp_fetch_job j
+            WHERE j.job_id = u.job_id AND (u.job_id, u.unit_no) = (
+                SELECT c.job_id, c.unit_no
+                FROM tmp_fetch_unit c
+                JOIN tmp_fetch_job cj ON cj.job_id = c.job_id
+                WHERE cj.tenant_id = %s AND cj.status = 'running' AND c.attempts < %s
+                  AND (c.status = 'pending'
+                       OR (c.status = 'claimed' AND c.claimed_time < NOW() - make_interval(secs => %s)))
+                  {job_filter}
+                ORDER BY c.job_id, c.unit_no
+                LIMIT 1
+                FOR UPDATE OF c SKIP LOCKED
+            )
+            RETURNING u.job_id, u.unit_no, u.page_start, u.page_end, j.page_size, u.attempts
+        """
+        params = [self.worker, self.tenant_id, self.max_attempts, self.lease_seconds]
+        if job_id:
+            params.append(job_id)
+        conn = self.sync.get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(query.format(job_filter='AND c.job_id = %s' if job_id else ''), params)
+            row = cur.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return dict(zip(('job_id', 'unit_no', 'page_start', 'page_end', 'page_size', 'attempts'), row))
+
+    def renew_lease(self, unit: Dict) -> bool:
+        """
+        续约工作单元（更新 claimed_time），同时更新任务时间
+
+        Returns:
+            是否仍持有租约，单元已被其他节点接管或任务已不在运行时返回 False
+        """
+        conn = self.sync.get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE tmp_fetch_unit u SET claimed_time = NOW()
+                FROM tmp_fetch_job j
+                WHERE j.job_id = u.job_id AND j.status = 'running'
+                  AND u.job_id = %s AND u.unit_no = %s AND u.status = 'claimed' AND u.worker = %s AND u.attempts = %s
+            """, (unit['job_id'], unit['unit_no'], self.worker, unit['attempts']))
+            renewed = cur.rowcount > 0
+            if renewed:
+                cur.execute("UPDATE tmp_fetch_job SET updated_time = NOW() WHERE job_id = %s", (unit['job_id'],))
+            conn.commit()
+            return renewed
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def fetch_unit(self, unit: Dict) -> Dict[str, List]:
+        """
+        获取工作单元范围内的用户，规范化为用户/组织/关系行
+
+        每获取一页续约一次（最多每 lease_seconds/3 秒一次），租约已丢失时抛出 LeaseLost
+        """
+        users = []
+        renew_interval = self.lease_seconds / 3
+        renewed_at = time.monotonic()
+        for page in range(unit['page_start'], unit['page_end']):
+            response = self.sync.identity_client.get_identity_list(
+                IdentityPageRequest(current=page, size=unit['page_size']))
+            page_users = (get_attr(response.data, 'content') or []) if response and response.data else []
+            users.extend(page_users)
+            if len(page_users) < unit['page_size']:
+                break
+            if time.monotonic() - renewed_at >= renew_interval:
+                if not self.renew_lease(unit):
+                    raise LeaseLost()
+                renewed_at = time.monotonic()
+        users = self.sync._filter_users_by_org_name(users)
+        organizations, relations = extract_organizations(users, workers=1)
+        snapshot = build_snapshot(users, organizations, relations=relations)
+        return {
+            'users': snapshot['users'],
+            'organizations': snapshot['organizations'],
+            'relations': [(user_id, org_id) for _, org_id, user_id in snapshot['relations']],
+        }
+
+    def complete_unit(self, unit: Dict, rows: Dict[str, List]) -> bool:
+        """
+        写入暂存数据并将单元标记为完成（同一事务）
+
+        Returns:
+            是否提交成功，租约已被其他节点接管或任务已不在运行时返回 False
+        """
+        conn = self.sync.get_db_connection()
+        try:
+            cur = conn.cursor()
+            # 共享锁住任务行：任务过期或失败（删除暂存数据）与本次写入暂存数据互斥
+            cur.execute("SELECT 1 FROM tmp_fetch_job WHERE job_id = %s AND status = 'running' FOR SHARE",
+                        (unit['job_id'],))
+            if cur.fetchone() is None:
+                conn.rollback()
+                return False
+            cur.execute("""
+                UPDATE tmp_fetch_unit
+                SET status = 'done', finished_time = NOW(), error = NULL
+                WHERE job_id = %s AND unit_no = %s AND status = 'claimed' AND worker = %s AND attempts = %s
+            """, (unit['job_id'], unit['unit_no'], self.worker, unit['attempts']))
+            if cur.rowcount == 0:
+                conn.rollback()
+                return False
+            cur.execute("DELETE FROM tmp_fetch_staging WHERE job_id = %s AND unit_no = %s",
+                        (unit['job_id'], unit['unit_no']))
+            execute_values(cur, "INSERT INTO tmp_fetch_staging (job_id, unit_no, kind, rows) VALUES %s", [
+                (unit['job_id'], unit['unit_no'], kind, json.dumps(rows[kind], ensure_ascii=False))
+                for kind in _STAGING_KINDS
+            ])
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def fail_unit(self, unit: Dict, error: str):
+        """记录失败；未达到最大尝试次数时放回队列"""
+        conn = self.sync.get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE tmp_fetch_unit
+                SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                    error = %s, finished_time = NOW()
+                WHERE job_id = %s AND unit_no = %s AND status = 'claimed' AND worker = %s
+            """, (self.max_attempts, error[:1000], unit['job_id'], unit['unit_no'], self.worker))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def run_one(self, job_id: Optional[str] = None) -> bool:
+        """
+        领取并执行一个工作单元
+
+        Returns:
+            是否领取到工作单元
+        """
+        unit = self.claim_unit(job_id)
+        if unit is None:
+            return False
+        label = f"工作单元 {unit['job_id'][:8]}#{unit['unit_no']}（第 {unit['page_start'] + 1}-{unit['page_end']} 页）"
+        try:
+            rows = self.fetch_unit(unit)
+        except LeaseLost:
+            logger.warning(f"{label} 的租约已被其他节点接管或任务已不在运行，停止获取")
+            return True
+        except Exception as e:
+            logger.warning(f"{label} 执行失败（第 {unit['attempts']} 次）: {e}")
+            self.fail_unit(unit, str(e))
+            return True
+        if self.complete_unit(unit, rows):
+            logger.info(f"{label} 完成: 用户 {len(rows['users'])}")
+        else:
+            logger.warning(f"{label} 的租约已被其他节点接管或任务已不在运行，丢弃本次结果")
+        return True
+
+    def run_worker(self, poll_seconds: float = 5, idle_exit_seconds: float = 0):
+        """
+        持续领取并执行工作单元
+
+        Args:
+            poll_seconds: 没有可领取的单元时的等待间隔（秒）
+            idle_exit_seconds: 连续空闲超过该时间后退出（0 表示一直运行）
+        """
+        logger.info(f"工作节点 {self.worker} 已启动（租户ID: {self.tenant_id}）")
+        idle_since = time.monotonic()
+        while True:
+            if self.run_one():
+                idle_since = time.monotonic()
+                continue
+            if time.monotonic() - self._last_expire_check > self.lease_seconds:
+                self.expire_jobs()
+            if idle_exit_seconds and time.monotonic() - idle_since > idle_exit_seconds:
+                logger.info(f"连续 {idle_exit_seconds:.0f} 秒没有工作单元，工作节点退出")
+                return
+            time.sleep(poll_seconds)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='分布式获取身份中台用户：协调者切分页码范围，多个工作节点并行获取')
+    subparsers = parser.add_subparsers(dest='role', required=True)
+
+    coordinator = subparsers.add_parser('coordinator', help='创建任务、等待完成、合并并发布')
+    coordinator.add_argument('--page-size', type=int, default=100, help='每页大小（默认：100）')
+    coordinator.add_argument('--pages-per-unit', type=int, default=DEFAULT_PAGES_PER_UNIT,
+                             help=f'每个工作单元的页数（默认：{DEFAULT_PAGES_PER_UNIT}）')
+    coordinator.add_argument('--no-participate', action='store_true', help='协调者自身不执行工作单元')
+    coordinator.add_argument('--timeout', type=float, default=3600, help='等待工作单元完成的最长时间（秒，默认：3600）')
+    coordinator.add_argument('--on-conflict', choices=ON_CONFLICT_MODES, default=os.getenv('SYNC_ON_CONFLICT', 'exit'),
+                             help='同一租户已有同步在运行时的处理方式：exit=跳过本次（默认），wait=等待其结束')
+
+    worker = subparsers.add_parser('worker', help='领取并执行工作单元')
+    worker.add_argument('--idle-exit', type=float, default=0, help='连续空闲超过该秒数后退出（默认：0 一直运行）')
+
+    for sub in (coordinator, worker):
+        sub.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS,
+                         help=f'工作单元租约（秒，默认：{DEFAULT_LEASE_SECONDS}）')
+        sub.add_argument('--poll-seconds', type=float, default=5, help='轮询间隔（秒，默认：5）')
+        sub.add_argument('--job-expire-seconds', type=int, default=DEFAULT_JOB_EXPIRE_SECONDS,
+                         help=f'running 任务超过该时间没有更新时标记为 expired 并删除暂存数据'
+                              f'（秒，默认：{DEFAULT_JOB_EXPIRE_SECONDS}）')
+
+    args = parser.parse_args()
+
+    try:
+        fetch = DistributedFetch(OrgSyncFromIDC(), lease_seconds=args.lease_seconds,
+                                 job_expire_seconds=args.job_expire_seconds)
+        if args.role == 'coordinator':
+            # 合并发布与单进程全量同步使用同一个租户级运行锁
+            published = []
+            ran = fetch.sync.run_exclusive(args.on_conflict, target=lambda: published.append(fetch.run_coordinator(
+                page_size=args.page_size, pages_per_unit=args.pages_per_unit, participate=not args.no_participate,
+                poll_seconds=args.poll_seconds, timeout_seconds=args.timeout)))
+            if not ran:
+                logger.info("已有同步在运行，本次未执行")
+            elif not published[0]:
+                sys.exit(2)
+        else:
+            fetch.run_worker(poll_seconds=args.poll_seconds, idle_exit_seconds=args.idle_exit)
+    except KeyboardInterrupt:
+        logger.info("\n用户中断")
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+事件驱动的准实时同步服务
+
+从 HTTP 接口或本地队列文件（JSON Lines）接收人员/组织变动事件，
+在短暂的防抖窗口内合并同一对象的多次变动，再以小批量方式通过与全量同步相同的
+upsert 逻辑写入临时表。全量同步（sync_org_from_idc.py）只需定期执行用于对账。
+
+事件格式（两种均支持）：
+    {"type": "identity", "action": "upsert", "sourceUserId": "2021001", "data": {...身份信息，可选...}}
+    {"type": "org", "action": "delete", "orgId": "org001"}
+    {"eventType": 1, "dataStatus": 2, "data": {"sourceUserId": "2021001", ...}}   # 身份中台事件回调格式
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+from sync_org_from_idc import OrgSyncFromIDC
+from idc_records import get_attr
+
+logger = logging.getLogger(__name__)
+
+
+# 身份中台回调中的事件类型和数据变更状态
+_CALLBACK_EVENT_TYPES = {1: 'identity', 2: 'org'}
+_CALLBACK_DATA_STATUS = {1: 'upsert', 2: 'upsert', 3: 'delete'}
+
+# 同一对象的事件连续写入失败的默认最大次数
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+def parse_event(event: Dict) -> Tuple[str, str, str, Optional[Dict]]:
+    """
+    解析事件
+
+    Returns:
+        (对象类型 identity/org, 动作 upsert/delete, 对象ID, 事件携带的数据或None)
+    """
+    if 'eventType' in event:
+        kind = _CALLBACK_EVENT_TYPES.get(int(event['eventType']))
+        action = _CALLBACK_DATA_STATUS.get(int(event.get('dataStatus') or 2))
+    else:
+        kind = event.get('type')
+        action = event.get('action', 'upsert')
+    if kind not in ('identity', 'org') or action not in ('upsert', 'delete'):
+        raise ValueError(f"不支持的事件: {event}")
+
+    data = event.get('data') or None
+    if kind == 'identity':
+        key = event.get('sourceUserId') or get_attr(data, 'sourceUserId')
+    else:
+        key = event.get('orgId') or get_attr(data, 'orgId') or get_attr(data, 'sourceOrgId')
+    if not key:
+        raise ValueError(f"事件缺少对象ID: {event}")
+    return kind, action, str(key), data
+
+
+class EventIngestService:
+    """接收变动事件，防抖合并后以小批量写入临时表"""
+
+    def __init__(self, sync: OrgSyncFromIDC, debounce_seconds: float = 5.0,
+                 max_wait_seconds: float = 30.0, max_batch_size: int = 500,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, dead_letter_file: Optional[str] = None):
+        """
+        Args:
+            sync: 同步实例，复用其数据库连接和 upsert 逻辑
+            debounce_seconds: 最后一个事件到达后等待的时间，期间到达的同一对象的事件会被合并
+            max_wait_seconds: 事件持续到达时，最早的未处理事件最长等待时间
+            max_batch_size: 未处理对象数达到该值时立即写入
+            max_attempts: 同一对象的事件连续写入失败的最大次数，超过后写入死信文件，不再重试
+            dead_letter_file: 死信文件（JSON Lines，每行为一个可重新提交的事件），为空时只输出到日志
+        """
+        self.sync = sync
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.max_batch_size = max_batch_size
+        self.max_attempts = max_attempts
+        self.dead_letter_file = dead_letter_file
+
+        self._lock = threading.Lock()
+        # (对象类型, 对象ID) -> (动作, 数据)，同一对象只保留最后一次变动
+        self._pending: Dict[Tuple[str, str], Tuple[str, Optional[Dict]]] = {}
+        self._first_event_time = None
+        self._last_event_time = None
+        # (对象类型, 对象ID) -> 连续写入失败的次数
+        self._attempts: Dict[Tuple[str, str], int] = {}
+        self._stop = threading.Event()
+        self.stats = {'received': 0, 'rejected': 0, 'applied': 0, 'batches': 0, 'failed_batches': 0,
+                      'deferred_batches': 0, 'dead_lettered': 0}
+
+    def submit(self, events: List[Dict]) -> int:
+        """提交事件（线程安全），无法解析或不支持的事件记录警告后跳过，返回接受的事件数"""
+        parsed = []
+        for event in events:
+            try:
+                parsed.append(parse_event(event))
+            except (ValueError, TypeError, AttributeError) as e:
+                logger.warning(f"跳过无法处理的事件: {str(e)[:200]}")
+                with self._lock:
+                    self.stats['rejected'] += 1
+        now = time.monotonic()
+        with self._lock:
+            for kind, action, key, data in parsed:
+                self._pending[(kind, key)] = (action, data)
+            if parsed:
+                self._first_event_time = self._first_event_time or now
+                self._last_event_time = now
+                self.stats['received'] += len(parsed)
+        return len(parsed)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def retrying_count(self) -> int:
+        """写入失败后等待重试的对象数"""
+        with self._lock:
+            return len(self._attempts)
+
+    def _due(self) -> bool:
+        """判断是否应写入当前积压的事件"""
+        with self._lock:
+            if not self._pending:
+                return False
+            now = time.monotonic()
+            return (len(self._pending) >= self.max_batch_size
+                    or now - self._last_event_time >= self.debounce_seconds
+                    or now - self._first_event_time >= self.max_wait_seconds)
+
+    def flush(self) -> int:
+        """
+        持有租户级运行锁将积压的事件作为一个小批量写入临时表，失败时事件保留到下次重试
+
+        全量同步（定时任务或对账）正在运行时不写入：全量同步使用事件到达前获取的快照，
+        与事件交错写入会标记删除刚创建的用户或恢复过期的关系。此时批次放回队列，不计入失败次数
+        """
+        with self._lock:
+            batch = self._pending
+            self._pending = {}
+            self._first_event_time = None
+            self._last_event_time = None
+        if not batch:
+            return 0
+
+        try:
+            self.sync.reset_change_counts()
+            applied = self.sync.run_exclusive('exit', target=lambda: self._apply(batch))
+        except Exception as e:
+            logger.error(f"写入事件批次失败（{len(batch)} 个对象），稍后重试: {e}", exc_info=True)
+            self._requeue(batch, e)
+            self.stats['failed_batches'] += 1
+            return 0
+        if not applied:
+            logger.info(f"已有全量同步在运行，事件批次（{len(batch)} 个对象）稍后重试")
+            self._requeue(batch)
+            self.stats['deferred_batches'] += 1
+            return 0
+
+        with self._lock:
+            for key in batch:
+                self._attempts.pop(key, None)
+        self.stats['applied'] += len(batch)
+        self.stats['batches'] += 1
+        return len(batch)
+
+    def _requeue(self, batch: Dict[Tuple[str, str], Tuple[str, Optional[Dict]]],
+                 error: Optional[Exception] = None):
+        """
+        批次放回队列，但不覆盖期间到达的更新事件
+
+        error 不为空时（写入失败）计入各对象的失败次数，连续失败次数过多的对象转入死信
+        """
+        dead = {}
+        with self._lock:
+            for key, value in batch.items():
+                if error is not None:
+                    attempts = self._attempts.get(key, 0) + 1
+                    if attempts >= self.max_attempts:
+                        self._attempts.pop(key, None)
+                        if key not in self._pending:
+                            dead[key] = value
+                        continue
+                    self._attempts[key] = attempts
+                self._pending.setdefault(key, value)
+            if self._pending:
+                now = time.monotonic()
+                self._first_event_time = self._first_event_time or now
+                self._last_event_time = now
+        if dead:
+            self._dead_letter(dead, error)
+
+    def _dead_letter(self, batch: Dict[Tuple[str, str], Tuple[str, Optional[Dict]]], error: Exception):
+        """将多次写入失败的事件写入死信文件（每行为一个可重新提交的事件）"""
+        logger.error(f"{len(batch)} 个对象的事件连续 {self.max_attempts} 次写入失败，转入死信"
+                     f"{'文件 ' + self.dead_letter_file if self.dead_letter_file else '（未配置死信文件，只记录日志）'}")
+        lines = []
+        for (kind, key), (action, data) in batch.items():
+            event = {'type': kind, 'action': action, 'sourceUserId' if kind == 'identity' else 'orgId': key,
+                     'data': data, 'error': str(error)[:500], 'attempts': self.max_attempts}
+            lines.append(json.dumps(event, ensure_ascii=False, default=str))
+        self.stats['dead_lettered'] += len(batch)
+        if not self.dead_letter_file:
+            for line in lines:
+                logger.error(f"死信事件: {line}")
+            return
+        try:
+            with open(self.dead_letter_file, 'a', encoding='utf-8') as f:
+                f.writelines(line + '\n' for line in lines)
+        except OSError as e:
+            logger.error(f"写入死信文件失败: {e}")
+            for line in lines:
+                logger.error(f"死信事件: {line}")
+
+    def _apply(self, batch: Dict[Tuple[str, str], Tuple[str, Optional[Dict]]]):
+        """按组织、人员的顺序应用一个批次"""
+        org_upserts, org_deletes, user_upserts, user_deletes, user_fetch = [], [], [], [], []
+        for (kind, key), (action, data) in batch.items():
+            if kind == 'org':
+                if action == 'delete':
+                    org_deletes.append(key)
+                else:
+                    org_upserts.append({
+                        'id': key,
+                        'name': get_attr(data, 'orgName') or get_attr(data, 'name') or key,
+                        'org_code': key,
+                        'pid': str(get_attr(data, 'parentOrgId') or get_attr(data, 'pid') or ''),
+                    })
+            elif action == 'delete':
+                user_deletes.append(key)
+            elif data and (get_attr(data, 'mainOrg') is not None or get_attr(data, 'orgList') is not None):
+                user_upserts.append(data)
+            else:
+                # 事件未携带完整的身份信息，从身份中台按学工号查询
+                user_fetch.append(key)
+
+        if user_fetch:
+            fetched = self.sync.get_users_by_ids_from_idc(user_fetch)
+            found = {str(get_attr(u, 'sourceUserId')) for u in fetched}
+            user_upserts.extend(fetched)
+            # 身份中台已查询不到的用户按删除处理
+            user_deletes.extend(user_id for user_id in user_fetch if user_id not in found)
+
+        if self.sync.filter_org_names and user_upserts:
+            user_upserts = self.sync._filter_users_by_org_name(user_upserts)
+
+        logger.info(f"应用事件批次: 组织更新 {len(org_upserts)}, 组织删除 {len(org_deletes)}, "
+                    f"人员更新 {len(user_upserts)}, 人员删除 {len(user_deletes)}")
+        if org_upserts:
+            self.sync.sync_organizations(org_upserts)
+        if org_deletes:
+            self.sync.mark_organizations_deleted(org_deletes)
+        if user_upserts:
+            self.sync.sync_users(user_upserts)
+            self.sync.replace_user_org_relations(user_upserts)
+        if user_deletes:
+            self.sync.mark_users_deleted(user_deletes)
+        self.sync.finish_publish(export_index=False)
+
+    def stop(self):
+        self._stop.set()
+
+    def serve(self, http_port: Optional[int] = None, http_host: str = '0.0.0.0',
+              queue_file: Optional[str] = None, reconcile_interval_hours: float = 0):
+        """
+        运行服务，直到收到停止信号
+
+        Args:
+            http_port: HTTP 接口端口（POST 事件，GET /health 查看状态），为空时不启动
+            http_host: HTTP 接口监听地址
+            queue_file: 队列文件路径（每行一个JSON事件），为空时不读取
+            reconcile_interval_hours: 定期执行全量同步对账的间隔（小时），0 表示不执行
+        """
+        server = None
+        if http_port:
+            server = ThreadingHTTPServer((http_host, http_port), _make_handler(self))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            logger.info(f"事件HTTP接口已启动: http://{http_host}:{http_port}/events")
+
+        tailer = QueueFileTailer(queue_file) if queue_file else None
+        if tailer:
+            logger.info(f"开始读取事件队列文件: {queue_file}")
+
+        next_reconcile = time.monotonic() + reconcile_interval_hours * 3600 if reconcile_interval_hours else None
+        retry_at = 0.0
+        consecutive_failures = 0
+        try:
+            while not self._stop.is_set():
+                if tailer:
+                    events = tailer.read_new_events()
+                    # 读到的事件全部被跳过且没有积压时，直接提交读取位置，避免重启后重复读取坏行
+                    if events and not self.submit(events) and not self.pending_count() \
+                            and not self.retrying_count():
+                        tailer.commit()
+
+                if self._due() and time.monotonic() >= retry_at:
+                    failed_before = self.stats['failed_batches']
+                    deferred_before = self.stats['deferred_batches']
+                    self.flush()
+                    if (self.stats['failed_batches'] > failed_before and self.retrying_count()) \
+                            or self.stats['deferred_batches'] > deferred_before:
+                        # 连续失败或全量同步运行期间指数退避，最多等待5分钟
+                        consecutive_failures += 1
+                        retry_at = time.monotonic() + min(self.debounce_seconds * 2 ** consecutive_failures, 300)
+                    else:
+                        consecutive_failures = 0
+                        if tailer and not self.retrying_count():
+                            # 写入成功，或失败的事件已全部转入死信
+                            tailer.commit()
+
+                if next_reconcile and time.monotonic() >= next_reconcile:
+                    logger.info("开始定期全量对账同步...")
+                    try:
+                        # 与定时任务启动的全量同步重叠时跳过本次对账
+                        if not self.sync.run_exclusive():
+                            logger.info("已有全量同步在运行，跳过本次对账")
+                    except Exception as e:
+                        logger.error(f"全量对账同步失败: {e}")
+                    next_reconcile = time.monotonic() + reconcile_interval_hours * 3600
+
+                self._stop.wait(0.2)
+        finally:
+            if server:
+                server.shutdown()
+            # 退出前写入剩余事件
+            if self.pending_count():
+                self.flush()
+            if tailer and self.pending_count() == 0 and not self.retrying_count():
+                tailer.commit()
+            logger.info(f"事件同步服务已停止，统计: {self.stats}")
+
+
+class QueueFileTailer:
+    """
+    读取追加写入的事件队列文件（JSON Lines）
+
+    读取位置保存在 <队列文件>.offset 中，只有在事件成功写入后才提交，重启后从上次提交处继续；
+    文件被截断或轮转（大小小于已读位置）时从头开始读取。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset_path = f"{path}.offset"
+        self.offset = self._load_offset()
+        self._read_offset = self.offset
+
+    def _load_offset(self) -> int:
+        try:
+            with open(self.offset_path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def read_new_events(self) -> List[Dict]:
+        """读取上次读取位置之后新增的完整行"""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return []
+        if size < self._read_offset:
+            logger.warning("事件队列文件被截断或轮转，从头开始读取")
+            self._read_offset = 0
+            self.offset = 0
+        if size == self._read_offset:
+            return []
+
+        events = []
+        with open(self.path, 'rb') as f:
+            f.seek(self._read_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # 写入中的不完整行，下次再读
+                self._read_offset += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except ValueError as e:
+                    logger.warning(f"跳过无法解析的事件行: {e}")
+        return events
+
+    def commit(self):
+        """提交读取位置"""
+        if self._read_offset == self.offset:
+            return
+        tmp_path = f"{self.offset_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(self._read_offset))
+        os.replace(tmp_path, self.offset_path)
+        self.offset = self._read_offset
+
+
+def _make_handler(service: EventIngestService):
+    """创建绑定到服务实例的 HTTP 请求处理类"""
+    token = os.getenv('EVENT_INGEST_TOKEN', '')
+
+    class EventHandler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: Dict):
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/health':
+                self._reply(200, {'pending': service.pending_count(), **service.stats})
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if token and self.headers.get('X-Ingest-Token') != token:
+                self._reply(401, {'error': 'unauthorized'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'null')
+                events = body if isinstance(body, list) else [body]
+                accepted = service.submit(events)
+            except (ValueError, TypeError, AttributeError) as e:
+                self._reply(400, {'error': str(e)})
+                return
+            if events and not accepted:
+                self._reply(400, {'error': '没有可处理的事件', 'rejected': len(events)})
+                return
+            self._reply(202, {'accepted': accepted, 'rejected': len(events) - accepted})
+
+        def log_message(self, format, *args):
+            logger.debug("HTTP %s - %s", self.address_string(), format % args)
+
+    return EventHandler
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='事件驱动的准实时同步服务：接收人员/组织变动事件并写入临时表')
+    parser.add_argument('--http-port', type=int, default=int(os.getenv('EVENT_INGEST_PORT', '0')),
+                        help='HTTP 事件接口端口（0 表示不启动）')
+    parser.add_argument('--http-host', type=str, default=os.getenv('EVENT_INGEST_HOST', '0.0.0.0'),
+                        help='HTTP 事件接口监听地址（默认：0.0.0.0）')
+    parser.add_argument('--queue-file', type=str, default=os.getenv('EVENT_QUEUE_FILE') or None,
+                        help='事件队列文件（JSON Lines）')
+    parser.add_argument('--debounce-seconds', type=float, default=float(os.getenv('EVENT_DEBOUNCE_SECONDS', '5')),
+                        help='防抖窗口（秒，默认：5）')
+    parser.add_argument('--max-batch-size', type=int, default=500,
+                        help='单个批次的最大对象数（默认：500）')
+    parser.add_argument('--max-attempts', type=int,
+                        default=int(os.getenv('EVENT_MAX_ATTEMPTS', str(DEFAULT_MAX_ATTEMPTS))),
+                        help=f'同一对象的事件连续写入失败的最大次数，超过后转入死信（默认：{DEFAULT_MAX_ATTEMPTS}）')
+    parser.add_argument('--dead-letter-file', type=str, default=os.getenv('EVENT_DEAD_LETTER_FILE') or None,
+                        help='死信文件（JSON Lines），默认为 <队列文件>.dead，未指定队列文件时只记录日志')
+    parser.add_argument('--reconcile-interval-hours', type=float, default=0,
+                        help='定期执行全量同步对账的间隔（小时，默认：0 不执行）')
+
+    args = parser.parse_args()
+    if not args.http_port and not args.queue_file:
+        parser.error('请至少指定 --http-port 或 --queue-file')
+
+    try:
+        sync = OrgSyncFromIDC()
+        service = EventIngestService(sync, debounce_seconds=args.debounce_seconds,
+                                     max_wait_seconds=max(args.debounce_seconds * 6, 30),
+                                     max_batch_size=args.max_batch_size, max_attempts=args.max_attempts,
+                                     dead_letter_file=args.dead_letter_file or (
+                                         f"{args.queue_file}.dead" if args.queue_file else None))
+        signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+        service.serve(http_port=args.http_port, http_host=args.http_host, queue_file=args.queue_file,
+                      reconcile_interval_hours=args.reconcile_interval_hours)
+    except KeyboardInterrupt:
+        logger.info("\n用户中断事件同步服务")
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+人员身份分页接口的原始 JSON 快速路径
+
+SDK 的 get_identity_list 会把每个身份构造成 pydantic 模型（IdentityInfo、MainOrgInfo、OrgInfo，
+含枚举和日期校验），同步时再通过 get_attr 逐个字段读回，大租户下这部分的 CPU 和内存开销
+远大于同步实际用到的几个字段。FastIdentityClient 复用 SDK 的 requests.Session 直接请求接口，
+用 orjson（未安装时使用标准库 json）解析响应，只把同步用到的字段投影为 namedtuple：
+
+- IdentityRecord / OrgRef 的字段名与 SDK 模型一致，get_attr、iter_user_org_ids、extract_organizations
+  等读取逻辑不需要修改
+- 相同的组织引用在所有用户间共享同一个 OrgRef 对象
+- 返回值与接口原始结构一致（data.page.total、data.content）
+"""
+
+import json
+import logging
+from collections import namedtuple
+from typing import Dict, Optional
+
+import requests
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from cqhyxk.exceptions import AuthenticationError, APIError, RequestError
+
+logger = logging.getLogger(__name__)
+
+
+# 人员身份分页接口
+IDENTITY_PAGE_ENDPOINT = '/open-api/member/identity/page'
+
+# 接口成功状态码
+SUCCESS_CODE = '00000000'
+
+# 组织引用（mainOrg / orgList 中的元素）
+OrgRef = namedtuple('OrgRef', ('orgId', 'orgName', 'sourceOrgId'))
+
+# 同步用到的身份字段
+IdentityRecord = namedtuple('IdentityRecord', ('sourceUserId', 'name', 'mobile', 'status', 'mainOrg', 'orgList',
+                                               'updateTime'))
+
+PageInfo = namedtuple('PageInfo', ('total', 'size'))
+IdentityPage = namedtuple('IdentityPage', ('page', 'content'))
+IdentityPageResult = namedtuple('IdentityPageResult', ('code', 'message', 'data'))
+
+
+def _loads(content: bytes):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class FastIdentityClient:
+    """
+    get_identity_list 的快速实现，其他接口仍使用 SDK
+
+    用法：
+        client = FastIdentityClient.wrap(CqhyxkClient())
+        response = client.get_identity_list(IdentityPageRequest(current=0, size=100))
+    """
+
+    def __init__(self, client):
+        """
+        Args:
+            client: CqhyxkClient 实例（使用其 session、base_url 和认证头）
+        """
+        self.client = client
+        self.url = f"{client.base_url}{IDENTITY_PAGE_ENDPOINT}"
+        self._orgs: Dict[tuple, OrgRef] = {}
+
+    @classmethod
+    def wrap(cls, client) -> Optional['FastIdentityClient']:
+        """客户端没有 requests.Session 或 base_url 时（SDK 版本不同）返回 None"""
+        if getattr(client, 'session', None) is None or not getattr(client, 'base_url', None):
+            logger.warning("身份中台客户端不支持原始JSON快速路径，使用SDK模型")
+            return None
+        logger.info(f"使用原始JSON快速路径获取人员身份（JSON解析: {'orjson' if orjson else 'json'}）")
+        return cls(client)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _org(self, data) -> Optional[OrgRef]:
+        if not data:
+            return None
+        key = (data.get('orgId'), data.get('orgName'), data.get('sourceOrgId'))
+        org = self._orgs.get(key)
+        if org is None:
+            org = self._orgs[key] = OrgRef(*key)
+        return org
+
+    def _record(self, item: Dict) -> IdentityRecord:
+        org_list = item.get('orgList')
+        return IdentityRecord(
+            item.get('sourceUserId'),
+            item.get('name'),
+            item.get('mobile'),
+            item.get('status'),
+            self._org(item.get('mainOrg')),
+            [self._org(org) for org in org_list if org] if isinstance(org_list, list) else None,
+            item.get('updateTime'),
+        )
+
+    def get_identity_list(self, request) -> IdentityPageResult:
+        """
+        人员身份信息分页列表（参数与 SDK 的 IdentityPageRequest 相同，错误与 SDK 抛出相同的异常）
+        """
+        try:
+            response = self.client.session.post(self.url, data=_dumps(request.dict(exclude_none=True)))
+            if response.status_code == 401:
+                raise AuthenticationError("Authentication failed. Please check your app key and secret.")
+            response.raise_for_status()
+            payload = _loads(response.content)
+        except requests.exceptions.RequestException as e:
+            raise RequestError(f"Request failed: {e}")
+        except ValueError as e:
+            raise RequestError(f"Failed to decode JSON response: {e}")
+
+        if payload.get('code') != SUCCESS_CODE:
+            raise APIError(message=str(payload.get('message', 'Unknown error')), code=payload.get('code'))
+
+        data = payload.get('data')
+        if data is None:
+            return IdentityPageResult(payload.get('code'), payload.get('message'), None)
+        page = data.get('page') or {}
+        content = data.get('content') or []
+        return IdentityPageResult(
+            payload.get('code'),
+            payload.get('message'),
+            IdentityPage(PageInfo(page.get('total', data.get('total')), page.get('size', data.get('size'))),
+                         [self._record(item) for item in content if item]),
+        )
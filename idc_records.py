@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+身份中台数据记录的读取与规范化工具
+
+同步脚本、影子表发布等模块共用，统一用户/组织/关系字段的提取规则
+"""
+
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# 规范化后的用户行字段顺序（与 tmp_user 列对应）
+USER_COLUMNS = ('id', 'user_name', 'display_name', 'email', 'mobile', 'status')
+
+# 规范化后的组织行字段顺序（与 tmp_organization 列对应）
+ORG_COLUMNS = ('id', 'name', 'org_code', 'pid')
+
+# 规范化后的用户-组织关系行字段顺序（与 tmp_org_user_relation 列对应）
+RELATION_COLUMNS = ('id', 'org_id', 'user_id')
+
+
+def get_attr(obj, attr_name, default=None):
+    """
+    安全获取对象属性，支持对象和字典
+    """
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        return obj.get(attr_name, default)
+    return getattr(obj, attr_name, default)
+
+
+def get_value(obj, default=None):
+    """
+    获取值，如果是枚举类型则获取其值
+    """
+    if obj is None:
+        return default
+    if hasattr(obj, 'value'):  # 枚举类型
+        return obj.value
+    return obj
+
+
+def get_user_id(user_data) -> str:
+    """获取用户ID（优先使用 sourceUserId 学工号）"""
+    return str(get_attr(user_data, 'sourceUserId') or get_attr(user_data, 'userId') or get_attr(user_data, 'id') or '')
+
+
+def normalize_user(user_data) -> Optional[Tuple]:
+    """
+    将身份中台用户数据规范化为 tmp_user 行
+
+    Returns:
+        按 USER_COLUMNS 顺序排列的元组，数据无效时返回 None
+    """
+    # API返回字段：sourceUserId（学工号）、name（姓名）、mobile（手机号）、status（身份状态）
+    user_id = get_user_id(user_data)
+    user_name = str(get_attr(user_data, 'sourceUserId') or get_attr(user_data, 'userName') or get_attr(user_data, 'username') or '')
+    if not user_id or not user_name:
+        return None
+    display_name = str(get_attr(user_data, 'name') or get_attr(user_data, 'displayName') or user_name)
+    email = str(get_attr(user_data, 'email') or get_attr(user_data, 'mail') or '')
+    mobile = str(get_attr(user_data, 'mobile') or get_attr(user_data, 'phone') or get_attr(user_data, 'telephone') or '')
+    # status: 1=正常, 2=数据源删除, 3=身份中台删除, 4=禁用, 5=失效, 6=回收站人员
+    # status可能是枚举类型，需要获取其value
+    api_status = get_value(get_attr(user_data, 'status', 1))
+    status = 1 if api_status == 1 else 0  # 只有正常状态才启用
+    return (user_id, user_name, display_name, email, mobile, status)
+
+
+def iter_user_org_ids(user_data) -> List[str]:
+    """
+    收集用户的所有组织ID（包括主组织和orgList中的所有组织），保持首次出现的顺序
+    """
+    org_ids = []
+    seen = set()
+
+    # 主组织（mainOrg是MainOrgInfo对象）
+    main_org = get_attr(user_data, 'mainOrg')
+    if main_org:
+        org_id = get_attr(main_org, 'orgId') or get_attr(main_org, 'sourceOrgId')
+        if org_id:
+            org_id = str(org_id)
+            seen.add(org_id)
+            org_ids.append(org_id)
+
+    # orgList中的所有组织（orgList是OrgInfo对象列表）
+    org_list = get_attr(user_data, 'orgList') or []
+    if isinstance(org_list, list):
+        for org in org_list:
+            org_id = get_attr(org, 'orgId') or get_attr(org, 'sourceOrgId')
+            if org_id:
+                org_id = str(org_id)
+                if org_id not in seen:
+                    seen.add(org_id)
+                    org_ids.append(org_id)
+
+    return org_ids
+
+
+def normalize_org(org_data) -> Optional[Tuple]:
+    """
+    将组织数据规范化为 tmp_organization 行
+
+    Returns:
+        按 ORG_COLUMNS 顺序排列的元组，数据无效时返回 None
+    """
+    org_id = str(get_attr(org_data, 'id') or '')
+    if not org_id:
+        return None
+    # 优先使用name，如果没有则使用orgName，都为空时使用org_id作为名称
+    org_name = str(get_attr(org_data, 'name') or get_attr(org_data, 'orgName') or org_id)
+    org_code = str(get_attr(org_data, 'org_code') or org_id)
+    pid = str(get_attr(org_data, 'pid') or '')
+    return (org_id, org_name, org_code, pid)
+
+
+def build_snapshot(users: Iterable, organizations: Iterable,
+                   relations: Optional[Iterable[Tuple[str, str]]] = None) -> Dict[str, List[Tuple]]:
+    """
+    根据本次获取的用户和组织构建完整快照
+
+    与逐行 upsert 的冲突键保持一致：用户按 user_name 去重，组织按 org_code 去重，
+    关系按 (user_id, org_id) 去重，重复时以后出现的数据为准。
+
+    Args:
+        users: 用户列表
+        organizations: 组织列表
+        relations: 已提取的 (user_id, org_id) 关系，未传入时从用户数据中提取
+
+    Returns:
+        {'users': [...], 'organizations': [...], 'relations': [...]}
+    """
+    user_rows = {}
+    relation_keys = {}
+    for user_data in users:
+        row = normalize_user(user_data)
+        if row is None:
+            continue
+        user_rows[row[1]] = row
+        if relations is None:
+            for org_id in iter_user_org_ids(user_data):
+                relation_keys[(row[0], org_id)] = None
+    if relations is not None:
+        relation_keys = dict.fromkeys(relations)
+
+    org_rows = {}
+    for org_data in organizations:
+        row = normalize_org(org_data)
+        if row is not None:
+            org_rows[row[2]] = row
+
+    relations = [(str(uuid.uuid4()), org_id, user_id) for user_id, org_id in relation_keys]
+    return {
+        'users': list(user_rows.values()),
+        'organizations': list(org_rows.values()),
+        'relations': relations,
+    }
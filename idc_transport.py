@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+身份中台 HTTP 传输层（连接池 + keep-alive + gzip + 分阶段计时）
+
+cqhyxk SDK 通过 requests.Session 发送请求，但没有配置连接池大小、超时和压缩，
+抓包时每页 get_identity_list 都可能重新进行 TCP/TLS 握手（并发获取时连接池不够用，
+多余的连接用完即关闭）。install_transport() 在 SDK 的 session 上挂载 IDCTransportAdapter：
+
+- 每个主机一个持久连接池，连接数上限为 pool_maxsize，超出时等待空闲连接（pool_block）而不是新建
+- 显式声明 keep-alive 和 gzip，响应按 Content-Encoding 自动解压
+- 默认连接/读取超时，身份中台无响应时不会无限挂起
+- 记录每个请求的建连（TCP+TLS）、等待服务端响应、传输响应体的耗时和字节数，
+  可以据此区分分页耗时中握手、服务端处理和数据传输各占多少
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+# 每个主机的最大连接数（并发获取页面时的上限）
+DEFAULT_POOL_SIZE = 10
+
+# 连接超时、读取超时（秒）
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+
+# 当前线程本次请求中新建连接的次数和耗时（连接由发起请求的线程建立）
+_local = threading.local()
+
+
+def _timed_connect(connect):
+    def wrapper(self):
+        start = time.perf_counter()
+        try:
+            connect(self)
+        finally:
+            _local.connects = getattr(_local, 'connects', 0) + 1
+            _local.connect_seconds = getattr(_local, 'connect_seconds', 0.0) + time.perf_counter() - start
+    return wrapper
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    connect = _timed_connect(HTTPConnection.connect)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    connect = _timed_connect(HTTPSConnection.connect)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class IDCTransportAdapter(HTTPAdapter):
+    """带连接池上限、默认超时和请求计时的 HTTPAdapter"""
+
+    def __init__(self, pool_maxsize: int = DEFAULT_POOL_SIZE, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT):
+        """
+        Args:
+            pool_maxsize: 每个主机的最大连接数
+            connect_timeout: 连接超时（秒）
+            read_timeout: 读取超时（秒）
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'connects': 0, 'connect_seconds': 0.0,
+                      'wait_seconds': 0.0, 'transfer_seconds': 0.0, 'bytes': 0, 'gzip': 0}
+        super().__init__(pool_connections=4, pool_maxsize=pool_maxsize, pool_block=True)
+
+    def init_poolmanager(self, connections, maxsize, block=True, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        _local.connects = 0
+        _local.connect_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            response = super().send(request, stream=stream, timeout=timeout or self.timeout, **kwargs)
+        except Exception:
+            with self._stats_lock:
+                self.stats['requests'] += 1
+                self.stats['errors'] += 1
+            raise
+        headers_at = time.perf_counter()
+        if not stream:
+            # 在这里读取响应体，传输耗时才能与等待服务端响应的耗时分开统计
+            response.content
+        end = time.perf_counter()
+
+        connect_seconds = _local.connect_seconds
+        wait_seconds = headers_at - start - connect_seconds
+        transfer_seconds = end - headers_at
+        try:
+            size = response.raw.tell()  # 压缩后在网络上传输的字节数
+        except Exception:
+            size = len(response.content) if not stream else 0
+        gzip = 'gzip' in response.headers.get('Content-Encoding', '')
+        with self._stats_lock:
+            stats = self.stats
+            stats['requests'] += 1
+            stats['connects'] += _local.connects
+            stats['connect_seconds'] += connect_seconds
+            stats['wait_seconds'] += wait_seconds
+            stats['transfer_seconds'] += transfer_seconds
+            stats['bytes'] += size
+            stats['gzip'] += gzip
+        logger.debug("身份中台请求 %s %s: 建连 %.3fs%s, 等待 %.3fs, 传输 %.3fs, %d 字节%s",
+                     request.method, request.path_url, connect_seconds, '（新连接）' if _local.connects else '',
+                     wait_seconds, transfer_seconds, size, '（gzip）' if gzip else '')
+        return response
+
+    def snapshot(self) -> Dict:
+        """当前累计的统计数据"""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def log_summary(self, label: str, since: Optional[Dict] = None):
+        """
+        输出统计汇总
+
+        Args:
+            label: 汇总标题
+            since: 之前的 snapshot()，指定时只统计之后的请求
+        """
+        stats = self.snapshot()
+        if since:
+            stats = {key: value - since.get(key, 0) for key, value in stats.items()}
+        if not stats['requests']:
+            return
+        logger.info(f"{label} - 身份中台请求: {stats['requests']} 次（失败 {stats['errors']}），"
+                    f"新建连接 {stats['connects']} 次（建连 {stats['connect_seconds']:.2f}s），"
+                    f"等待响应 {stats['wait_seconds']:.2f}s，传输 {stats['transfer_seconds']:.2f}s，"
+                    f"接收 {stats['bytes'] / 1024:.0f}KB（gzip {stats['gzip']}/{stats['requests']}）")
+
+
+def install_transport(client, pool_maxsize: Optional[int] = None, connect_timeout: Optional[float] = None,
+                      read_timeout: Optional[float] = None) -> Optional[IDCTransportAdapter]:
+    """
+    在 SDK 客户端的 requests.Session 上挂载 IDCTransportAdapter
+
+    Args:
+        client: CqhyxkClient 实例
+        pool_maxsize: 每个主机的最大连接数，默认读取环境变量 IDC_HTTP_POOL_SIZE
+        connect_timeout: 连接超时（秒），默认读取环境变量 IDC_HTTP_CONNECT_TIMEOUT
+        read_timeout: 读取超时（秒），默认读取环境变量 IDC_HTTP_READ_TIMEOUT
+
+    Returns:
+        挂载的 adapter；客户端没有使用 requests.Session 时返回 None
+    """
+    session = getattr(client, 'session', None)
+    if session is None or not hasattr(session, 'mount'):
+        logger.debug("身份中台客户端没有 requests.Session，不挂载传输层")
+        return None
+    adapter = IDCTransportAdapter(
+        pool_maxsize=pool_maxsize or int(os.getenv('IDC_HTTP_POOL_SIZE', str(DEFAULT_POOL_SIZE))),
+        connect_timeout=connect_timeout or float(os.getenv('IDC_HTTP_CONNECT_TIMEOUT', str(DEFAULT_CONNECT_TIMEOUT))),
+        read_timeout=read_timeout or float(os.getenv('IDC_HTTP_READ_TIMEOUT', str(DEFAULT_READ_TIMEOUT))))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip, deflate'})
+    return adapter
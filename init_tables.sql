@@ -42,6 +42,119 @@ CREATE TABLE IF NOT EXISTS tmp_org_user_relation (
     tenant_id       VARCHAR(64)     DEFAULT '' NOT NULL    -- 租户ID
 );
 
+-- 同步版本号表 (tmp_sync_generation)
+-- 每次同步完成后递增，查询服务据此判断缓存是否需要刷新
+CREATE TABLE IF NOT EXISTS tmp_sync_generation (
+    tenant_id       VARCHAR(64)     NOT NULL PRIMARY KEY,  -- 租户ID
+    generation      BIGINT          DEFAULT 0 NOT NULL,    -- 同步版本号
+    updated_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+-- 同步变更日志表 (tmp_change_log)
+-- 同步过程中每一次新增、更新、软删除都会追加一条记录，下游按 seq 增量读取
+CREATE TABLE IF NOT EXISTS tmp_change_log (
+    seq             BIGSERIAL       NOT NULL PRIMARY KEY,  -- 单调递增的序号
+    tenant_id       VARCHAR(64)     NOT NULL,              -- 租户ID
+    table_name      VARCHAR(64)     NOT NULL,              -- tmp_user/tmp_organization/tmp_org_user_relation
+    operation       VARCHAR(16)     NOT NULL,              -- insert/update/delete/reload
+    record_id       VARCHAR(64)     DEFAULT '' NOT NULL,   -- 记录ID
+    data            JSONB,                                 -- 变更后的字段
+    created_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+-- 分布式获取任务表 (tmp_fetch_job)
+-- distributed_fetch.py 协调者创建，合并发布后状态为 merged；协调者退出后超时未更新的任务标记为 expired
+CREATE TABLE IF NOT EXISTS tmp_fetch_job (
+    job_id          VARCHAR(64)     NOT NULL PRIMARY KEY,
+    tenant_id       VARCHAR(64)     NOT NULL,              -- 租户ID
+    page_size       INTEGER         NOT NULL,              -- 每页大小
+    total_pages     INTEGER         NOT NULL,              -- 总页数
+    status          VARCHAR(16)     DEFAULT 'running' NOT NULL, -- running/merged/failed/expired
+    created_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    updated_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL  -- 协调者等待和工作节点续约时更新
+);
+
+-- 分布式获取工作单元表 (tmp_fetch_unit)
+-- 每个单元为一段页码范围 [page_start, page_end)，工作节点用 SKIP LOCKED 领取
+CREATE TABLE IF NOT EXISTS tmp_fetch_unit (
+    job_id          VARCHAR(64)     NOT NULL,
+    unit_no         INTEGER         NOT NULL,
+    page_start      INTEGER         NOT NULL,
+    page_end        INTEGER         NOT NULL,
+    status          VARCHAR(16)     DEFAULT 'pending' NOT NULL, -- pending/claimed/done/failed
+    worker          VARCHAR(128)    DEFAULT '' NOT NULL,   -- 领取的工作节点（主机名:进程号）
+    attempts        INTEGER         DEFAULT 0 NOT NULL,    -- 已尝试次数
+    error           TEXT,
+    claimed_time    TIMESTAMP,
+    finished_time   TIMESTAMP,
+    PRIMARY KEY (job_id, unit_no)
+);
+
+-- 分布式获取暂存表 (tmp_fetch_staging)
+-- 每个工作单元规范化后的用户/组织/关系行（JSON数组），合并发布后删除
+CREATE TABLE IF NOT EXISTS tmp_fetch_staging (
+    job_id          VARCHAR(64)     NOT NULL,
+    unit_no         INTEGER         NOT NULL,
+    kind            VARCHAR(16)     NOT NULL,              -- users/organizations/relations
+    rows            JSONB           NOT NULL,
+    PRIMARY KEY (job_id, unit_no, kind)
+);
+
+-- 同步状态表 (tmp_sync_state)
+-- 增量获取的高水位：上一次成功同步开始获取数据的时间和上一次全量获取的时间；
+-- 设置时间预算时还记录各阶段的速率和延后到下一次运行的工作
+CREATE TABLE IF NOT EXISTS tmp_sync_state (
+    tenant_id       VARCHAR(64)     NOT NULL PRIMARY KEY,
+    watermark       TIMESTAMP,                             -- 上一次成功同步开始获取数据的时间
+    last_full_time  TIMESTAMP,                             -- 上一次成功全量获取的时间
+    stage_rates     JSONB,                                 -- 各阶段每项耗时（秒）
+    deferred        JSONB,                                 -- 上一次运行延后的工作
+    updated_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+-- 同步运行登记表 (tmp_sync_run)
+-- 每次全量同步获取租户级运行锁后登记，运行期间定期更新心跳，用于跳过重叠的运行和接管挂起的运行
+CREATE TABLE IF NOT EXISTS tmp_sync_run (
+    run_id          VARCHAR(64)     NOT NULL PRIMARY KEY,
+    tenant_id       VARCHAR(64)     NOT NULL,              -- 租户ID
+    status          VARCHAR(16)     DEFAULT 'running' NOT NULL, -- running/succeeded/failed/abandoned
+    host            VARCHAR(128)    DEFAULT '' NOT NULL,   -- 主机名
+    pid             INTEGER         DEFAULT 0 NOT NULL,    -- 进程号
+    backend_pid     INTEGER         DEFAULT 0 NOT NULL,    -- 持有运行锁的数据库连接（pg_backend_pid）
+    started_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    heartbeat_time  TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    finished_time   TIMESTAMP,
+    error           TEXT
+);
+
+-- 表统计历史 (tmp_table_stats_history)
+-- 同步后维护阶段（--maintenance）每次对每张表记录一行：存活元组、死元组、大小以及是否执行了 VACUUM，用于观察膨胀趋势
+CREATE TABLE IF NOT EXISTS tmp_table_stats_history (
+    id              BIGSERIAL       PRIMARY KEY,
+    table_name      VARCHAR(64)     NOT NULL,
+    tenant_id       VARCHAR(64)     DEFAULT '' NOT NULL,   -- 触发维护的租户
+    live_tuples     BIGINT          NOT NULL,              -- ANALYZE 后的存活元组数
+    dead_tuples     BIGINT          NOT NULL,              -- 维护前的死元组数
+    dead_tuples_after BIGINT        NOT NULL,              -- 维护后的死元组数（未 VACUUM 时与维护前相同）
+    table_bytes     BIGINT          NOT NULL,              -- 表和索引的总大小
+    vacuumed        BOOLEAN         DEFAULT FALSE NOT NULL,
+    duration_ms     INTEGER         DEFAULT 0 NOT NULL,
+    created_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+-- 写入隔离表 (tmp_sync_quarantine)
+-- 批量写入失败时通过保存点二分定位的坏行及错误，不影响同一批次中的其他数据；按 CHANGE_LOG_RETENTION_DAYS 清理
+CREATE TABLE IF NOT EXISTS tmp_sync_quarantine (
+    id              BIGSERIAL       PRIMARY KEY,
+    tenant_id       VARCHAR(64)     NOT NULL,              -- 租户ID
+    table_name      VARCHAR(64)     NOT NULL,              -- 写入的目标表
+    record_key      VARCHAR(256)    DEFAULT '' NOT NULL,   -- user_name / org_code
+    row_data        JSONB           NOT NULL,              -- 写入失败的行
+    error           TEXT            NOT NULL,              -- 数据库返回的错误
+    sqlstate        VARCHAR(5)      DEFAULT '' NOT NULL,   -- 错误码（如 22001 超长、23505 唯一冲突）
+    created_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
 -- 创建索引以提高查询性能
 CREATE INDEX IF NOT EXISTS idx_tmp_user_tenant_id ON tmp_user(tenant_id);
 CREATE INDEX IF NOT EXISTS idx_tmp_user_status ON tmp_user(status);
@@ -55,6 +168,17 @@ CREATE INDEX IF NOT EXISTS idx_tmp_relation_org_id ON tmp_org_user_relation(org_
 CREATE INDEX IF NOT EXISTS idx_tmp_relation_user_id ON tmp_org_user_relation(user_id);
 CREATE INDEX IF NOT EXISTS idx_tmp_relation_tenant_id ON tmp_org_user_relation(tenant_id);
 
+CREATE INDEX IF NOT EXISTS idx_tmp_change_log_tenant_seq ON tmp_change_log(tenant_id, seq);
+CREATE INDEX IF NOT EXISTS idx_tmp_change_log_created_time ON tmp_change_log(created_time);
+
+CREATE INDEX IF NOT EXISTS idx_tmp_sync_run_tenant ON tmp_sync_run(tenant_id, started_time);
+
+CREATE INDEX IF NOT EXISTS idx_tmp_sync_quarantine_tenant ON tmp_sync_quarantine(tenant_id, created_time);
+
+CREATE INDEX IF NOT EXISTS idx_tmp_table_stats_history_time ON tmp_table_stats_history(created_time, table_name);
+
+CREATE INDEX IF NOT EXISTS idx_tmp_fetch_unit_status ON tmp_fetch_unit(status) WHERE status IN ('pending', 'claimed');
+
 -- 显示创建结果
 SELECT '临时表创建完成！' AS message;
 SELECT COUNT(*) AS tmp_user_count FROM tmp_user;
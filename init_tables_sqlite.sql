@@ -0,0 +1,58 @@
+-- 创建临时表脚本
+-- 数据库：SQLite（本地运行和测试使用，TMP_DB_BACKEND=sqlite 时自动执行）
+-- 表结构与 init_tables.sql 保持一致
+
+CREATE TABLE IF NOT EXISTS tmp_user (
+    id              VARCHAR(64)     NOT NULL PRIMARY KEY,
+    created_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    updated_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    tenant_id       VARCHAR(64)     DEFAULT '0' NOT NULL,
+    user_name       VARCHAR(128)    DEFAULT '' NOT NULL,
+    description     VARCHAR(255)    DEFAULT '' NOT NULL,
+    display_name    VARCHAR(255)    DEFAULT '' NOT NULL,
+    email           VARCHAR(256)    DEFAULT '' NOT NULL,
+    mobile          VARCHAR(256)    DEFAULT '' NOT NULL,
+    source          VARCHAR(16)     DEFAULT 'CAS' NOT NULL,
+    status          SMALLINT        DEFAULT 1 NOT NULL,
+    is_deleted      SMALLINT        DEFAULT 0 NOT NULL,
+    CONSTRAINT uk_tenant_id_user_name UNIQUE (tenant_id, user_name)
+);
+
+CREATE TABLE IF NOT EXISTS tmp_organization (
+    id              VARCHAR(64)     NOT NULL PRIMARY KEY,
+    created_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    updated_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    name            VARCHAR(128)    DEFAULT '' NOT NULL,
+    org_code        VARCHAR(128)    DEFAULT '' NOT NULL,
+    tenant_id       VARCHAR(64)     DEFAULT '' NOT NULL,
+    pid             VARCHAR(64)     DEFAULT '' NOT NULL,
+    is_deleted      SMALLINT        DEFAULT 0 NOT NULL,
+    CONSTRAINT uk_tenant_id_org_code UNIQUE (tenant_id, org_code)
+);
+
+CREATE TABLE IF NOT EXISTS tmp_org_user_relation (
+    id              VARCHAR(64)     NOT NULL PRIMARY KEY,
+    created_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    updated_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    org_id          VARCHAR(64)     NOT NULL,
+    user_id         VARCHAR(64)     DEFAULT '' NOT NULL,
+    tenant_id       VARCHAR(64)     DEFAULT '' NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tmp_change_log (
+    seq             INTEGER         PRIMARY KEY AUTOINCREMENT,
+    tenant_id       VARCHAR(64)     NOT NULL,
+    table_name      VARCHAR(64)     NOT NULL,
+    operation       VARCHAR(16)     NOT NULL,
+    record_id       VARCHAR(64)     DEFAULT '' NOT NULL,
+    data            TEXT,                                  -- JSON
+    created_time    TIMESTAMP       DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_tmp_user_tenant_id ON tmp_user(tenant_id);
+CREATE INDEX IF NOT EXISTS idx_tmp_org_tenant_id ON tmp_organization(tenant_id);
+CREATE INDEX IF NOT EXISTS idx_tmp_org_pid ON tmp_organization(pid);
+CREATE INDEX IF NOT EXISTS idx_tmp_relation_org_id ON tmp_org_user_relation(org_id);
+CREATE INDEX IF NOT EXISTS idx_tmp_relation_tenant_user ON tmp_org_user_relation(tenant_id, user_id, org_id);
+CREATE INDEX IF NOT EXISTS idx_tmp_change_log_tenant_seq ON tmp_change_log(tenant_id, seq);
+CREATE INDEX IF NOT EXISTS idx_tmp_change_log_created_time ON tmp_change_log(created_time);
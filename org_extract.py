@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+从用户身份信息中提取组织及用户-组织关系
+
+用户量较大时将用户列表分片，交给进程池并行提取，再按分片顺序合并各进程的组织和关系集合。
+在支持 fork 的平台上子进程直接读取继承的用户列表，只传递分片范围，避免序列化SDK对象。
+"""
+
+import os
+import logging
+import multiprocessing
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from idc_records import get_attr, get_user_id
+from sync_logging import ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+
+# 用户数达到该值时才启用进程池，数据量小时进程启动和序列化的开销大于收益
+PARALLEL_THRESHOLD = 20000
+
+# 每个分片的用户数
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _org_fields(org) -> Tuple[str, str]:
+    """获取组织ID和名称（orgList内字段：orgId（组织编码）、orgName（组织名称）、sourceOrgId（组织原编码））"""
+    org_id = str(get_attr(org, 'orgId') or get_attr(org, 'sourceOrgId') or '')
+    org_name = str(get_attr(org, 'orgName') or '')
+    return org_id, org_name
+
+
+def _extract_chunk(users: Sequence) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """
+    提取一个分片内的组织和关系
+
+    Returns:
+        (按首次出现顺序排列的 (org_id, org_name) 列表, (user_id, org_id) 关系列表)
+    """
+    debug = logger.isEnabledFor(logging.DEBUG)
+    orgs = []
+    org_seen = set()
+    relations = []
+    relation_seen = set()
+
+    for user in users:
+        user_id = get_user_id(user)
+        candidates = []
+
+        # 主组织（mainOrg是MainOrgInfo对象）
+        main_org = get_attr(user, 'mainOrg')
+        if main_org:
+            candidates.append(main_org)
+        elif debug:
+            logger.debug("用户 %s 没有主组织信息", get_attr(user, 'sourceUserId'))
+
+        # orgList中的所有组织（orgList是OrgInfo对象列表）
+        org_list = get_attr(user, 'orgList') or []
+        if isinstance(org_list, list) and org_list:
+            candidates.extend(org_list)
+        elif debug:
+            logger.debug("用户 %s 的orgList为空或不是列表", get_attr(user, 'sourceUserId'))
+
+        for org in candidates:
+            org_id, org_name = _org_fields(org)
+            if not org_id:
+                continue
+            org_key = (org_id, org_name)
+            if org_key not in org_seen:
+                org_seen.add(org_key)
+                orgs.append(org_key)
+                if debug:
+                    logger.debug("添加组织: %s - %s", org_id, org_name)
+            if user_id:
+                relation_key = (user_id, org_id)
+                if relation_key not in relation_seen:
+                    relation_seen.add(relation_key)
+                    relations.append(relation_key)
+
+    return orgs, relations
+
+
+# fork 前设置，子进程通过继承的内存直接访问用户列表
+_shared_users = None
+
+
+def _extract_range(bounds: Tuple[int, int]):
+    """在子进程中提取共享用户列表中 [start, end) 范围内的组织和关系"""
+    start, end = bounds
+    return _extract_chunk(_shared_users[start:end])
+
+
+def _resolve_workers(workers: Optional[int], user_count: int) -> int:
+    """确定实际使用的进程数，0 或 None 表示根据CPU核数和数据量自动选择"""
+    if workers is None or workers <= 0:
+        if user_count < PARALLEL_THRESHOLD:
+            return 1
+        workers = os.cpu_count() or 1
+    return max(1, workers)
+
+
+def extract_organizations(users: Sequence, workers: Optional[int] = None,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[List[Dict], List[Tuple[str, str]]]:
+    """
+    从用户列表中提取组织和用户-组织关系
+
+    Args:
+        users: 用户列表（IdentityInfo对象或字典）
+        workers: 进程数，1 表示串行，0/None 表示自动
+        chunk_size: 每个分片的用户数
+
+    Returns:
+        (组织字典列表, (user_id, org_id) 关系列表)，组织按 (org_id, org_name) 去重并保持首次出现的顺序
+    """
+    global _shared_users
+
+    workers = _resolve_workers(workers, len(users))
+    bounds = [(i, min(i + chunk_size, len(users))) for i in range(0, len(users), chunk_size)]
+
+    if workers > 1 and len(bounds) > 1:
+        logger.info(f"使用 {workers} 个进程并行提取组织信息（{len(bounds)} 个分片）...")
+        if 'fork' in multiprocessing.get_all_start_methods():
+            _shared_users = users
+            try:
+                with multiprocessing.get_context('fork').Pool(processes=min(workers, len(bounds))) as pool:
+                    return _merge(pool.imap(_extract_range, bounds), len(users), chunk_size)
+            finally:
+                _shared_users = None
+        chunks = [users[start:end] for start, end in bounds]
+        with multiprocessing.Pool(processes=min(workers, len(chunks))) as pool:
+            return _merge(pool.imap(_extract_chunk, chunks), len(users), chunk_size)
+    return _merge((_extract_chunk(users[start:end]) for start, end in bounds), len(users), chunk_size)
+
+
+def _merge(results, user_count: int, chunk_size: int) -> Tuple[List[Dict], List[Tuple[str, str]]]:
+    """按分片顺序合并各分片的组织和关系"""
+    organizations = []
+    org_seen = set()
+    relations = []
+    relation_seen = set()
+    progress = ProgressReporter("提取组织", logger, total=user_count)
+
+    for chunk_orgs, chunk_relations in results:
+        for org_key in chunk_orgs:
+            if org_key not in org_seen:
+                org_seen.add(org_key)
+                org_id, org_name = org_key
+                organizations.append({
+                    'id': org_id,
+                    'name': org_name or org_id,  # 确保orgName被正确存储到name字段
+                    'orgName': org_name,  # 同时保存原始orgName
+                    'org_code': org_id,
+                    'pid': ''  # 父组织ID需要从组织架构接口获取
+                })
+        for relation_key in chunk_relations:
+            if relation_key not in relation_seen:
+                relation_seen.add(relation_key)
+                relations.append(relation_key)
+        progress.update(min(chunk_size, user_count - progress.count), lambda: f"提取到 {len(organizations)} 个组织")
+
+    return organizations, relations
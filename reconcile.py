@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分桶摘要对账（身份中台 vs 临时表）
+
+确认临时表与身份中台是否一致时不需要重写数据，也不需要把整张表读到客户端：
+
+1. 按记录键（用户ID、组织ID、关系的用户ID）的 md5 把两侧的规范化记录分到 N 个桶
+2. 每个桶的摘要为 (记录数, 记录哈希之和)，与记录顺序无关；临时表一侧在 SQL 中用
+   GROUP BY + SUM 聚合计算，只返回 N 行
+3. 只读取摘要不同的桶中的记录，逐条比较得到缺失、多余和字段不同的记录
+
+记录的规范化与哈希在 SQL 和 Python 中完全一致：字段以 \\x1f 连接后取 md5，
+桶号取 md5 前8位十六进制对 N 取模，记录哈希取 md5 前15位十六进制（60位，求和不会溢出）。
+"""
+
+import time
+import hashlib
+import logging
+from typing import Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 默认桶数
+DEFAULT_BUCKETS = 256
+
+# 记录字段的分隔符（与 SQL 中的 E'\x1f' 一致）
+FIELD_SEPARATOR = '\x1f'
+
+# 每张表的 (记录字段, 临时表一侧的记录查询, 记录键的字段数)，第一个字段为分桶键
+# 用户和组织只比较未删除的数据，description 等同步不更新的字段不参与比较
+_RECONCILE_VIEWS = {
+    'tmp_user': (
+        ('id', 'user_name', 'display_name', 'email', 'mobile', 'status'),
+        "SELECT id, user_name, display_name, email, mobile, status::TEXT AS status FROM tmp_user "
+        "WHERE tenant_id = %(tenant_id)s AND is_deleted = 0",
+        1,
+    ),
+    'tmp_organization': (
+        ('id', 'name', 'org_code', 'pid'),
+        "SELECT id, name, org_code, pid FROM tmp_organization WHERE tenant_id = %(tenant_id)s AND is_deleted = 0",
+        1,
+    ),
+    'tmp_org_user_relation': (
+        ('user_id', 'org_id'),
+        "SELECT DISTINCT user_id, org_id FROM tmp_org_user_relation WHERE tenant_id = %(tenant_id)s",
+        2,
+    ),
+}
+
+# 与 bucket_of 一致的桶号表达式
+_BUCKET_SQL = "('x' || substr(md5({key}), 1, 8))::bit(32)::bigint %% %(buckets)s"
+
+# 与 record_hash 一致的记录哈希表达式
+_HASH_SQL = "('x' || lpad(substr(md5(concat_ws(E'\\x1f', {fields})), 1, 15), 16, '0'))::bit(64)::bigint"
+
+
+def bucket_of(key: str, buckets: int) -> int:
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16) % buckets
+
+
+def record_hash(record: Sequence[str]) -> int:
+    return int(hashlib.md5(FIELD_SEPARATOR.join(record).encode('utf-8')).hexdigest()[:15], 16)
+
+
+def canonical(row: Sequence) -> Tuple[str, ...]:
+    """规范化记录：None 视为空字符串，其他值转为字符串（与临时表的 NOT NULL DEFAULT '' 一致）"""
+    return tuple('' if value is None else str(value) for value in row)
+
+
+def bucket_digests(records: Sequence[Tuple[str, ...]], buckets: int) -> Dict[int, Tuple[int, int]]:
+    """身份中台一侧的各桶摘要 {桶号: (记录数, 哈希之和)}"""
+    digests: Dict[int, List[int]] = {}
+    for record in records:
+        digest = digests.setdefault(bucket_of(record[0], buckets), [0, 0])
+        digest[0] += 1
+        digest[1] += record_hash(record)
+    return {bucket: (count, total) for bucket, (count, total) in digests.items()}
+
+
+def snapshot_records(snapshot: Dict[str, List[Tuple]]) -> Dict[str, List[Tuple[str, ...]]]:
+    """将 idc_records.build_snapshot 的快照转换为各表的规范化记录"""
+    return {
+        'tmp_user': [canonical(row) for row in snapshot['users']],
+        'tmp_organization': [canonical(row) for row in snapshot['organizations']],
+        'tmp_org_user_relation': list({(user_id, org_id) for _, org_id, user_id in snapshot['relations']}),
+    }
+
+
+class Reconciler:
+    """比较身份中台快照与临时表的分桶摘要，只深入摘要不同的桶"""
+
+    def __init__(self, get_connection: Callable, tenant_id: str, buckets: int = DEFAULT_BUCKETS,
+                 sample_size: int = 10):
+        """
+        Args:
+            get_connection: 获取数据库连接的函数
+            tenant_id: 租户ID
+            buckets: 桶数
+            sample_size: 每类差异保留的示例数量
+        """
+        if buckets <= 0:
+            raise ValueError(f"桶数必须大于0: {buckets}")
+        self.get_connection = get_connection
+        self.tenant_id = tenant_id
+        self.buckets = buckets
+        self.sample_size = sample_size
+        # 表 -> {'missing': [记录], 'extra': [记录], 'changed': [(身份中台记录, 临时表记录)]}，供修复使用
+        self.differences: Dict[str, Dict[str, List]] = {}
+
+    def _db_digests(self, cur, table: str) -> Dict[int, Tuple[int, int]]:
+        fields, source, _ = _RECONCILE_VIEWS[table]
+        cur.execute(f"""
+            SELECT {_BUCKET_SQL.format(key=fields[0])} AS bucket, COUNT(*), SUM({_HASH_SQL.format(fields=', '.join(fields))})
+            FROM ({source}) AS r
+            GROUP BY bucket
+        """, {'tenant_id': self.tenant_id, 'buckets': self.buckets})
+        return {bucket: (count, int(total)) for bucket, count, total in cur.fetchall()}
+
+    def _db_records(self, cur, table: str, buckets: List[int]) -> List[Tuple[str, ...]]:
+        fields, source, _ = _RECONCILE_VIEWS[table]
+        cur.execute(f"""
+            SELECT * FROM ({source}) AS r
+            WHERE {_BUCKET_SQL.format(key=fields[0])} = ANY(%(mismatched)s)
+        """, {'tenant_id': self.tenant_id, 'buckets': self.buckets, 'mismatched': buckets})
+        return [canonical(row) for row in cur.fetchall()]
+
+    def compare(self, records: Dict[str, List[Tuple[str, ...]]]) -> Dict[str, Dict]:
+        """
+        对账
+
+        Args:
+            records: snapshot_records() 返回的各表规范化记录
+
+        Returns:
+            {表名: {'records', 'mismatched_buckets', 'missing', 'extra', 'changed', 'samples'}}
+        """
+        start = time.time()
+        report = {}
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            for table, (fields, _, key_length) in _RECONCILE_VIEWS.items():
+                idc_records = records[table]
+                idc_digests = bucket_digests(idc_records, self.buckets)
+                db_digests = self._db_digests(cur, table)
+                mismatched = sorted(bucket for bucket in set(idc_digests) | set(db_digests)
+                                    if idc_digests.get(bucket) != db_digests.get(bucket))
+
+                differences = {'missing': [], 'extra': [], 'changed': []}
+                if mismatched:
+                    wanted = set(mismatched)
+                    idc_map = {record[:key_length]: record for record in idc_records
+                               if bucket_of(record[0], self.buckets) in wanted}
+                    db_map = {record[:key_length]: record for record in self._db_records(cur, table, mismatched)}
+                    for key, record in idc_map.items():
+                        existing = db_map.get(key)
+                        if existing is None:
+                            differences['missing'].append(record)
+                        elif existing != record:
+                            differences['changed'].append((record, existing))
+                    differences['extra'] = [record for key, record in db_map.items() if key not in idc_map]
+                self.differences[table] = differences
+
+                report[table] = {
+                    'records': len(idc_records),
+                    'mismatched_buckets': len(mismatched),
+                    'missing': len(differences['missing']),
+                    'extra': len(differences['extra']),
+                    'changed': len(differences['changed']),
+                    'samples': self._samples(fields, differences),
+                }
+            cur.close()
+        finally:
+            conn.rollback()
+            conn.close()
+
+        logger.info(f"对账完成（{self.buckets} 个桶），耗时 {time.time() - start:.2f}s")
+        return report
+
+    def _samples(self, fields: Sequence[str], differences: Dict[str, List]) -> Dict[str, List[Dict]]:
+        samples = {
+            'missing': [dict(zip(fields, record)) for record in differences['missing'][:self.sample_size]],
+            'extra': [dict(zip(fields, record)) for record in differences['extra'][:self.sample_size]],
+            'changed': [],
+        }
+        for record, existing in differences['changed'][:self.sample_size]:
+            changed = {field: [old, new] for field, new, old in zip(fields, record, existing) if new != old}
+            samples['changed'].append({fields[0]: record[0], 'fields': changed})
+        return samples
+
+
+def is_consistent(report: Dict[str, Dict]) -> bool:
+    return not any(detail['mismatched_buckets'] for detail in report.values())
+
+
+def log_reconcile_report(report: Dict[str, Dict]):
+    """将对账结果输出到日志"""
+    logger.info("=" * 50)
+    logger.info("对账结果" + ("：临时表与身份中台一致" if is_consistent(report) else "：发现差异"))
+    logger.info("=" * 50)
+    for table, detail in report.items():
+        logger.info(f"{table} - 记录 {detail['records']}, 差异桶 {detail['mismatched_buckets']}, "
+                    f"缺失 {detail['missing']}, 多余 {detail['extra']}, 不同 {detail['changed']}")
+        for kind, samples in detail['samples'].items():
+            for sample in samples:
+                logger.info(f"  [{kind}] {sample}")
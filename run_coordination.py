@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+同步运行协调（同一租户同一时间只允许一个全量同步）
+
+定时任务的执行时间超过调度间隔时，后启动的同步会与仍在运行的同步交替写入、删除关系和标记删除，
+并使身份中台和数据库的负载翻倍。RunCoordinator 在一个专用连接上持有租户级的会话咨询锁
+（pg_try_advisory_lock），并在 tmp_sync_run 表中登记运行状态和心跳：
+
+- 获取锁失败时按 on_conflict 处理：exit 立即跳过；wait 等待当前运行结束，
+  等待期间如果有在本次请求之后开始的运行已成功完成，则直接跳过（合并为一次运行）
+- 进程退出或崩溃时连接断开，PostgreSQL 自动释放锁
+- 持有锁的进程挂起（心跳超过 stale_seconds 未更新）时，终止其锁连接后接管；
+  被接管的进程心跳失败后将锁标记为丢失，在标记删除和发布前停止
+"""
+
+import os
+import socket
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# 会话咨询锁的第一个键（第二个键为 hashtext(tenant_id)）
+RUN_LOCK_CLASS = 0x6869_7379  # "hisy"
+
+ON_CONFLICT_MODES = ('exit', 'wait')
+
+# 心跳间隔（秒）
+DEFAULT_HEARTBEAT_SECONDS = 30
+
+# 心跳超过该时间未更新的运行视为已挂起，可以被接管（秒）
+DEFAULT_STALE_SECONDS = 600
+
+
+class RunLockLost(Exception):
+    """运行锁已丢失（连接断开或被其他运行接管）"""
+
+
+class RunCoordinator:
+    """
+    用法：
+        with RunCoordinator(get_connection, tenant_id, on_conflict='wait') as run:
+            if run.acquired:
+                sync.run()
+    """
+
+    def __init__(self, get_connection: Callable, tenant_id: str, on_conflict: str = 'exit',
+                 wait_timeout_seconds: float = 3600, heartbeat_seconds: float = DEFAULT_HEARTBEAT_SECONDS,
+                 stale_seconds: float = DEFAULT_STALE_SECONDS, poll_seconds: float = 5):
+        """
+        Args:
+            get_connection: 获取数据库连接的函数
+            tenant_id: 租户ID
+            on_conflict: 已有同步在运行时的处理方式（exit/wait）
+            wait_timeout_seconds: wait 模式下的最长等待时间（秒）
+            heartbeat_seconds: 心跳间隔（秒）
+            stale_seconds: 心跳超过该时间未更新的运行可以被接管（秒）
+            poll_seconds: wait 模式下重试获取锁的间隔（秒）
+        """
+        if on_conflict not in ON_CONFLICT_MODES:
+            raise ValueError(f"不支持的冲突处理方式: {on_conflict}，可选值: {', '.join(ON_CONFLICT_MODES)}")
+        self.get_connection = get_connection
+        self.tenant_id = tenant_id
+        self.on_conflict = on_conflict
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.poll_seconds = poll_seconds
+
+        self.run_id = str(uuid.uuid4())
+        self.acquired = False
+        self.lost = False
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+        self._has_registry = False
+
+    def _execute(self, query: str, params=()):
+        with self._conn_lock:
+            with self._conn.cursor() as cur:
+                cur.execute(query, params)
+                return cur.fetchall() if cur.description else None
+
+    def _try_lock(self) -> bool:
+        return self._execute("SELECT pg_try_advisory_lock(%s, hashtext(%s))", (RUN_LOCK_CLASS, self.tenant_id))[0][0]
+
+    def _take_over_stale(self) -> bool:
+        """
+        心跳已过期的运行仍持有锁时，终止其锁连接
+
+        只有登记表中该运行的锁连接确实是当前锁的持有者时才终止，避免误杀其他会话
+
+        Returns:
+            是否终止了过期的运行
+        """
+        if not self._has_registry:
+            return False
+        rows = self._execute("""
+            SELECT r.run_id, r.host, r.pid, l.pid
+            FROM tmp_sync_run r
+            JOIN pg_locks l ON l.locktype = 'advisory' AND l.granted AND l.objsubid = 2
+                           AND l.classid = %s AND l.objid::bigint = (hashtext(%s)::bigint & 4294967295)
+                           AND l.pid = r.backend_pid
+            WHERE r.tenant_id = %s AND r.status = 'running'
+              AND r.heartbeat_time < NOW() - make_interval(secs => %s)
+            ORDER BY r.started_time DESC
+            LIMIT 1
+        """, (RUN_LOCK_CLASS, self.tenant_id, self.tenant_id, self.stale_seconds))
+        if not rows:
+            return False
+        run_id, host, pid, backend_pid = rows[0]
+        logger.warning(f"同步运行 {run_id}（{host}:{pid}）心跳超过 {self.stale_seconds:.0f} 秒未更新，终止其锁连接并接管")
+        self._execute("SELECT pg_terminate_backend(%s)", (backend_pid,))
+        self._execute("UPDATE tmp_sync_run SET status = 'abandoned', finished_time = NOW(), "
+                      "error = '心跳超时，已被其他运行接管' WHERE run_id = %s AND status = 'running'", (run_id,))
+        return True
+
+    def _coalesced_since(self, requested_at) -> bool:
+        """等待期间是否有在本次请求之后开始的运行已成功完成"""
+        if not self._has_registry:
+            return False
+        rows = self._execute("SELECT run_id FROM tmp_sync_run WHERE tenant_id = %s AND status = 'succeeded' "
+                             "AND started_time >= %s LIMIT 1", (self.tenant_id, requested_at))
+        return bool(rows)
+
+    def acquire(self) -> bool:
+        """
+        获取运行锁并登记本次运行
+
+        Returns:
+            是否获取成功，已有同步在运行（exit 模式）、等待超时或已被合并时返回 False
+        """
+        self._conn = self.get_connection()
+        self._conn.autocommit = True
+        self._has_registry = self._execute("SELECT to_regclass('tmp_sync_run') IS NOT NULL")[0][0]
+        requested_at = self._execute("SELECT NOW()")[0][0]
+        deadline = time.monotonic() + self.wait_timeout_seconds
+        waited = False
+
+        while not self._try_lock():
+            if self._take_over_stale():
+                # 被终止的连接释放锁需要一点时间
+                time.sleep(1)
+                continue
+            if self.on_conflict == 'exit':
+                logger.warning(f"租户 {self.tenant_id} 已有同步在运行，本次跳过")
+                self._close()
+                return False
+            if time.monotonic() > deadline:
+                logger.warning(f"等待租户 {self.tenant_id} 当前的同步结束超时（{self.wait_timeout_seconds:.0f} 秒），本次跳过")
+                self._close()
+                return False
+            if not waited:
+                logger.info(f"租户 {self.tenant_id} 已有同步在运行，等待其结束...")
+                waited = True
+            time.sleep(self.poll_seconds)
+
+        if waited and self._coalesced_since(requested_at):
+            logger.info("等待期间已有新的同步成功完成，本次跳过")
+            self._execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", (RUN_LOCK_CLASS, self.tenant_id))
+            self._close()
+            return False
+
+        if self._has_registry:
+            # 持有锁时登记表中其他 running 的记录都来自已退出的进程
+            self._execute("UPDATE tmp_sync_run SET status = 'abandoned', finished_time = NOW(), "
+                          "error = '进程已退出' WHERE tenant_id = %s AND status = 'running'", (self.tenant_id,))
+            self._execute("""
+                INSERT INTO tmp_sync_run (run_id, tenant_id, status, host, pid, backend_pid)
+                VALUES (%s, %s, 'running', %s, %s, pg_backend_pid())
+            """, (self.run_id, self.tenant_id, socket.gethostname(), os.getpid()))
+        self.acquired = True
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, name='sync-run-heartbeat', daemon=True)
+        self._heartbeat_thread.start()
+        logger.info(f"已获取同步运行锁（运行ID: {self.run_id}）")
+        return True
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                if self._has_registry:
+                    self._execute("UPDATE tmp_sync_run SET heartbeat_time = NOW() WHERE run_id = %s", (self.run_id,))
+                else:
+                    self._execute("SELECT 1")
+            except Exception as e:
+                self.lost = True
+                logger.error(f"同步运行锁连接已断开，停止后续发布: {e}")
+                return
+
+    def ensure_held(self):
+        """在标记删除、发布等不可撤销的步骤前调用，锁已丢失时抛出 RunLockLost"""
+        if self.lost:
+            raise RunLockLost("同步运行锁已丢失（连接断开或已被其他运行接管），停止后续写入")
+
+    def release(self, status: str = 'succeeded', error: Optional[str] = None):
+        """结束本次运行：更新登记状态并释放锁"""
+        if not self.acquired:
+            return
+        self._stop.set()
+        if self._heartbeat_thread:
+            self._heartbeat_thread.join()
+        try:
+            if self._has_registry and not self.lost:
+                self._execute("UPDATE tmp_sync_run SET status = %s, finished_time = NOW(), heartbeat_time = NOW(), "
+                              "error = %s WHERE run_id = %s", (status, error[:1000] if error else None, self.run_id))
+            self._execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", (RUN_LOCK_CLASS, self.tenant_id))
+        except Exception as e:
+            logger.warning(f"释放同步运行锁失败（连接关闭后自动释放）: {e}")
+        finally:
+            self.acquired = False
+            self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.release('succeeded')
+        else:
+            self.release('failed', f"{exc_type.__name__}: {exc}")
+        return False
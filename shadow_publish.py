@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+影子表发布模式
+
+将本次同步的完整快照批量加载到影子表（加载完成后再建索引），
+然后通过重命名把影子表切换为正式临时表。
+iam-adapter 读取时只会看到切换前或切换后的完整数据，不会读到同步中途的状态。
+
+影子表中包含从正式表复制的其他租户数据，从复制开始到切换完成在同一个事务中持有三张正式表的
+SHARE ROW EXCLUSIVE 锁：读请求不受影响，其他租户的同步、事件写入等写操作会等待到切换完成后
+写入新表，不会在复制之后提交而随旧表一起被删除。
+"""
+
+import re
+import time
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from db_utils import copy_rows, create_snapshot_tables
+
+logger = logging.getLogger(__name__)
+
+
+# 参与切换的临时表
+PUBLISH_TABLES = ('tmp_user', 'tmp_organization', 'tmp_org_user_relation')
+
+# 切换时重试使用的保存点
+_SWAP_SAVEPOINT = 'shadow_swap'
+
+SHADOW_SUFFIX = '__shadow'
+
+_INDEX_DEF_PATTERN = re.compile(r'^(CREATE (?:UNIQUE )?INDEX )(\S+)( ON )(?:ONLY )?(\S+)( .*)$')
+
+
+class ShadowTablePublisher:
+    """影子表加载与原子切换"""
+
+    def __init__(self, get_connection: Callable, tenant_id: str,
+                 lock_timeout_ms: int = 5000, swap_retries: int = 5):
+        """
+        Args:
+            get_connection: 获取数据库连接的函数
+            tenant_id: 租户ID，影子表中只替换该租户的数据，其他租户数据原样保留
+            lock_timeout_ms: 锁定正式表和切换时等待表锁的超时时间，超时后重试，避免长时间阻塞读写请求
+            swap_retries: 锁定或切换失败（锁超时）时的重试次数
+        """
+        self.get_connection = get_connection
+        self.tenant_id = tenant_id
+        self.lock_timeout_ms = lock_timeout_ms
+        self.swap_retries = swap_retries
+
+    def publish(self, snapshot: Dict[str, List[Tuple]]) -> Dict[str, int]:
+        """
+        发布快照
+
+        Args:
+            snapshot: idc_records.build_snapshot 构建的快照
+
+        Returns:
+            各影子表写入的行数
+        """
+        if not snapshot.get('users'):
+            raise Exception("快照中没有用户数据，拒绝发布（否则会将全部用户标记为删除）")
+
+        conn = self.get_connection()
+        try:
+            indexes = {table: self._get_index_defs(conn, table) for table in PUBLISH_TABLES}
+            grants = {table: self._get_table_grants(conn, table) for table in PUBLISH_TABLES}
+
+            self._drop_shadow_tables(conn)
+            # 以下在同一个事务中完成，直到切换提交才释放正式表的锁
+            self._lock_source_tables(conn)
+
+            logger.info("开始加载影子表（期间对正式表的写入会等待）...")
+            start = time.time()
+            counts = self._load_shadow_tables(conn, snapshot)
+            logger.info(f"影子表加载完成，耗时 {time.time() - start:.2f}s: {counts}")
+
+            start = time.time()
+            self._build_shadow_indexes(conn, indexes, grants)
+            logger.info(f"影子表索引创建完成，耗时 {time.time() - start:.2f}s")
+
+            self._swap(conn, indexes)
+            logger.info("影子表已切换为正式表")
+            return counts
+        except Exception:
+            conn.rollback()
+            self._drop_shadow_tables(conn)
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _shadow(table: str) -> str:
+        return f"{table}{SHADOW_SUFFIX}"
+
+    def _get_index_defs(self, conn, table: str) -> List[Tuple[str, str, str]]:
+        """读取正式表上的索引定义，返回 (索引名, 索引定义, 约束类型)"""
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT i.relname, pg_get_indexdef(i.oid), c.contype
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            LEFT JOIN pg_constraint c ON c.conindid = x.indexrelid AND c.conrelid = x.indrelid
+            WHERE x.indrelid = %s::regclass
+            ORDER BY c.contype NULLS LAST, i.relname
+        """, (table,))
+        rows = cur.fetchall()
+        cur.close()
+        conn.commit()
+        return rows
+
+    def _get_table_grants(self, conn, table: str) -> List[Tuple[str, str]]:
+        """读取正式表上授予其他角色的权限，切换后需要在新表上保留"""
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT grantee, privilege_type
+            FROM information_schema.role_table_grants
+            WHERE table_schema = current_schema() AND table_name = %s
+              AND grantee <> current_user
+        """, (table,))
+        rows = cur.fetchall()
+        cur.close()
+        conn.commit()
+        return rows
+
+    def _drop_shadow_tables(self, conn):
+        """清理上次未完成发布遗留的影子表"""
+        try:
+            cur = conn.cursor()
+            for table in PUBLISH_TABLES:
+                cur.execute(f"DROP TABLE IF EXISTS {self._shadow(table)}")
+            conn.commit()
+            cur.close()
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"清理影子表失败: {e}")
+
+    def _lock_source_tables(self, conn):
+        """锁定正式表，阻止其他写入直到切换提交（读不受影响），锁等待超时时重试"""
+        for attempt in range(1, self.swap_retries + 1):
+            cur = conn.cursor()
+            try:
+                cur.execute(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}")
+                cur.execute(f"LOCK TABLE {', '.join(PUBLISH_TABLES)} IN SHARE ROW EXCLUSIVE MODE")
+                cur.execute("SET LOCAL lock_timeout TO DEFAULT")
+                return
+            except Exception as e:
+                conn.rollback()
+                if getattr(e, 'pgcode', None) != '55P03' or attempt == self.swap_retries:  # lock_not_available
+                    raise
+                logger.warning(f"锁定正式表时等待超时（有写入事务未结束），第 {attempt} 次重试...")
+                time.sleep(min(2 ** attempt, 30))
+            finally:
+                cur.close()
+
+    def _load_shadow_tables(self, conn, snapshot: Dict[str, List[Tuple]]) -> Dict[str, int]:
+        """创建不带索引的影子表并写入完整数据（其他租户数据 + 本租户快照 + 本租户已删除数据），不提交"""
+        cur = conn.cursor()
+        for table in PUBLISH_TABLES:
+            cur.execute(f"CREATE TABLE {self._shadow(table)} (LIKE {table} INCLUDING DEFAULTS)")
+
+        # 快照先写入会话临时表，再与正式表关联生成影子表数据
+        create_snapshot_tables(cur, snapshot)
+
+        shadow_user = self._shadow('tmp_user')
+        cur.execute(f"INSERT INTO {shadow_user} SELECT * FROM tmp_user WHERE tenant_id <> %s", (self.tenant_id,))
+        cur.execute(f"""
+            INSERT INTO {shadow_user}
+                (id, created_time, updated_time, tenant_id, user_name, description, display_name,
+                 email, mobile, source, status, is_deleted)
+            SELECT s.id, COALESCE(t.created_time, NOW()), NOW(), %s, s.user_name, '', s.display_name,
+                   s.email, s.mobile, 'CAS', s.status, 0
+            FROM _snapshot_user s
+            LEFT JOIN tmp_user t ON t.tenant_id = %s AND t.user_name = s.user_name
+        """, (self.tenant_id, self.tenant_id))
+        cur.execute(f"""
+            INSERT INTO {shadow_user}
+                (id, created_time, updated_time, tenant_id, user_name, description, display_name,
+                 email, mobile, source, status, is_deleted)
+            SELECT t.id, t.created_time, CASE WHEN t.is_deleted = 1 THEN t.updated_time ELSE NOW() END,
+                   t.tenant_id, t.user_name, t.description, t.display_name, t.email, t.mobile, t.source, t.status, 1
+            FROM tmp_user t
+            WHERE t.tenant_id = %s
+              AND NOT EXISTS (SELECT 1 FROM _snapshot_user s WHERE s.user_name = t.user_name)
+        """, (self.tenant_id,))
+
+        shadow_org = self._shadow('tmp_organization')
+        cur.execute(f"INSERT INTO {shadow_org} SELECT * FROM tmp_organization WHERE tenant_id <> %s", (self.tenant_id,))
+        cur.execute(f"""
+            INSERT INTO {shadow_org}
+                (id, created_time, updated_time, name, org_code, tenant_id, pid, is_deleted)
+            SELECT s.id, COALESCE(t.created_time, NOW()), NOW(), s.name, s.org_code, %s, s.pid, 0
+            FROM _snapshot_org s
+            LEFT JOIN tmp_organization t ON t.tenant_id = %s AND t.org_code = s.org_code
+        """, (self.tenant_id, self.tenant_id))
+        cur.execute(f"""
+            INSERT INTO {shadow_org}
+                (id, created_time, updated_time, name, org_code, tenant_id, pid, is_deleted)
+            SELECT t.id, t.created_time, CASE WHEN t.is_deleted = 1 THEN t.updated_time ELSE NOW() END,
+                   t.name, t.org_code, t.tenant_id, t.pid, 1
+            FROM tmp_organization t
+            WHERE t.tenant_id = %s
+              AND NOT EXISTS (SELECT 1 FROM _snapshot_org s WHERE s.org_code = t.org_code)
+        """, (self.tenant_id,))
+
+        shadow_relation = self._shadow('tmp_org_user_relation')
+        cur.execute(f"INSERT INTO {shadow_relation} SELECT * FROM tmp_org_user_relation WHERE tenant_id <> %s",
+                    (self.tenant_id,))
+        copy_rows(cur, shadow_relation, ('id', 'org_id', 'user_id', 'tenant_id'),
+                  (row + (self.tenant_id,) for row in snapshot['relations']))
+
+        counts = {table: self._count_rows(cur, self._shadow(table)) for table in PUBLISH_TABLES}
+        cur.close()
+        return counts
+
+    def _count_rows(self, cur, shadow: str) -> int:
+        """统计影子表中本租户的行数"""
+        cur.execute(f"SELECT COUNT(*) FROM {shadow} WHERE tenant_id = %s", (self.tenant_id,))
+        return cur.fetchone()[0]
+
+    def _build_shadow_indexes(self, conn, indexes: Dict[str, List[Tuple]], grants: Dict[str, List[Tuple]]):
+        """数据加载完成后在影子表上重建正式表的索引、约束和权限（不提交）"""
+        cur = conn.cursor()
+        for table in PUBLISH_TABLES:
+            shadow = self._shadow(table)
+            for index_name, index_def, constraint_type in indexes[table]:
+                match = _INDEX_DEF_PATTERN.match(index_def)
+                if not match:
+                    raise Exception(f"无法解析索引定义: {index_def}")
+                shadow_index = f"{index_name}{SHADOW_SUFFIX}"
+                cur.execute(f"{match.group(1)}{shadow_index}{match.group(3)}{shadow}{match.group(5)}")
+                if constraint_type == 'p':
+                    cur.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow_index} PRIMARY KEY USING INDEX {shadow_index}")
+                elif constraint_type == 'u':
+                    cur.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow_index} UNIQUE USING INDEX {shadow_index}")
+            for grantee, privilege in grants[table]:
+                cur.execute(f'GRANT {privilege} ON {shadow} TO "{grantee}"')
+            cur.execute(f"ANALYZE {shadow}")
+        cur.close()
+
+    def _swap(self, conn, indexes: Dict[str, List[Tuple]]):
+        """在加载影子表的事务中删除正式表并将影子表及其索引重命名为正式名称，然后提交"""
+        cur = conn.cursor()
+        try:
+            for attempt in range(1, self.swap_retries + 1):
+                # 锁等待超时只回滚到保存点，已加载的影子表和持有的锁保留
+                cur.execute(f"SAVEPOINT {_SWAP_SAVEPOINT}")
+                try:
+                    cur.execute(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}")
+                    for table in PUBLISH_TABLES:
+                        cur.execute(f"DROP TABLE {table}")
+                        cur.execute(f"ALTER TABLE {self._shadow(table)} RENAME TO {table}")
+                        for index_name, _, _ in indexes[table]:
+                            cur.execute(f"ALTER INDEX {index_name}{SHADOW_SUFFIX} RENAME TO {index_name}")
+                    cur.execute(f"RELEASE SAVEPOINT {_SWAP_SAVEPOINT}")
+                    conn.commit()
+                    return
+                except Exception as e:
+                    if getattr(e, 'pgcode', None) != '55P03' or attempt == self.swap_retries:  # lock_not_available
+                        raise
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {_SWAP_SAVEPOINT}")
+                    logger.warning(f"切换影子表时等待表锁超时，第 {attempt} 次重试...")
+                    time.sleep(min(2 ** attempt, 30))
+        finally:
+            cur.close()
@@ -0,0 +1,829 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+临时表写入层
+
+OrgSyncFromIDC 的所有写操作通过存储接口完成，输入为 idc_records 规范化后的行：
+- upsert_users / upsert_organizations: 写入用户/组织，字段没有变化的行不更新
+- sync_relations: 将用户-组织关系更新为目标集合（只写入差异）
+- mark_missing_users_deleted / mark_missing_organizations_deleted: 软删除不在本次同步中的数据
+- mark_users_deleted / mark_organizations_deleted: 软删除指定数据（事件增量同步）
+
+每个方法在一个事务中完成数据写入和变更日志追加，返回各类变更的数量。
+
+后端：
+- Psycopg2Storage（默认）: 同步接口，使用 execute_values 批量写入；用户和组织的每批写入包在保存点中，
+  坏行通过二分定位后写入 tmp_sync_quarantine，不影响其余数据（见 batch_writer）；
+  全量同步的关系比较和软删除在安装 numpy 时使用向量化的差异计算（见 id_diff）
+- AsyncpgStorage: 异步接口（方法名相同，均为协程），用 unnest 数组参数的预编译 upsert 语句按批写入，
+  多个批次在连接池的不同连接上并发执行，每批同样在保存点中写入并二分隔离坏行；
+  新增的关系使用 copy_records_to_table 写入。
+  可与异步获取身份中台数据在同一个事件循环中并行执行（见 OrgSyncFromIDC.run_async）
+- SqliteStorage: 同步接口，写入本地 SQLite 文件（或 :memory:），用于没有 PostgreSQL 的本地运行和测试。
+  WAL 模式，先按批读取已有行比较字段，再用 executemany 只写入新增和变化的行
+"""
+
+import os
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from batch_writer import (prune_quarantine, quarantine_rows, quarantine_rows_async, write_isolated,
+                          write_isolated_async)
+from change_log import CHANGE_LOG_LOCK_KEY, append_changes, encode_change, prune_changes
+from id_diff import diff_table, digest_sql
+from idc_records import ORG_COLUMNS, USER_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+# 可选的数据库后端
+DB_BACKENDS = ('psycopg2', 'asyncpg', 'sqlite')
+
+# 每批写入的行数
+DEFAULT_BATCH_SIZE = 1000
+
+# 存储接口中可以查询的表
+TABLES = ('tmp_user', 'tmp_organization', 'tmp_org_user_relation')
+
+# SQLite 后端的建表脚本
+SQLITE_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'init_tables_sqlite.sql')
+
+# 两种后端共用的冲突处理：字段没有变化时不更新也不返回行，(xmax = 0) 为 true 表示新插入
+_USER_CONFLICT = """
+    ON CONFLICT (tenant_id, user_name)
+    DO UPDATE SET
+        display_name = EXCLUDED.display_name,
+        description = EXCLUDED.description,
+        email = EXCLUDED.email,
+        mobile = EXCLUDED.mobile,
+        status = EXCLUDED.status,
+        is_deleted = 0,
+        updated_time = NOW()
+    WHERE (tmp_user.display_name, tmp_user.description, tmp_user.email,
+           tmp_user.mobile, tmp_user.status, tmp_user.is_deleted)
+          IS DISTINCT FROM (EXCLUDED.display_name, EXCLUDED.description, EXCLUDED.email,
+                            EXCLUDED.mobile, EXCLUDED.status, 0)
+    RETURNING id, (xmax = 0), user_name, display_name, email, mobile, status
+"""
+
+_ORG_CONFLICT = """
+    ON CONFLICT (tenant_id, org_code)
+    DO UPDATE SET
+        name = EXCLUDED.name,
+        pid = EXCLUDED.pid,
+        is_deleted = 0,
+        updated_time = NOW()
+    WHERE (tmp_organization.name, tmp_organization.pid, tmp_organization.is_deleted)
+          IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.pid, 0)
+    RETURNING id, (xmax = 0), name, org_code, pid
+"""
+
+_USER_INSERT = """
+    INSERT INTO tmp_user
+        (id, user_name, description, display_name, email, mobile,
+         tenant_id, source, status, is_deleted, updated_time)
+"""
+
+_ORG_INSERT = """
+    INSERT INTO tmp_organization
+        (id, name, org_code, tenant_id, pid, is_deleted, updated_time)
+"""
+
+# 用户-组织关系的键（id_diff 的键摘要）
+_RELATION_KEY = ('user_id', 'org_id')
+
+
+def _batches(rows: Sequence, size: int) -> Iterable[Sequence]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _user_changes(returned: Iterable[Tuple]) -> Tuple[Dict[str, int], List[Tuple]]:
+    """根据 upsert 返回的行统计变更数量并生成变更日志"""
+    counts = {'inserted': 0, 'updated': 0}
+    changes = []
+    for user_id, inserted, user_name, display_name, email, mobile, status in returned:
+        counts['inserted' if inserted else 'updated'] += 1
+        changes.append(('tmp_user', 'insert' if inserted else 'update', user_id, {
+            'user_name': user_name, 'display_name': display_name,
+            'email': email, 'mobile': mobile, 'status': status}))
+    return counts, changes
+
+
+def _org_changes(returned: Iterable[Tuple]) -> Tuple[Dict[str, int], List[Tuple]]:
+    counts = {'inserted': 0, 'updated': 0}
+    changes = []
+    for org_id, inserted, name, org_code, pid in returned:
+        counts['inserted' if inserted else 'updated'] += 1
+        changes.append(('tmp_organization', 'insert' if inserted else 'update', org_id, {
+            'name': name, 'org_code': org_code, 'pid': pid}))
+    return counts, changes
+
+
+def _relation_changes(operation: str, rows: Iterable[Tuple]) -> List[Tuple]:
+    """rows 为 (关系ID, user_id, org_id)"""
+    return [('tmp_org_user_relation', operation, relation_id, {'user_id': user_id, 'org_id': org_id})
+            for relation_id, user_id, org_id in rows]
+
+
+def _merge_counts(total: Dict[str, int], counts: Dict[str, int]):
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+
+
+def _check_table(table: str):
+    if table not in TABLES:
+        raise ValueError(f"不支持的表: {table}")
+
+
+class Psycopg2Storage:
+    """基于 psycopg2 的同步写入（默认后端）"""
+
+    name = 'psycopg2'
+
+    def __init__(self, get_connection: Callable, tenant_id: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            get_connection: 获取数据库连接的函数
+            tenant_id: 租户ID
+            batch_size: 每批写入的行数
+        """
+        self.get_connection = get_connection
+        self.tenant_id = tenant_id
+        self.batch_size = batch_size
+        # 最近一次 upsert_users / upsert_organizations 隔离的坏行 (行, 异常)
+        self.last_quarantined: List[Tuple] = []
+
+    @contextmanager
+    def _transaction(self):
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def upsert_users(self, rows: Sequence[Tuple], progress=None) -> Dict[str, int]:
+        """
+        写入用户
+
+        Args:
+            rows: 按 idc_records.USER_COLUMNS 排列的行，user_name 不能重复
+            progress: 可选的 ProgressReporter
+
+        Returns:
+            {'inserted': 数量, 'updated': 数量}
+        """
+        counts = {'inserted': 0, 'updated': 0}
+        self.last_quarantined = quarantined = []
+        with self._transaction() as cur:
+            def write(batch):
+                return execute_values(cur, _USER_INSERT + " VALUES %s " + _USER_CONFLICT, [
+                    (user_id, user_name, display_name, email or '', mobile or '', self.tenant_id, status)
+                    for user_id, user_name, display_name, email, mobile, status in batch
+                ], template="(%s, %s, '', %s, %s, %s, %s, 'CAS', %s, 0, NOW())", page_size=len(batch), fetch=True)
+
+            changes = []
+            for batch in _batches(rows, self.batch_size):
+                batch_counts, batch_changes = _user_changes(write_isolated(cur, batch, write, quarantined))
+                _merge_counts(counts, batch_counts)
+                changes.extend(batch_changes)
+                if progress:
+                    progress.update(len(batch))
+            append_changes(cur, self.tenant_id, changes)
+            quarantine_rows(cur, self.tenant_id, 'tmp_user', USER_COLUMNS, 'user_name', quarantined)
+        return counts
+
+    def upsert_organizations(self, rows: Sequence[Tuple], progress=None) -> Dict[str, int]:
+        """写入组织（rows 按 idc_records.ORG_COLUMNS 排列，org_code 不能重复）"""
+        counts = {'inserted': 0, 'updated': 0}
+        self.last_quarantined = quarantined = []
+        with self._transaction() as cur:
+            def write(batch):
+                return execute_values(cur, _ORG_INSERT + " VALUES %s " + _ORG_CONFLICT, [
+                    (org_id, name, org_code, self.tenant_id, pid) for org_id, name, org_code, pid in batch
+                ], template="(%s, %s, %s, %s, %s, 0, NOW())", page_size=len(batch), fetch=True)
+
+            changes = []
+            for batch in _batches(rows, self.batch_size):
+                batch_counts, batch_changes = _org_changes(write_isolated(cur, batch, write, quarantined))
+                _merge_counts(counts, batch_counts)
+                changes.extend(batch_changes)
+                if progress:
+                    progress.update(len(batch))
+            append_changes(cur, self.tenant_id, changes)
+            quarantine_rows(cur, self.tenant_id, 'tmp_organization', ORG_COLUMNS, 'org_code', quarantined)
+        return counts
+
+    def sync_relations(self, desired: Set[Tuple[str, str]], user_ids: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        """
+        将用户-组织关系更新为 desired 中的 (user_id, org_id) 集合
+
+        Args:
+            desired: 目标关系集合
+            user_ids: 只比较这些用户的关系，为空时比较整个租户的关系
+
+        Returns:
+            {'inserted': 数量, 'deleted': 数量}
+        """
+        with self._transaction() as cur:
+            if user_ids is None:
+                where, params = "tenant_id = %s", (self.tenant_id,)
+            else:
+                where, params = "tenant_id = %s AND user_id = ANY(%s)", (self.tenant_id, list(user_ids))
+            # 关系较多时使用向量化比较（见 id_diff），多余的关系按 ctid 删除
+            diff = diff_table(cur, 'tmp_org_user_relation', _RELATION_KEY, where, params, list(desired))
+            if diff is not None:
+                added_keys, removed = diff
+                deleted_rows = self._execute_by_tid(cur, f"""
+                    DELETE FROM tmp_org_user_relation
+                    WHERE ctid = ANY(%s::tid[]) AND tenant_id = %s AND {digest_sql(_RELATION_KEY)} = ANY(%s)
+                    RETURNING id, user_id, org_id
+                """, removed)
+            else:
+                cur.execute(f"SELECT user_id, org_id FROM tmp_org_user_relation WHERE {where}", params)
+                existing = set(cur.fetchall())
+                added_keys = desired - existing
+                removed = [(self.tenant_id, user_id, org_id) for user_id, org_id in existing - desired]
+                deleted_rows = execute_values(cur, """
+                    DELETE FROM tmp_org_user_relation r
+                    USING (VALUES %s) AS d(tenant_id, user_id, org_id)
+                    WHERE r.tenant_id = d.tenant_id AND r.user_id = d.user_id AND r.org_id = d.org_id
+                    RETURNING r.id, r.user_id, r.org_id
+                """, removed, page_size=self.batch_size, fetch=True) if removed else []
+
+            added = [(str(uuid.uuid4()), user_id, org_id) for user_id, org_id in added_keys]
+            changes = _relation_changes('delete', deleted_rows)
+            if added:
+                execute_values(cur, """
+                    INSERT INTO tmp_org_user_relation (id, user_id, org_id, tenant_id)
+                    VALUES %s
+                    ON CONFLICT DO NOTHING
+                """, [(relation_id, user_id, org_id, self.tenant_id) for relation_id, user_id, org_id in added],
+                    page_size=self.batch_size)
+                changes.extend(_relation_changes('insert', added))
+            append_changes(cur, self.tenant_id, changes)
+        # 删除数按实际删除的行计：向量化比较的候选行可能在摘要复核时跳过，集合比较的一对键可能对应多行重复关系
+        return {'inserted': len(added), 'deleted': len(deleted_rows)}
+
+    def _execute_by_tid(self, cur, query: str, rows: List[Tuple[str, bytes]]) -> List[Tuple]:
+        """按批对 diff_table 返回的 (ctid, 摘要) 执行 query（参数为 ctid 数组、租户ID、摘要数组），返回 RETURNING 的结果"""
+        returned = []
+        for batch in _batches(rows, self.batch_size):
+            cur.execute(query, ([tid for tid, _ in batch], self.tenant_id,
+                                [psycopg2.Binary(digest) for _, digest in batch]))
+            returned.extend(cur.fetchall())
+        return returned
+
+    def _mark_missing_deleted(self, cur, table: str, key_column: str, active_ids: Sequence[str]) -> List[Tuple]:
+        """将表中不在 active_ids 中的未删除数据标记为已删除，返回 (id, key_column)"""
+        diff = diff_table(cur, table, ('id',), "tenant_id = %s AND is_deleted = 0", (self.tenant_id,),
+                          list(set(active_ids)))
+        if diff is not None:
+            return self._execute_by_tid(cur, f"""
+                UPDATE {table}
+                SET is_deleted = 1, updated_time = NOW()
+                WHERE ctid = ANY(%s::tid[]) AND tenant_id = %s AND {digest_sql(('id',))} = ANY(%s) AND is_deleted = 0
+                RETURNING id, {key_column}
+            """, diff[1])
+        cur.execute(f"""
+            UPDATE {table}
+            SET is_deleted = 1, updated_time = NOW()
+            WHERE tenant_id = %s AND id != ALL(%s) AND is_deleted = 0
+            RETURNING id, {key_column}
+        """, (self.tenant_id, list(active_ids)))
+        return cur.fetchall()
+
+    def mark_missing_users_deleted(self, active_user_ids: Sequence[str]) -> Dict[str, int]:
+        """将不在活跃用户列表中的用户标记为已删除"""
+        with self._transaction() as cur:
+            deleted = self._mark_missing_deleted(cur, 'tmp_user', 'user_name', active_user_ids)
+            append_changes(cur, self.tenant_id, [('tmp_user', 'delete', user_id, {'user_name': user_name})
+                                                 for user_id, user_name in deleted])
+        return {'deleted': len(deleted)}
+
+    def mark_missing_organizations_deleted(self, active_org_ids: Sequence[str]) -> Dict[str, int]:
+        """将不在活跃组织列表中的组织标记为已删除"""
+        with self._transaction() as cur:
+            deleted = self._mark_missing_deleted(cur, 'tmp_organization', 'org_code', active_org_ids)
+            append_changes(cur, self.tenant_id, [('tmp_organization', 'delete', org_id, {'org_code': org_code})
+                                                 for org_id, org_code in deleted])
+        return {'deleted': len(deleted)}
+
+    def mark_users_deleted(self, user_ids: Sequence[str]) -> Dict[str, int]:
+        """
+        将指定用户标记为已删除，并清除其用户-组织关系
+
+        Returns:
+            {'deleted': 删除的用户数, 'relations_deleted': 删除的关系数}
+        """
+        with self._transaction() as cur:
+            cur.execute("""
+                UPDATE tmp_user
+                SET is_deleted = 1, updated_time = NOW()
+                WHERE tenant_id = %s AND id = ANY(%s) AND is_deleted = 0
+                RETURNING id, user_name
+            """, (self.tenant_id, list(user_ids)))
+            deleted = cur.fetchall()
+            cur.execute("DELETE FROM tmp_org_user_relation WHERE tenant_id = %s AND user_id = ANY(%s) "
+                        "RETURNING id, user_id, org_id", (self.tenant_id, list(user_ids)))
+            deleted_relations = cur.fetchall()
+            append_changes(cur, self.tenant_id,
+                           [('tmp_user', 'delete', user_id, {'user_name': user_name}) for user_id, user_name in deleted] +
+                           _relation_changes('delete', deleted_relations))
+        return {'deleted': len(deleted), 'relations_deleted': len(deleted_relations)}
+
+    def mark_organizations_deleted(self, org_ids: Sequence[str]) -> Dict[str, int]:
+        """将指定组织标记为已删除"""
+        with self._transaction() as cur:
+            cur.execute("""
+                UPDATE tmp_organization
+                SET is_deleted = 1, updated_time = NOW()
+                WHERE tenant_id = %s AND id = ANY(%s) AND is_deleted = 0
+                RETURNING id, org_code
+            """, (self.tenant_id, list(org_ids)))
+            deleted = cur.fetchall()
+            append_changes(cur, self.tenant_id, [('tmp_organization', 'delete', org_id, {'org_code': org_code})
+                                                 for org_id, org_code in deleted])
+        return {'deleted': len(deleted)}
+
+    def relation_user_ids(self) -> Set[str]:
+        """当前租户用户-组织关系中出现的用户ID"""
+        with self._transaction() as cur:
+            cur.execute("SELECT DISTINCT user_id FROM tmp_org_user_relation WHERE tenant_id = %s", (self.tenant_id,))
+            return {row[0] for row in cur.fetchall()}
+
+    def count_rows(self, table: str) -> int:
+        """当前租户在表中的记录数"""
+        _check_table(table)
+        with self._transaction() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM {table} WHERE tenant_id = %s", (self.tenant_id,))
+            return cur.fetchone()[0]
+
+    def describe_table(self, table: str) -> List[Tuple[str, str]]:
+        """表的 (列名, 类型) 列表，表不存在时返回空列表"""
+        _check_table(table)
+        with self._transaction() as cur:
+            cur.execute("""
+                SELECT column_name, data_type
+                FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = %s
+                ORDER BY ordinal_position
+            """, (table,))
+            return cur.fetchall()
+
+    def prune_change_log(self, retention_days: int) -> int:
+        """删除当前租户超过保留天数的变更日志（同时清理过期的隔离记录）"""
+        with self._transaction() as cur:
+            prune_quarantine(cur, retention_days, tenant_id=self.tenant_id)
+            return prune_changes(cur.connection, retention_days, tenant_id=self.tenant_id)
+
+    def close(self):
+        pass
+
+
+class AsyncpgStorage:
+    """
+    基于 asyncpg 的异步写入
+
+    方法与 Psycopg2Storage 相同，均为协程。使用前需调用 open() 创建连接池。
+    """
+
+    name = 'asyncpg'
+
+    # unnest 数组参数的 upsert：每批一次往返，语句由 asyncpg 按连接自动预编译并缓存
+    _USER_UPSERT = _USER_INSERT + """
+        SELECT u.id, u.user_name, '', u.display_name, u.email, u.mobile, $7, 'CAS', u.status, 0, NOW()
+        FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::varchar[], $5::varchar[], $6::smallint[])
+             AS u(id, user_name, display_name, email, mobile, status)
+    """ + _USER_CONFLICT
+
+    _ORG_UPSERT = _ORG_INSERT + """
+        SELECT o.id, o.name, o.org_code, $5, o.pid, 0, NOW()
+        FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::varchar[]) AS o(id, name, org_code, pid)
+    """ + _ORG_CONFLICT
+
+    def __init__(self, db_config: Dict, tenant_id: str, batch_size: int = DEFAULT_BATCH_SIZE, pool_size: int = 4):
+        """
+        Args:
+            db_config: 与 psycopg2.connect 相同的连接参数（host/port/database/user/password）
+            tenant_id: 租户ID
+            batch_size: 每批写入的行数
+            pool_size: 连接池大小，即同时执行的批次数
+        """
+        self.db_config = db_config
+        self.tenant_id = tenant_id
+        self.batch_size = batch_size
+        self.pool_size = pool_size
+        self._pool = None
+        self._change_log_exists = None
+        # 最近一次 upsert_users / upsert_organizations 隔离的坏行 (行, 异常)
+        self.last_quarantined: List[Tuple] = []
+        # 本对象所有写入隔离的坏行（按表），并发执行的多次 upsert 不会互相覆盖
+        self.quarantined: Dict[str, List[Tuple]] = {'tmp_user': [], 'tmp_organization': []}
+
+    async def open(self):
+        try:
+            import asyncpg
+        except ImportError:
+            raise RuntimeError("使用 asyncpg 后端需要先安装 asyncpg: pip install asyncpg")
+        self._pool = await asyncpg.create_pool(
+            host=self.db_config['host'],
+            port=self.db_config['port'],
+            database=self.db_config['database'],
+            user=self.db_config['user'],
+            password=self.db_config['password'] or None,
+            min_size=1,
+            max_size=self.pool_size,
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def _append_changes(self, conn, changes: List[Tuple]):
+        """在当前事务中追加变更日志（与 change_log.append_changes 相同的加锁规则）"""
+        if not changes:
+            return
+        if self._change_log_exists is None:
+            self._change_log_exists = await conn.fetchval("SELECT to_regclass('tmp_change_log') IS NOT NULL")
+        if not self._change_log_exists:
+            return
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", CHANGE_LOG_LOCK_KEY)
+        await conn.copy_records_to_table(
+            'tmp_change_log', columns=['tenant_id', 'table_name', 'operation', 'record_id', 'data'],
+            records=[encode_change(self.tenant_id, change) for change in changes])
+
+    async def _upsert(self, sql: str, rows: Sequence[Tuple], to_args: Callable, to_changes: Callable,
+                      table: str, columns: Sequence[str], key_column: str, progress=None) -> Dict[str, int]:
+        """
+        并发执行多个批次，每个批次在独立事务中写入数据、变更日志和隔离的坏行
+
+        批次写入包在嵌套事务（保存点）中，数据类错误二分定位到单行后写入 tmp_sync_quarantine（见 batch_writer）
+        """
+        self.last_quarantined = quarantined = []
+
+        async def run_batch(batch):
+            batch_quarantined = []
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    async def write(part):
+                        return await conn.fetch(sql, *to_args(part))
+                    returned = await write_isolated_async(conn, batch, write, batch_quarantined)
+                    counts, changes = to_changes(tuple(row) for row in returned)
+                    await self._append_changes(conn, changes)
+                    await quarantine_rows_async(conn, self.tenant_id, table, columns, key_column, batch_quarantined)
+            # 批次提交后才计入隔离的坏行
+            quarantined.extend(batch_quarantined)
+            self.quarantined[table].extend(batch_quarantined)
+            if progress:
+                progress.update(len(batch))
+            return counts
+
+        total = {'inserted': 0, 'updated': 0}
+        for counts in await asyncio.gather(*(run_batch(batch) for batch in _batches(rows, self.batch_size))):
+            _merge_counts(total, counts)
+        return total
+
+    def _user_args(self, batch: Sequence[Tuple]) -> Tuple:
+        ids, names, display_names, emails, mobiles, statuses = (list(column) for column in zip(*batch))
+        return (ids, names, display_names, [e or '' for e in emails], [m or '' for m in mobiles], statuses,
+                self.tenant_id)
+
+    def _org_args(self, batch: Sequence[Tuple]) -> Tuple:
+        ids, names, org_codes, pids = (list(column) for column in zip(*batch))
+        return ids, names, org_codes, pids, self.tenant_id
+
+    async def upsert_users(self, rows: Sequence[Tuple], progress=None) -> Dict[str, int]:
+        return await self._upsert(self._USER_UPSERT, rows, self._user_args, _user_changes,
+                                  'tmp_user', USER_COLUMNS, 'user_name', progress)
+
+    async def upsert_organizations(self, rows: Sequence[Tuple], progress=None) -> Dict[str, int]:
+        return await self._upsert(self._ORG_UPSERT, rows, self._org_args, _org_changes,
+                                  'tmp_organization', ORG_COLUMNS, 'org_code', progress)
+
+    async def sync_relations(self, desired: Set[Tuple[str, str]],
+                             user_ids: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                if user_ids is None:
+                    rows = await conn.fetch("SELECT user_id, org_id FROM tmp_org_user_relation WHERE tenant_id = $1",
+                                            self.tenant_id)
+                else:
+                    rows = await conn.fetch("SELECT user_id, org_id FROM tmp_org_user_relation "
+                                            "WHERE tenant_id = $1 AND user_id = ANY($2::varchar[])",
+                                            self.tenant_id, list(user_ids))
+                existing = {tuple(row) for row in rows}
+
+                removed = list(existing - desired)
+                added = [(str(uuid.uuid4()), user_id, org_id) for user_id, org_id in desired - existing]
+                changes = []
+                deleted_rows = []
+                if removed:
+                    deleted_rows = await conn.fetch("""
+                        DELETE FROM tmp_org_user_relation r
+                        USING unnest($2::varchar[], $3::varchar[]) AS d(user_id, org_id)
+                        WHERE r.tenant_id = $1 AND r.user_id = d.user_id AND r.org_id = d.org_id
+                        RETURNING r.id, r.user_id, r.org_id
+                    """, self.tenant_id, [user_id for user_id, _ in removed], [org_id for _, org_id in removed])
+                    changes.extend(_relation_changes('delete', (tuple(row) for row in deleted_rows)))
+                if added:
+                    # 新增关系使用新生成的ID，不会冲突，直接 COPY 写入
+                    await conn.copy_records_to_table(
+                        'tmp_org_user_relation', columns=['id', 'user_id', 'org_id', 'tenant_id'],
+                        records=[(relation_id, user_id, org_id, self.tenant_id)
+                                 for relation_id, user_id, org_id in added])
+                    changes.extend(_relation_changes('insert', added))
+                await self._append_changes(conn, changes)
+        return {'inserted': len(added), 'deleted': len(deleted_rows)}
+
+    async def _mark_deleted(self, table: str, key_column: str, condition: str, ids: Sequence[str]) -> List[Tuple]:
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(f"""
+                    UPDATE {table}
+                    SET is_deleted = 1, updated_time = NOW()
+                    WHERE tenant_id = $1 AND {condition} AND is_deleted = 0
+                    RETURNING id, {key_column}
+                """, self.tenant_id, list(ids))
+                await self._append_changes(conn, [(table, 'delete', record_id, {key_column: key})
+                                                  for record_id, key in rows])
+        return rows
+
+    async def mark_missing_users_deleted(self, active_user_ids: Sequence[str]) -> Dict[str, int]:
+        rows = await self._mark_deleted('tmp_user', 'user_name', 'id != ALL($2::varchar[])', active_user_ids)
+        return {'deleted': len(rows)}
+
+    async def mark_missing_organizations_deleted(self, active_org_ids: Sequence[str]) -> Dict[str, int]:
+        rows = await self._mark_deleted('tmp_organization', 'org_code', 'id != ALL($2::varchar[])', active_org_ids)
+        return {'deleted': len(rows)}
+
+    async def mark_users_deleted(self, user_ids: Sequence[str]) -> Dict[str, int]:
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                deleted = await conn.fetch("""
+                    UPDATE tmp_user
+                    SET is_deleted = 1, updated_time = NOW()
+                    WHERE tenant_id = $1 AND id = ANY($2::varchar[]) AND is_deleted = 0
+                    RETURNING id, user_name
+                """, self.tenant_id, list(user_ids))
+                deleted_relations = await conn.fetch(
+                    "DELETE FROM tmp_org_user_relation WHERE tenant_id = $1 AND user_id = ANY($2::varchar[]) "
+                    "RETURNING id, user_id, org_id", self.tenant_id, list(user_ids))
+                await self._append_changes(
+                    conn, [('tmp_user', 'delete', user_id, {'user_name': user_name}) for user_id, user_name in deleted] +
+                    _relation_changes('delete', (tuple(row) for row in deleted_relations)))
+        return {'deleted': len(deleted), 'relations_deleted': len(deleted_relations)}
+
+    async def mark_organizations_deleted(self, org_ids: Sequence[str]) -> Dict[str, int]:
+        rows = await self._mark_deleted('tmp_organization', 'org_code', 'id = ANY($2::varchar[])', org_ids)
+        return {'deleted': len(rows)}
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    打开 SQLite 数据库并创建临时表（init_tables_sqlite.sql）
+
+    Args:
+        path: 数据库文件路径，:memory: 表示内存数据库
+    """
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    with open(SQLITE_SCHEMA_FILE, encoding='utf-8') as f:
+        conn.executescript(f.read())
+    return conn
+
+
+class SqliteStorage:
+    """
+    基于 SQLite 的同步写入（本地运行和测试）
+
+    与 PostgreSQL 后端的语义相同：字段没有变化的行不更新，软删除只影响未删除的行，
+    每个方法在一个事务中完成数据写入和变更日志追加。内存数据库只在本对象存活期间有效。
+    """
+
+    name = 'sqlite'
+
+    _USER_UPSERT = """
+        INSERT INTO tmp_user
+            (id, user_name, description, display_name, email, mobile,
+             tenant_id, source, status, is_deleted, updated_time)
+        VALUES (?, ?, '', ?, ?, ?, ?, 'CAS', ?, 0, CURRENT_TIMESTAMP)
+        ON CONFLICT (tenant_id, user_name)
+        DO UPDATE SET
+            display_name = excluded.display_name,
+            description = excluded.description,
+            email = excluded.email,
+            mobile = excluded.mobile,
+            status = excluded.status,
+            is_deleted = 0,
+            updated_time = CURRENT_TIMESTAMP
+    """
+
+    _ORG_UPSERT = """
+        INSERT INTO tmp_organization (id, name, org_code, tenant_id, pid, is_deleted, updated_time)
+        VALUES (?, ?, ?, ?, ?, 0, CURRENT_TIMESTAMP)
+        ON CONFLICT (tenant_id, org_code)
+        DO UPDATE SET
+            name = excluded.name,
+            pid = excluded.pid,
+            is_deleted = 0,
+            updated_time = CURRENT_TIMESTAMP
+    """
+
+    def __init__(self, path: str, tenant_id: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            path: 数据库文件路径，:memory: 表示内存数据库
+            tenant_id: 租户ID
+            batch_size: 每批写入的行数
+        """
+        self.path = path
+        self.tenant_id = tenant_id
+        self.batch_size = batch_size
+        self.conn = connect_sqlite(path)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE 在事务开始时获取写锁，变更日志的 seq 顺序与提交顺序一致
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.close()
+
+    def _append_changes(self, cur, changes: List[Tuple]):
+        cur.executemany("INSERT INTO tmp_change_log (tenant_id, table_name, operation, record_id, data) "
+                        "VALUES (?, ?, ?, ?, ?)", [encode_change(self.tenant_id, change) for change in changes])
+
+    def _fill_ids(self, cur, ids: Sequence[str]) -> str:
+        """将ID列表写入临时表 _ids（避免 SQLite 的参数数量限制），返回子查询"""
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS _ids (id TEXT PRIMARY KEY)")
+        cur.execute("DELETE FROM _ids")
+        cur.executemany("INSERT OR IGNORE INTO _ids (id) VALUES (?)", [(record_id,) for record_id in ids])
+        return "(SELECT id FROM _ids)"
+
+    def _existing(self, cur, table: str, key_column: str, columns: str, keys: List[str]) -> Dict[str, Tuple]:
+        # 键写入 _ids 后联表查询，每批的参数数量不受 SQLite 3.32 之前 999 个的限制
+        self._fill_ids(cur, keys)
+        cur.execute(f"SELECT t.{key_column}, {', '.join('t.' + column.strip() for column in columns.split(','))} "
+                    f"FROM {table} t JOIN _ids ON _ids.id = t.{key_column} WHERE t.tenant_id = ?", (self.tenant_id,))
+        return {row[0]: row[1:] for row in cur.fetchall()}
+
+    def upsert_users(self, rows: Sequence[Tuple], progress=None) -> Dict[str, int]:
+        counts = {'inserted': 0, 'updated': 0}
+        with self._transaction() as cur:
+            changes = []
+            for batch in _batches(rows, self.batch_size):
+                existing = self._existing(cur, 'tmp_user', 'user_name',
+                                          'id, display_name, description, email, mobile, status, is_deleted',
+                                          [row[1] for row in batch])
+                returned = []
+                for user_id, user_name, display_name, email, mobile, status in batch:
+                    values = (display_name, '', email or '', mobile or '', status, 0)
+                    current = existing.get(user_name)
+                    if current is None:
+                        returned.append((user_id, True, user_name, display_name, email or '', mobile or '', status))
+                    elif tuple(current[1:]) != values:
+                        returned.append((current[0], False, user_name, display_name, email or '', mobile or '',
+                                         status))
+                cur.executemany(self._USER_UPSERT, [
+                    (user_id, user_name, display_name, email, mobile, self.tenant_id, status)
+                    for user_id, _, user_name, display_name, email, mobile, status in returned
+                ])
+                batch_counts, batch_changes = _user_changes(returned)
+                _merge_counts(counts, batch_counts)
+                changes.extend(batch_changes)
+                if progress:
+                    progress.update(len(batch))
+            self._append_changes(cur, changes)
+        return counts
+
+    def upsert_organizations(self, rows: Sequence[Tuple], progress=None) -> Dict[str, int]:
+        counts = {'inserted': 0, 'updated': 0}
+        with self._transaction() as cur:
+            changes = []
+            for batch in _batches(rows, self.batch_size):
+                existing = self._existing(cur, 'tmp_organization', 'org_code', 'id, name, pid, is_deleted',
+                                          [row[2] for row in batch])
+                returned = []
+                for org_id, name, org_code, pid in batch:
+                    current = existing.get(org_code)
+                    if current is None:
+                        returned.append((org_id, True, name, org_code, pid))
+                    elif tuple(current[1:]) != (name, pid, 0):
+                        returned.append((current[0], False, name, org_code, pid))
+                cur.executemany(self._ORG_UPSERT, [
+                    (org_id, name, org_code, self.tenant_id, pid) for org_id, _, name, org_code, pid in returned
+                ])
+                batch_counts, batch_changes = _org_changes(returned)
+                _merge_counts(counts, batch_counts)
+                changes.extend(batch_changes)
+                if progress:
+                    progress.update(len(batch))
+            self._append_changes(cur, changes)
+        return counts
+
+    def sync_relations(self, desired: Set[Tuple[str, str]], user_ids: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        with self._transaction() as cur:
+            query = "SELECT id, user_id, org_id FROM tmp_org_user_relation WHERE tenant_id = ?"
+            if user_ids is not None:
+                query += f" AND user_id IN {self._fill_ids(cur, user_ids)}"
+            cur.execute(query, (self.tenant_id,))
+            existing = {(user_id, org_id) for _, user_id, org_id in cur.fetchall()}
+
+            added = [(str(uuid.uuid4()), user_id, org_id) for user_id, org_id in desired - existing]
+            # 按键删除（包括重复的关系行），删除数和变更日志按实际删除的行计
+            removed = []
+            for user_id, org_id in existing - desired:
+                cur.execute("DELETE FROM tmp_org_user_relation WHERE tenant_id = ? AND user_id = ? AND org_id = ? "
+                            "RETURNING id, user_id, org_id", (self.tenant_id, user_id, org_id))
+                removed.extend(cur.fetchall())
+            cur.executemany("INSERT INTO tmp_org_user_relation (id, user_id, org_id, tenant_id) VALUES (?, ?, ?, ?)",
+                            [(relation_id, user_id, org_id, self.tenant_id) for relation_id, user_id, org_id in added])
+            self._append_changes(cur, _relation_changes('delete', removed) + _relation_changes('insert', added))
+        return {'inserted': len(added), 'deleted': len(removed)}
+
+    def _mark_deleted(self, cur, table: str, key_column: str, condition: str) -> List[Tuple]:
+        cur.execute(f"""
+            UPDATE {table}
+            SET is_deleted = 1, updated_time = CURRENT_TIMESTAMP
+            WHERE tenant_id = ? AND {condition} AND is_deleted = 0
+            RETURNING id, {key_column}
+        """, (self.tenant_id,))
+        rows = cur.fetchall()
+        self._append_changes(cur, [(table, 'delete', record_id, {key_column: key}) for record_id, key in rows])
+        return rows
+
+    def mark_missing_users_deleted(self, active_user_ids: Sequence[str]) -> Dict[str, int]:
+        with self._transaction() as cur:
+            ids = self._fill_ids(cur, active_user_ids)
+            return {'deleted': len(self._mark_deleted(cur, 'tmp_user', 'user_name', f"id NOT IN {ids}"))}
+
+    def mark_missing_organizations_deleted(self, active_org_ids: Sequence[str]) -> Dict[str, int]:
+        with self._transaction() as cur:
+            ids = self._fill_ids(cur, active_org_ids)
+            return {'deleted': len(self._mark_deleted(cur, 'tmp_organization', 'org_code', f"id NOT IN {ids}"))}
+
+    def mark_users_deleted(self, user_ids: Sequence[str]) -> Dict[str, int]:
+        with self._transaction() as cur:
+            ids = self._fill_ids(cur, user_ids)
+            deleted = self._mark_deleted(cur, 'tmp_user', 'user_name', f"id IN {ids}")
+            cur.execute(f"DELETE FROM tmp_org_user_relation WHERE tenant_id = ? AND user_id IN {ids} "
+                        "RETURNING id, user_id, org_id", (self.tenant_id,))
+            deleted_relations = cur.fetchall()
+            self._append_changes(cur, _relation_changes('delete', deleted_relations))
+        return {'deleted': len(deleted), 'relations_deleted': len(deleted_relations)}
+
+    def mark_organizations_deleted(self, org_ids: Sequence[str]) -> Dict[str, int]:
+        with self._transaction() as cur:
+            ids = self._fill_ids(cur, org_ids)
+            return {'deleted': len(self._mark_deleted(cur, 'tmp_organization', 'org_code', f"id IN {ids}"))}
+
+    def relation_user_ids(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self.conn.execute(
+                "SELECT DISTINCT user_id FROM tmp_org_user_relation WHERE tenant_id = ?", (self.tenant_id,))}
+
+    def count_rows(self, table: str) -> int:
+        _check_table(table)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE tenant_id = ?",
+                                     (self.tenant_id,)).fetchone()[0]
+
+    def describe_table(self, table: str) -> List[Tuple[str, str]]:
+        _check_table(table)
+        with self._lock:
+            return [(row[1], row[2]) for row in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    def prune_change_log(self, retention_days: int) -> int:
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM tmp_change_log WHERE tenant_id = ? AND created_time < datetime('now', ?)",
+                        (self.tenant_id, f'-{int(retention_days)} days'))
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
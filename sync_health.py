@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+临时库健康检查（只读取系统目录，不扫描数据）
+
+对大租户执行 SELECT COUNT(*) 是全表扫描，健康探针和每次同步都会被拖慢。这里的检查只读取：
+
+- 表是否存在（to_regclass）和估算行数（pg_class.reltuples，ANALYZE/autovacuum 后更新）
+- 索引是否有效（pg_index.indisvalid / indisready，CREATE INDEX CONCURRENTLY 失败会留下无效索引）
+- 租户最近一次同步的版本号和时间（tmp_sync_generation、tmp_sync_run）
+
+按租户的精确行数只在指定 --exact 时统计。可以作为 Kubernetes 就绪探针：
+
+    python sync_health.py                      # 健康时退出码为 0
+    python sync_health.py --max-age-hours 26   # 超过26小时没有成功同步也视为不健康
+    python sync_health.py --exact --json
+"""
+
+import os
+import sys
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+# 同步必需的表
+REQUIRED_TABLES = ('tmp_user', 'tmp_organization', 'tmp_org_user_relation')
+
+# 可选的表（缺少时只提示，不影响健康状态）
+OPTIONAL_TABLES = ('tmp_sync_generation', 'tmp_change_log', 'tmp_sync_run', 'tmp_sync_state')
+
+# 检查的语句超时（毫秒），避免数据库异常时探针长时间挂起
+DEFAULT_STATEMENT_TIMEOUT_MS = 5000
+
+
+def _table_stats(cur, tables: Sequence[str]) -> Dict[str, Dict]:
+    cur.execute("""
+        SELECT t.name, c.oid IS NOT NULL, c.reltuples::BIGINT,
+               (SELECT last_analyze FROM pg_stat_user_tables s WHERE s.relid = c.oid),
+               (SELECT last_autoanalyze FROM pg_stat_user_tables s WHERE s.relid = c.oid)
+        FROM unnest(%s::TEXT[]) WITH ORDINALITY AS t(name, position)
+        LEFT JOIN pg_class c ON c.oid = to_regclass(t.name)
+        ORDER BY t.position
+    """, (list(tables),))
+    stats = {}
+    for name, exists, reltuples, last_analyze, last_autoanalyze in cur.fetchall():
+        analyzed = max(filter(None, (last_analyze, last_autoanalyze)), default=None)
+        # reltuples 为 -1（PostgreSQL 14+）表示还没有 ANALYZE 过
+        stats[name] = {'exists': exists, 'estimated_rows': reltuples if exists and reltuples >= 0 else None,
+                       'last_analyze': analyzed, 'indexes': []}
+    return stats
+
+
+def _index_validity(cur, tables: Sequence[str]) -> Dict[str, list]:
+    cur.execute("""
+        SELECT t.relname, i.relname, x.indisvalid, x.indisready
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_class t ON t.oid = x.indrelid
+        WHERE t.oid = ANY(ARRAY(SELECT to_regclass(name) FROM unnest(%s::TEXT[]) AS name))
+        ORDER BY t.relname, i.relname
+    """, (list(tables),))
+    indexes = {}
+    for table, index, valid, ready in cur.fetchall():
+        indexes.setdefault(table, []).append({'name': index, 'valid': valid, 'ready': ready})
+    return indexes
+
+
+def _last_sync(cur, tenant_id: str, tables: Dict[str, Dict]) -> Dict:
+    last_sync = {'generation': None, 'generation_time': None, 'last_success_time': None, 'last_run_status': None}
+    if tables.get('tmp_sync_generation', {}).get('exists'):
+        cur.execute("SELECT generation, updated_time FROM tmp_sync_generation WHERE tenant_id = %s", (tenant_id,))
+        row = cur.fetchone()
+        if row:
+            last_sync['generation'], last_sync['generation_time'] = row
+    if tables.get('tmp_sync_run', {}).get('exists'):
+        cur.execute("""
+            SELECT status, started_time, finished_time FROM tmp_sync_run
+            WHERE tenant_id = %s ORDER BY started_time DESC LIMIT 1
+        """, (tenant_id,))
+        row = cur.fetchone()
+        if row:
+            last_sync['last_run_status'] = row[0]
+        cur.execute("""
+            SELECT MAX(finished_time) FROM tmp_sync_run WHERE tenant_id = %s AND status = 'succeeded'
+        """, (tenant_id,))
+        last_sync['last_success_time'] = cur.fetchone()[0]
+    return last_sync
+
+
+def check_health(conn, tenant_id: str, exact: bool = False, max_age_hours: Optional[float] = None,
+                 statement_timeout_ms: int = DEFAULT_STATEMENT_TIMEOUT_MS) -> Dict:
+    """
+    检查临时库的健康状态
+
+    Args:
+        conn: psycopg2 连接
+        tenant_id: 租户ID
+        exact: 是否统计租户在每张表中的精确行数（COUNT(*)，大租户较慢，不受语句超时限制）
+        max_age_hours: 最近一次同步距今超过该小时数时视为不健康，None 表示不检查
+        statement_timeout_ms: 目录查询的语句超时（毫秒）
+
+    Returns:
+        {'healthy': bool, 'problems': [...], 'tables': {...}, 'last_sync': {...}}
+    """
+    problems = []
+    cur = conn.cursor()
+    try:
+        cur.execute("SET LOCAL statement_timeout = %s", (statement_timeout_ms,))
+        tables = _table_stats(cur, REQUIRED_TABLES + OPTIONAL_TABLES)
+        for table, indexes in _index_validity(cur, list(tables)).items():
+            tables[table]['indexes'] = indexes
+        last_sync = _last_sync(cur, tenant_id, tables)
+        if exact:
+            cur.execute("SET LOCAL statement_timeout = 0")
+            for table, stats in tables.items():
+                if stats['exists'] and table in REQUIRED_TABLES:
+                    cur.execute(f"SELECT COUNT(*) FROM {table} WHERE tenant_id = %s", (tenant_id,))
+                    stats['exact_rows'] = cur.fetchone()[0]
+    finally:
+        conn.rollback()
+
+    for table in REQUIRED_TABLES:
+        if not tables[table]['exists']:
+            problems.append(f"{table} 不存在")
+    for table, stats in tables.items():
+        for index in stats['indexes']:
+            if not index['valid'] or not index['ready']:
+                problems.append(f"{table} 的索引 {index['name']} 无效（需要 REINDEX 或重新创建）")
+    if max_age_hours:
+        last_time = max(filter(None, (last_sync['last_success_time'], last_sync['generation_time'])), default=None)
+        if last_time is None:
+            problems.append("没有成功同步的记录")
+        elif datetime.now() - last_time > timedelta(hours=max_age_hours):
+            problems.append(f"最近一次成功同步在 {last_time:%Y-%m-%d %H:%M}，已超过 {max_age_hours:g} 小时")
+
+    return {'healthy': not problems, 'problems': problems, 'tables': tables, 'last_sync': last_sync}
+
+
+def format_report(report: Dict) -> str:
+    """将健康检查结果格式化为文本"""
+    lines = []
+    for table, stats in report['tables'].items():
+        if not stats['exists']:
+            lines.append(f"  {'✗' if table in REQUIRED_TABLES else '-'} {table} - 不存在")
+            continue
+        estimated = stats['estimated_rows']
+        rows = f"约 {estimated} 条" if estimated is not None else "尚未 ANALYZE"
+        if 'exact_rows' in stats:
+            rows += f"，当前租户 {stats['exact_rows']} 条"
+        invalid = [index['name'] for index in stats['indexes'] if not index['valid'] or not index['ready']]
+        index_text = f"，无效索引: {', '.join(invalid)}" if invalid else f"，索引 {len(stats['indexes'])} 个有效"
+        lines.append(f"  ✓ {table} - 存在（{rows}{index_text}）")
+    last_sync = report['last_sync']
+    if last_sync['generation'] is not None:
+        lines.append(f"同步版本号: {last_sync['generation']}（{last_sync['generation_time']:%Y-%m-%d %H:%M:%S}）")
+    if last_sync['last_success_time'] is not None:
+        lines.append(f"最近一次成功同步: {last_sync['last_success_time']:%Y-%m-%d %H:%M:%S}"
+                     f"（最近一次运行状态: {last_sync['last_run_status']}）")
+    for problem in report['problems']:
+        lines.append(f"✗ {problem}")
+    lines.append("✓ 健康" if report['healthy'] else "✗ 不健康")
+    return '\n'.join(lines)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    import psycopg2
+    from dotenv import load_dotenv
+
+    from db_utils import get_tmp_db_config
+
+    load_dotenv()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='临时库健康检查（只读取系统目录，适合作为就绪探针）')
+    parser.add_argument('--exact', action='store_true', help='统计当前租户在每张表中的精确行数（COUNT(*)，较慢）')
+    parser.add_argument('--max-age-hours', type=float,
+                        help='最近一次成功同步距今超过该小时数时视为不健康（默认读取环境变量 HEALTH_MAX_SYNC_AGE_HOURS）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    parser.add_argument('--tenant-id', type=str, help='租户ID（默认读取环境变量 TENANT_ID）')
+    args = parser.parse_args()
+
+    tenant_id = args.tenant_id or os.getenv('TENANT_ID', '0')
+    max_age_hours = args.max_age_hours
+    if max_age_hours is None:
+        max_age_hours = float(os.getenv('HEALTH_MAX_SYNC_AGE_HOURS', '0')) or None
+
+    try:
+        conn = psycopg2.connect(connect_timeout=5, **get_tmp_db_config())
+    except psycopg2.OperationalError as e:
+        print(f"✗ 数据库连接失败: {e}")
+        sys.exit(1)
+    try:
+        report = check_health(conn, tenant_id, exact=args.exact, max_age_hours=max_age_hours)
+    except Exception as e:
+        print(f"✗ 健康检查失败: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    else:
+        print(format_report(report))
+    sys.exit(0 if report['healthy'] else 1)
+
+
+if __name__ == "__main__":
+    main()
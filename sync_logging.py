@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+同步脚本的日志工具
+
+- setup_logging: 通过 QueueHandler/QueueListener 异步写日志，调用方只需把日志记录放入队列
+- ErrorAggregator: 按错误类别汇总计数，只保留有限条示例，避免在坏数据上逐行输出大量日志
+- ProgressReporter: 按时间间隔输出进度，而不是每处理N条输出一次
+"""
+
+import sys
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from typing import Callable, Dict, List, Optional, Union
+
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 单条错误示例的最大长度
+MAX_SAMPLE_LENGTH = 500
+
+_listener = None
+
+
+def setup_logging(log_file: str, level: int = logging.INFO) -> Optional[logging.handlers.QueueListener]:
+    """
+    配置根日志记录器：日志记录先进入内存队列，由后台线程写入文件和标准输出
+
+    与 logging.basicConfig 一样，根日志记录器已有处理器时不做任何修改。
+
+    Args:
+        log_file: 日志文件路径
+        level: 日志级别
+
+    Returns:
+        后台写日志的 QueueListener，根日志记录器已配置时返回 None
+    """
+    global _listener
+
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    stream_handler = logging.StreamHandler(sys.stdout)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # 进程退出前写完队列中剩余的日志
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """停止后台写日志线程，并写完队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class ErrorAggregator:
+    """
+    按错误类别汇总的错误记录器
+
+    每个类别只在前 max_samples 次出现时格式化并保存示例，其余只计数，
+    因此无论输入数据有多少坏行，日志开销都是固定的。
+    """
+
+    def __init__(self, name: str, logger: logging.Logger, max_samples: int = 5):
+        """
+        Args:
+            name: 汇总名称（例如"用户同步"），用于输出
+            logger: 输出汇总结果的日志记录器
+            max_samples: 每个类别保留的示例数量
+        """
+        self.name = name
+        self.logger = logger
+        self.max_samples = max_samples
+        self.counts: Dict[str, int] = {}
+        self.samples: Dict[str, List[str]] = {}
+
+    def record(self, category: str, detail: Union[str, Callable[[], str]] = '', exc: Optional[BaseException] = None):
+        """
+        记录一次错误
+
+        Args:
+            category: 错误类别，例如 'invalid_user' 或异常类名
+            detail: 错误详情，可以传入函数，只有需要保存示例时才会调用以生成字符串
+            exc: 异常对象，未指定类别时使用异常类名
+        """
+        count = self.counts.get(category, 0) + 1
+        self.counts[category] = count
+        if count <= self.max_samples:
+            text = detail() if callable(detail) else detail
+            if exc is not None:
+                text = f"{text}: {exc}" if text else str(exc)
+            if len(text) > MAX_SAMPLE_LENGTH:
+                text = text[:MAX_SAMPLE_LENGTH] + '...'
+            self.samples.setdefault(category, []).append(text)
+            # 首次出现的类别立即输出，方便实时发现问题
+            if count == 1:
+                self.logger.warning(f"{self.name}出现错误 [{category}]: {text}")
+
+    def record_exception(self, exc: BaseException, detail: Union[str, Callable[[], str]] = ''):
+        """按异常类名记录一次错误"""
+        self.record(type(exc).__name__, detail, exc)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def log_summary(self):
+        """输出各类别的错误数量和示例"""
+        if not self.counts:
+            return
+        self.logger.error(f"{self.name}错误汇总: 共 {self.total} 条 - " +
+                          ', '.join(f"{category}: {count}" for category, count in self.counts.items()))
+        for category, samples in self.samples.items():
+            for sample in samples:
+                self.logger.error(f"  [{category}] {sample}")
+
+
+class ProgressReporter:
+    """按时间间隔输出处理进度"""
+
+    def __init__(self, label: str, logger: logging.Logger, total: Optional[int] = None,
+                 interval_seconds: float = 10.0):
+        """
+        Args:
+            label: 进度描述，例如"同步组织"
+            logger: 输出进度的日志记录器
+            total: 总数，未知时为 None
+            interval_seconds: 两次输出之间的最小间隔
+        """
+        self.label = label
+        self.logger = logger
+        self.total = total
+        self.interval_seconds = interval_seconds
+        self.count = 0
+        self._start = time.monotonic()
+        self._last_report = self._start
+
+    def update(self, n: int = 1, extra: Union[str, Callable[[], str]] = ''):
+        """累加进度，距离上次输出超过间隔时输出一次"""
+        self.count += n
+        now = time.monotonic()
+        if now - self._last_report >= self.interval_seconds:
+            self._last_report = now
+            self._report(now, extra() if callable(extra) else extra)
+
+    def done(self, extra: str = ''):
+        """输出最终进度"""
+        self._report(time.monotonic(), extra)
+
+    def _report(self, now: float, extra: str):
+        elapsed = now - self._start
+        rate = self.count / elapsed if elapsed > 0 else 0
+        total = f"/{self.total}" if self.total is not None else ''
+        suffix = f"，{extra}" if extra else ''
+        self.logger.info(f"{self.label}: 已处理 {self.count}{total}（{rate:.0f} 条/秒，耗时 {elapsed:.1f}s）{suffix}")
@@ -7,14 +7,43 @@
 
 import os
 import sys
+import json
+import asyncio
 import uuid
 import logging
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from idc_records import (
+    get_attr, get_value, get_user_id, normalize_user, normalize_org,
+    iter_user_org_ids, build_snapshot
+)
+from shadow_publish import ShadowTablePublisher
+from org_extract import extract_organizations
+from sync_planner import SyncPlanner, log_plan_report
+from reconcile import DEFAULT_BUCKETS, Reconciler, is_consistent, log_reconcile_report, snapshot_records
+from sync_logging import setup_logging, ErrorAggregator, ProgressReporter
+from sync_profiler import StageProfiler
+from user_sampling import StratifiedUserSampler
+from db_utils import get_tmp_db_config, get_sqlite_path
+from directory_lookup import bump_generation
+from directory_index import build_directory_index
+from change_notify import get_notify_channel, build_payload, send_change_notification
+from change_log import append_changes
+from idc_transport import install_transport
+from idc_fastpath import FastIdentityClient
+from storage import DB_BACKENDS, Psycopg2Storage, AsyncpgStorage, SqliteStorage
+from run_coordination import RunCoordinator, ON_CONFLICT_MODES
+from sync_state import (
+    FETCH_MODES, DEFAULT_FULL_INTERVAL_DAYS, DEFAULT_OVERLAP_MINUTES,
+    load_sync_state, save_sync_state, save_schedule_state, resolve_fetch_since,
+)
+from sync_scheduler import SyncDeadline, DeadlineExceeded, chunked, rotate_from
+from db_maintenance import run_maintenance
+
 # 加载环境变量
 load_dotenv()
 
@@ -26,52 +55,47 @@ except ImportError:
     print("错误: 请先安装 cqhyxk SDK: pip install cqhyxk")
     sys.exit(1)
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('sync_org.log', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# 配置日志（异步写入文件和标准输出）
+setup_logging('sync_org.log', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-
-def get_attr(obj, attr_name, default=None):
-    """
-    安全获取对象属性，支持对象和字典
-    """
-    if obj is None:
-        return default
-    if isinstance(obj, dict):
-        return obj.get(attr_name, default)
-    return getattr(obj, attr_name, default)
-
-
-def get_value(obj, default=None):
-    """
-    获取值，如果是枚举类型则获取其值
-    """
-    if obj is None:
-        return default
-    if hasattr(obj, 'value'):  # 枚举类型
-        return obj.value
-    return obj
+# 发布模式：incremental=逐行写入正式临时表，swap=加载影子表后原子切换
+PUBLISH_MODES = ('incremental', 'swap')
 
 
 class OrgSyncFromIDC:
     """从身份中台同步组织架构信息到临时数据库"""
     
-    def __init__(self, filter_org_names=None):
+    def __init__(self, filter_org_names=None, publish_mode=None, extract_workers=None, profiler=None,
+                 index_file=None, db_backend=None, sqlite_path=None, sample_size=None, fast_path=None,
+                 fetch_mode=None, time_budget_minutes=None, maintenance=None):
         """
         初始化配置
         
         Args:
             filter_org_names: 要过滤的组织名称列表，如果指定则只同步这些组织的用户
+            publish_mode: 发布模式（incremental/swap），默认读取环境变量 PUBLISH_MODE
+            extract_workers: 提取组织信息的进程数（0=自动），默认读取环境变量 ORG_EXTRACT_WORKERS
+            profiler: 分阶段性能分析器（StageProfiler），默认不启用
+            index_file: 同步完成后导出的目录索引文件路径，默认读取环境变量 DIRECTORY_INDEX_FILE（为空时不导出）
+            db_backend: 写入临时表使用的数据库后端（psycopg2/asyncpg/sqlite），默认读取环境变量 TMP_DB_BACKEND
+            sqlite_path: sqlite 后端的数据库文件路径，默认读取环境变量 TMP_DB_SQLITE_PATH
+            sample_size: 抽样模式，按组织分层抽取指定数量的用户进行同步（不标记删除），用于快速验证
+            fast_path: 是否使用原始JSON快速路径获取人员身份（跳过SDK模型构造），默认读取环境变量 IDC_FAST_PATH
+            fetch_mode: 获取模式（full/incremental），默认读取环境变量 SYNC_FETCH_MODE
+            time_budget_minutes: 时间预算（分钟），设置后按优先级分块写入，预算不足时延后剩余工作，
+                                 默认读取环境变量 SYNC_TIME_BUDGET_MINUTES（0=不限制）
+            maintenance: 同步完成后是否对有写入的表执行 ANALYZE 并按死元组阈值 VACUUM，
+                         默认读取环境变量 SYNC_MAINTENANCE
         """
         # 身份中台配置（从环境变量读取）
         self.idc_client = CqhyxkClient()
+        # 连接池、keep-alive、gzip 和请求计时（见 idc_transport）
+        self.idc_transport = install_transport(self.idc_client)
+        # 人员身份分页接口：SDK模型或原始JSON快速路径（见 idc_fastpath）
+        if fast_path is None:
+            fast_path = os.getenv('IDC_FAST_PATH', '0').strip().lower() in ('1', 'true', 'yes')
+        self.identity_client = (FastIdentityClient.wrap(self.idc_client) if fast_path else None) or self.idc_client
         
         # 租户ID（从环境变量读取）
         self.tenant_id = os.getenv('TENANT_ID', '0')
@@ -91,17 +115,94 @@ class OrgSyncFromIDC:
         if self.filter_org_names:
             logger.info(f"组织名称过滤已启用: {self.filter_org_names}")
         
+        # 发布模式（从环境变量读取或参数传入）
+        self.publish_mode = (publish_mode or os.getenv('PUBLISH_MODE', 'incremental')).strip().lower()
+        if self.publish_mode not in PUBLISH_MODES:
+            raise ValueError(f"不支持的发布模式: {self.publish_mode}，可选值: {', '.join(PUBLISH_MODES)}")
+        
+        # 抽样模式：只同步按组织分层抽取的部分用户
+        self.sample_size = sample_size or 0
+        if self.sample_size and self.publish_mode == 'swap':
+            raise ValueError("抽样模式不支持影子表发布模式（会替换掉未抽中的数据）")
+        if self.sample_size:
+            logger.info(f"抽样模式: 按组织分层抽取 {self.sample_size} 个用户")
+        
+        # 组织提取进程数（0表示根据用户数量和CPU核数自动选择）
+        self.extract_workers = extract_workers if extract_workers is not None else int(os.getenv('ORG_EXTRACT_WORKERS', '0'))
+        # 最近一次从用户信息中提取到的 (user_id, org_id) 关系，使用SDK组织列表时为None
+        self.extracted_relations = None
+        
+        # 分阶段性能分析（--profile）
+        self.profiler = profiler or StageProfiler(enabled=False)
+        
+        # 同步完成后导出的目录索引文件（供SSO工作进程通过mmap读取）
+        self.index_file = index_file or os.getenv('DIRECTORY_INDEX_FILE', '')
+        
+        # 本次同步各表的实际变更数量，用于发送变更通知
+        self.notify_channel = get_notify_channel()
+        self.reset_change_counts()
+        
+        # 变更日志（tmp_change_log）保留天数
+        self.change_log_retention_days = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', '7'))
+        
         # 临时数据库配置
-        self.tmp_db_config = {
-            "host": os.getenv('TMP_DB_HOST', 'localhost'),
-            "port": int(os.getenv('TMP_DB_PORT', '5432')),
-            "database": os.getenv('TMP_DB_NAME', 'tmp_sync_db'),
-            "user": os.getenv('TMP_DB_USER', 'tmp_user'),
-            "password": os.getenv('TMP_DB_PASSWORD', '')
-        }
+        self.tmp_db_config = get_tmp_db_config()
+        
+        # 当前持有的租户级运行锁（run_exclusive 设置），标记删除和发布前检查锁是否仍然有效
+        self.run_lock = None
+        
+        # 数据库写入后端：psycopg2（默认）、asyncpg（全量同步时数据写入与获取身份中台数据并行）
+        # 或 sqlite（写入本地 SQLite 文件，用于没有 PostgreSQL 的本地运行和测试）
+        self.db_backend = (db_backend or os.getenv('TMP_DB_BACKEND', 'psycopg2')).strip().lower()
+        if self.db_backend not in DB_BACKENDS:
+            raise ValueError(f"不支持的数据库后端: {self.db_backend}，可选值: {', '.join(DB_BACKENDS)}")
+        if self.db_backend != 'psycopg2' and self.publish_mode == 'swap':
+            raise ValueError("影子表发布模式只支持 psycopg2 数据库后端")
+        
+        # 获取模式：incremental 时只获取上次同步之后有更新的身份，按 FULL_SYNC_INTERVAL_DAYS 定期全量获取
+        self.fetch_mode = (fetch_mode or os.getenv('SYNC_FETCH_MODE', 'full')).strip().lower()
+        if self.fetch_mode not in FETCH_MODES:
+            raise ValueError(f"不支持的获取模式: {self.fetch_mode}，可选值: {', '.join(FETCH_MODES)}")
+        if self.fetch_mode == 'incremental':
+            if self.publish_mode == 'swap':
+                raise ValueError("增量获取不支持影子表发布模式（会替换掉未获取的数据）")
+            if self.db_backend == 'sqlite':
+                raise ValueError("增量获取只支持 PostgreSQL 数据库后端")
+            if self.sample_size:
+                raise ValueError("增量获取不支持抽样模式")
+        self.full_interval_days = float(os.getenv('FULL_SYNC_INTERVAL_DAYS', str(DEFAULT_FULL_INTERVAL_DAYS)))
+        self.overlap_minutes = float(os.getenv('INCREMENTAL_OVERLAP_MINUTES', str(DEFAULT_OVERLAP_MINUTES)))
+        self.update_time_format = os.getenv('IDC_UPDATE_TIME_FORMAT', '%Y-%m-%d %H:%M:%S')
+        
+        # 时间预算（见 sync_scheduler），每次 run() 开始时创建 SyncDeadline
+        if time_budget_minutes is None:
+            time_budget_minutes = float(os.getenv('SYNC_TIME_BUDGET_MINUTES', '0'))
+        self.time_budget_seconds = time_budget_minutes * 60
+        if self.time_budget_seconds and self.publish_mode == 'swap':
+            raise ValueError("影子表发布模式是原子切换，不支持时间预算")
+        self.deadline = None
+        self.last_deferred = []
+        
+        # 同步后的维护阶段（见 db_maintenance）
+        if maintenance is None:
+            maintenance = os.getenv('SYNC_MAINTENANCE', '0').strip().lower() in ('1', 'true', 'yes')
+        self.maintenance = maintenance
+        
+        if self.db_backend == 'sqlite':
+            self.sqlite_path = sqlite_path or get_sqlite_path()
+            self.storage = SqliteStorage(self.sqlite_path, self.tenant_id)
+        else:
+            self.storage = Psycopg2Storage(self.get_db_connection, self.tenant_id)
         
         logger.info(f"初始化完成 - 租户ID: {self.tenant_id}")
-        logger.info(f"临时数据库: {self.tmp_db_config['host']}:{self.tmp_db_config['port']}/{self.tmp_db_config['database']}")
+        if self.db_backend == 'sqlite':
+            logger.info(f"临时数据库: SQLite {self.sqlite_path}")
+        else:
+            logger.info(f"临时数据库: {self.tmp_db_config['host']}:{self.tmp_db_config['port']}/{self.tmp_db_config['database']}")
+        if self.publish_mode != 'incremental':
+            logger.info(f"发布模式: {self.publish_mode}")
+        if self.db_backend != 'psycopg2':
+            logger.info(f"数据库后端: {self.db_backend}")
     
     def _filter_users_by_org_name(self, users):
         """
@@ -163,45 +264,11 @@ class OrgSyncFromIDC:
         # 方案1: 尝试不传 sourceUserId，直接分页获取所有用户
         logger.info("尝试方案1: 不传 sourceUserId，直接分页获取所有用户...")
         try:
-            current_page = 0
-            while True:
-                # 不传 sourceUserId，尝试获取所有用户
-                request = IdentityPageRequest(
-                    current=current_page,
-                    size=page_size
-                    # 注意：不传 sourceUserId，如果API支持，应该返回所有用户
-                )
-                
-                response = self.idc_client.get_identity_list(request)
-                
-                if not response or not response.data:
-                    break
-                
-                # 根据API文档，响应结构：data.page（分页信息）、data.content（查询结果数组）
-                # API返回的是对象，不是字典
-                page_info = get_attr(response.data, 'page')
-                total_count = get_attr(page_info, 'total', 0) if page_info else 0
-                
-                # 获取用户列表
-                page_users = get_attr(response.data, 'content') or []
-                
-                if not page_users:
-                    break
-                
-                users.extend(page_users)
-                
-                logger.info(f"已获取 {len(users)}/{total_count} 个用户（第 {current_page + 1} 页，每页 {len(page_users)} 条）...")
-                
-                # 如果返回的数据少于page_size，说明已经是最后一页
-                if len(page_users) < page_size:
-                    break
-                
-                # 如果已经获取了所有数据
-                if total_count > 0 and len(users) >= total_count:
-                    break
-                
-                current_page += 1
-            
+            if self.sample_size:
+                users = self.sample_users_from_idc(self.sample_size, page_size)
+            else:
+                for page_users in self.iter_user_pages(page_size):
+                    users.extend(page_users)
             if users:
                 # 如果配置了组织名称过滤，进行过滤
                 if self.filter_org_names:
@@ -213,6 +280,8 @@ class OrgSyncFromIDC:
                     return users
             else:
                 logger.warning("方案1未获取到数据，尝试其他方案...")
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.warning(f"方案1失败: {e}")
             logger.info("提示：根据API文档，sourceUserId是非必填参数，如果仍然失败，请检查API配置或使用方案3配置USER_ID_LIST")
@@ -246,7 +315,7 @@ class OrgSyncFromIDC:
                             size=page_size,
                             sourceUserId=user_id
                         )
-                        response = self.idc_client.get_identity_list(request)
+                        response = self.identity_client.get_identity_list(request)
                         if response and response.data and response.data.content:
                             page_users = response.data.content
                             # 去重（避免重复添加）
@@ -282,7 +351,7 @@ class OrgSyncFromIDC:
                     size=page_size,
                     sourceUserId=sample_user_id
                 )
-                response = self.idc_client.get_identity_list(request)
+                response = self.identity_client.get_identity_list(request)
                 if response and response.data:
                     page_users = get_attr(response.data, 'content') or []
                     if page_users:
@@ -314,86 +383,186 @@ class OrgSyncFromIDC:
         logger.error(error_msg)
         raise Exception("无法获取用户信息，请检查配置或联系身份中台确认API使用方式")
     
+    def sample_users_from_idc(self, sample_size: int, page_size: int = 100) -> List:
+        """
+        逐页获取用户并按主组织分层抽样，所有组织的配额都已满后停止获取（见 user_sampling）
+        
+        Args:
+            sample_size: 抽取的用户数量
+            page_size: 每页大小
+        """
+        sampler = StratifiedUserSampler(sample_size)
+        stopped_early = False
+        for page_users in self.iter_user_pages(page_size):
+            sampler.add_page(self._filter_users_by_org_name(page_users))
+            if sampler.is_complete():
+                stopped_early = True
+                break
+        users = sampler.result()
+        logger.info(f"抽样完成: 读取 {sampler.pages} 页 {sampler.users_seen} 个用户，覆盖 {sampler.org_count} 个组织，"
+                    f"抽取 {len(users)} 个用户{'（所有组织配额已满，提前停止）' if stopped_early else ''}")
+        return users
+    
+    def iter_user_pages(self, page_size: int = 100, update_time_start: Optional[str] = None):
+        """
+        不传 sourceUserId，逐页获取所有用户（方案1），每次返回一页用户列表
+        
+        Args:
+            page_size: 每页大小
+            update_time_start: 只获取更新时间不早于该时间的用户（增量获取）
+            
+        Raises:
+            DeadlineExceeded: 设置了时间预算且剩余时间不够获取下一页
+        """
+        current_page = 0
+        fetched = 0
+        total_count = 0
+        progress = ProgressReporter("获取用户", logger)
+        transport_stats = self.idc_transport.snapshot() if self.idc_transport else None
+        while True:
+            # 不传 sourceUserId，尝试获取所有用户
+            request = IdentityPageRequest(
+                current=current_page,
+                size=page_size,
+                updateTimeStart=update_time_start
+                # 注意：不传 sourceUserId，如果API支持，应该返回所有用户
+            )
+            
+            if self.deadline is not None:
+                if not self.deadline.allows('fetch_users', page_size):
+                    pending = max(int(total_count or 0) - fetched, 0) or page_size
+                    self.deadline.defer('fetch_users', pending, fetched=fetched)
+                    raise DeadlineExceeded(f"获取用户超出时间预算（已获取 {fetched} 个用户）")
+                with self.deadline.measure('fetch_users', page_size):
+                    response = self.identity_client.get_identity_list(request)
+            else:
+                response = self.identity_client.get_identity_list(request)
+            
+            if not response or not response.data:
+                break
+            
+            # 根据API文档，响应结构：data.page（分页信息）、data.content（查询结果数组）
+            # API返回的是对象，不是字典
+            page_info = get_attr(response.data, 'page')
+            total_count = get_attr(page_info, 'total', 0) if page_info else 0
+            
+            # 获取用户列表
+            page_users = get_attr(response.data, 'content') or []
+            
+            if not page_users:
+                break
+            
+            fetched += len(page_users)
+            progress.total = total_count or None
+            progress.update(len(page_users), lambda: f"第 {current_page + 1} 页")
+            yield page_users
+            
+            # 如果返回的数据少于page_size，说明已经是最后一页
+            if len(page_users) < page_size:
+                break
+            
+            # 如果已经获取了所有数据
+            if total_count > 0 and fetched >= total_count:
+                break
+            
+            current_page += 1
+        
+        progress.done(f"共 {current_page + 1} 页")
+        if self.idc_transport:
+            self.idc_transport.log_summary("获取用户", since=transport_stats)
+    
     def sync_users(self, users: List[Dict]):
         """同步用户信息到临时表"""
         if not users:
             logger.warning("没有用户数据需要同步")
             return
         
-        conn = self.get_db_connection()
+        errors = ErrorAggregator("用户同步", logger)
+        # 解析用户数据（根据API文档：/open-api/member/identity/page）
+        rows = self._normalize_users(users, errors)
         try:
-            cur = conn.cursor()
-            success_count = 0
-            error_count = 0
-            
-            for user_data in users:
-                try:
-                    # 解析用户数据（根据API文档：/open-api/member/identity/page）
-                    # API返回的是IdentityInfo对象，不是字典
-                    # API返回字段：sourceUserId（学工号）、name（姓名）、mobile（手机号）、status（身份状态）
-                    user_id = str(get_attr(user_data, 'sourceUserId') or get_attr(user_data, 'userId') or get_attr(user_data, 'id') or '')
-                    user_name = str(get_attr(user_data, 'sourceUserId') or get_attr(user_data, 'userName') or get_attr(user_data, 'username') or '')
-                    display_name = str(get_attr(user_data, 'name') or get_attr(user_data, 'displayName') or user_name)
-                    email = str(get_attr(user_data, 'email') or get_attr(user_data, 'mail') or '')
-                    mobile = str(get_attr(user_data, 'mobile') or get_attr(user_data, 'phone') or get_attr(user_data, 'telephone') or '')
-                    # status: 1=正常, 2=数据源删除, 3=身份中台删除, 4=禁用, 5=失效, 6=回收站人员
-                    # status可能是枚举类型，需要获取其value
-                    api_status = get_value(get_attr(user_data, 'status', 1))
-                    status = 1 if api_status == 1 else 0  # 只有正常状态才启用
-                    
-                    if not user_id or not user_name:
-                        logger.warning(f"跳过无效用户数据: {user_data}")
-                        error_count += 1
-                        continue
-                    
-                    # 插入或更新用户表（根据组织架构同步对接指南的表结构）
-                    cur.execute("""
-                        INSERT INTO tmp_user
-                            (id, user_name, description, display_name, email, mobile,
-                             tenant_id, source, status, is_deleted, updated_time)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, 'CAS', %s, 0, NOW())
-                        ON CONFLICT (tenant_id, user_name)
-                        DO UPDATE SET
-                            display_name = EXCLUDED.display_name,
-                            description = EXCLUDED.description,
-                            email = EXCLUDED.email,
-                            mobile = EXCLUDED.mobile,
-                            status = EXCLUDED.status,
-                            is_deleted = 0,
-                            updated_time = NOW()
-                    """, (
-                        user_id,
-                        user_name,
-                        '',  # description字段，默认为空
-                        display_name,
-                        email or '',
-                        mobile or '',
-                        self.tenant_id,
-                        status
-                    ))
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"同步用户失败 {user_data}: {e}")
-                    error_count += 1
-            
-            conn.commit()
-            logger.info(f"用户同步完成 - 成功: {success_count}, 失败: {error_count}")
-            
+            counts = self.storage.upsert_users(rows, progress=ProgressReporter("同步用户", logger, total=len(rows)))
         except Exception as e:
-            conn.rollback()
             logger.error(f"用户同步过程出错: {e}")
             raise
-        finally:
-            conn.close()
+        
+        self._record_changes('tmp_user', **counts)
+        quarantined = self._record_quarantined(errors, 'tmp_user')
+        errors.log_summary()
+        logger.info(f"用户同步完成 - 成功: {len(rows) - quarantined}, 失败: {errors.total}, "
+                    f"新增: {counts['inserted']}, 更新: {counts['updated']}")
+    
+    def _record_quarantined(self, errors: ErrorAggregator, table: str, quarantined: Optional[List] = None) -> int:
+        """
+        将存储层隔离的坏行（写入失败，已记录到 tmp_sync_quarantine）计入错误汇总，返回行数
+        
+        quarantined 为空时使用 self.storage 最近一次写入隔离的坏行
+        """
+        if quarantined is None:
+            quarantined = getattr(self.storage, 'last_quarantined', None) or []
+        for row, error in quarantined:
+            errors.record('quarantined', lambda: f"写入 {table} 失败并已隔离 ID {str(row[0])[:64]}", exc=error)
+        return len(quarantined)
+    
+    def _normalize_users(self, users: List, errors: ErrorAggregator) -> List[Tuple]:
+        """将用户数据规范化为 tmp_user 行，按 user_name 去重（与 upsert 冲突键一致，后出现的为准）"""
+        rows = {}
+        for user_data in users:
+            try:
+                # API返回的是IdentityInfo对象，不是字典
+                row = normalize_user(user_data)
+            except Exception as e:
+                errors.record_exception(e, lambda: f"解析用户数据失败 {get_user_id(user_data)}")
+                continue
+            if row is None:
+                errors.record('invalid_user', lambda: f"跳过无效用户数据: {user_data}")
+                continue
+            rows[row[1]] = row
+        return list(rows.values())
+    
+    def _normalize_organizations(self, organizations: List, errors: ErrorAggregator) -> List[Tuple]:
+        """将组织数据规范化为 tmp_organization 行，按 org_code 去重"""
+        rows = {}
+        for org_data in organizations:
+            try:
+                # 确保正确提取组织信息（name为空时使用org_id作为名称）
+                row = normalize_org(org_data)
+            except Exception as e:
+                errors.record_exception(e, lambda: f"解析组织数据失败 {org_data}")
+                continue
+            if row is None:
+                errors.record('invalid_org', lambda: f"跳过无效组织数据: {org_data}")
+                continue
+            rows[row[2]] = row
+        return list(rows.values())
     
-    def get_organizations_from_idc(self) -> List[Dict]:
+    def _collect_relations(self, users: List, errors: Optional[ErrorAggregator] = None) -> set:
+        """收集用户的所有 (user_id, org_id) 关系（包括主组织和orgList中的所有组织）"""
+        desired = set()
+        for user_data in users:
+            try:
+                # 根据API文档，用户ID是sourceUserId（IdentityInfo对象）
+                user_id = get_user_id(user_data)
+                if not user_id:
+                    continue
+                for org_id in iter_user_org_ids(user_data):
+                    desired.add((user_id, org_id))
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors.record_exception(e, lambda: f"同步用户-组织关系失败 {user_data}")
+        return desired
+    
+    def get_organizations_from_idc(self, users: List = None) -> List[Dict]:
         """
         从身份中台获取组织架构信息
         优先使用 cqhyxk SDK 直接获取组织列表，如果不支持则从用户信息中提取
+        
+        Args:
+            users: 已获取的用户列表，传入时直接从中提取组织信息，避免重新获取所有用户
         """
         organizations = []
+        self.extracted_relations = None
         
         logger.info("开始从身份中台获取组织架构信息...")
         
@@ -420,66 +589,17 @@ class OrgSyncFromIDC:
             
             # 方案2: 从用户身份信息中提取组织信息（备用方案）
             logger.info("从用户身份信息中提取组织信息...")
-            users = self.get_all_users_from_idc()
+            if users is None:
+                users = self.get_all_users_from_idc()
             
             if not users:
                 logger.warning("没有获取到用户数据，无法提取组织信息")
                 return organizations
             
             logger.info(f"开始从 {len(users)} 个用户中提取组织信息...")
-            org_set = set()
-            processed_count = 0
-            
-            for user in users:
-                processed_count += 1
-                # 从用户信息中提取组织信息（根据API文档）
-                # API返回：orgList（所属组织信息数组）和 mainOrg（主组织）
-                # orgList内字段：orgId（组织编码）、orgName（组织名称）、sourceOrgId（组织原编码）
-                
-                # 提取主组织信息（mainOrg是MainOrgInfo对象）
-                main_org = get_attr(user, 'mainOrg')
-                if main_org:
-                    org_id = str(get_attr(main_org, 'orgId') or get_attr(main_org, 'sourceOrgId') or '')
-                    org_name = str(get_attr(main_org, 'orgName') or '')
-                    if org_id:
-                        org_key = (org_id, org_name, '')  # 主组织暂时没有父组织ID
-                        if org_key not in org_set:
-                            org_set.add(org_key)
-                            organizations.append({
-                                'id': org_id,
-                                'name': org_name or org_id,  # 确保orgName被正确存储到name字段
-                                'orgName': org_name,  # 同时保存原始orgName
-                                'org_code': org_id,
-                                'pid': ''  # 主组织的父组织ID需要从其他接口获取
-                            })
-                            logger.debug(f"添加主组织: {org_id} - {org_name}")
-                else:
-                    logger.debug(f"用户 {get_attr(user, 'sourceUserId')} 没有主组织信息")
-                
-                # 提取orgList中的所有组织信息（orgList是OrgInfo对象列表）
-                org_list = get_attr(user, 'orgList') or []
-                if isinstance(org_list, list) and len(org_list) > 0:
-                    for org in org_list:
-                        org_id = str(get_attr(org, 'orgId') or get_attr(org, 'sourceOrgId') or '')
-                        org_name = str(get_attr(org, 'orgName') or '')
-                        if org_id:
-                            org_key = (org_id, org_name, '')  # orgList中的组织暂时没有父组织ID
-                            if org_key not in org_set:
-                                org_set.add(org_key)
-                                organizations.append({
-                                    'id': org_id,
-                                    'name': org_name or org_id,  # 确保orgName被正确存储到name字段
-                                    'orgName': org_name,  # 同时保存原始orgName
-                                    'org_code': org_id,
-                                    'pid': ''  # 需要从组织架构接口获取父组织ID
-                                })
-                                logger.debug(f"添加组织: {org_id} - {org_name}")
-                else:
-                    logger.debug(f"用户 {get_attr(user, 'sourceUserId')} 的orgList为空或不是列表")
-                
-                # 每处理100个用户输出一次进度
-                if processed_count % 100 == 0:
-                    logger.info(f"已处理 {processed_count}/{len(users)} 个用户，提取到 {len(organizations)} 个组织...")
+            # 从用户信息中提取组织信息（根据API文档）
+            # API返回：orgList（所属组织信息数组）和 mainOrg（主组织）
+            organizations, self.extracted_relations = extract_organizations(users, workers=self.extract_workers)
             
             logger.info(f"从 {len(users)} 个用户信息中提取到 {len(organizations)} 个组织")
             
@@ -496,282 +616,893 @@ class OrgSyncFromIDC:
             return
         
         logger.info(f"开始同步 {len(organizations)} 个组织到临时表...")
-        conn = self.get_db_connection()
+        errors = ErrorAggregator("组织同步", logger)
+        rows = self._normalize_organizations(organizations, errors)
+        if not rows:
+            errors.log_summary()
+            logger.error(f"所有组织同步都失败了！请检查日志了解详情。")
+            logger.error("可能的原因：")
+            logger.error("1. 数据库连接问题")
+            logger.error("2. 表结构不匹配")
+            logger.error("3. 数据格式问题")
+            raise Exception(f"组织同步失败：成功 0，失败 {errors.total}")
+        
         try:
-            cur = conn.cursor()
-            success_count = 0
-            error_count = 0
-            
-            for idx, org_data in enumerate(organizations, 1):
-                try:
-                    # 确保正确提取组织信息
-                    org_id = str(org_data.get('id') if isinstance(org_data, dict) else get_attr(org_data, 'id') or '')
-                    # 优先使用orgName，如果没有则使用name
-                    org_name = str(org_data.get('name') if isinstance(org_data, dict) else get_attr(org_data, 'name') or 
-                                  org_data.get('orgName') if isinstance(org_data, dict) else get_attr(org_data, 'orgName') or '')
-                    org_code = str(org_data.get('org_code') if isinstance(org_data, dict) else get_attr(org_data, 'org_code') or org_id)
-                    pid = str(org_data.get('pid') if isinstance(org_data, dict) else get_attr(org_data, 'pid') or '')
-                    
-                    if not org_id:
-                        logger.warning(f"跳过无效组织数据: {org_data}")
-                        error_count += 1
-                        continue
-                    
-                    # 确保orgName不为空，如果为空则使用org_id
-                    if not org_name:
-                        org_name = org_id
-                        logger.warning(f"组织 {org_id} 的orgName为空，使用org_id作为名称")
-                    
-                    # 插入或更新组织表（name字段存储orgName）
-                    try:
-                        cur.execute("""
-                            INSERT INTO tmp_organization
-                                (id, name, org_code, tenant_id, pid, is_deleted, updated_time)
-                            VALUES (%s, %s, %s, %s, %s, 0, NOW())
-                            ON CONFLICT (tenant_id, org_code)
-                            DO UPDATE SET
-                                name = EXCLUDED.name,
-                                pid = EXCLUDED.pid,
-                                is_deleted = 0,
-                                updated_time = NOW()
-                        """, (
-                            org_id,
-                            org_name,  # 这里写入的是orgName
-                            org_code,
-                            self.tenant_id,
-                            pid
-                        ))
-                        success_count += 1
-                        
-                        # 每处理50个组织输出一次进度
-                        if idx % 50 == 0:
-                            logger.info(f"已同步 {idx}/{len(organizations)} 个组织...")
-                    except Exception as db_error:
-                        logger.error(f"插入组织数据失败 (org_id={org_id}, org_name={org_name}): {db_error}", exc_info=True)
-                        error_count += 1
-                        # 不抛出异常，继续处理下一个组织
-                        continue
-                    
-                except Exception as e:
-                    logger.error(f"同步组织失败 {org_data}: {e}", exc_info=True)
-                    error_count += 1
-                    continue
-            
-            conn.commit()
-            logger.info(f"组织同步完成 - 成功: {success_count}, 失败: {error_count}")
-            
-            if success_count == 0 and error_count > 0:
-                logger.error(f"所有组织同步都失败了！请检查日志了解详情。")
-                logger.error("可能的原因：")
-                logger.error("1. 数据库连接问题")
-                logger.error("2. 表结构不匹配")
-                logger.error("3. 数据格式问题")
-                raise Exception(f"组织同步失败：成功 {success_count}，失败 {error_count}")
-            
-            # 验证数据是否真的写入了
-            cur.execute("SELECT COUNT(*) FROM tmp_organization WHERE tenant_id = %s", (self.tenant_id,))
-            actual_count = cur.fetchone()[0]
-            logger.info(f"验证：数据库中实际有 {actual_count} 条组织记录（租户ID: {self.tenant_id}）")
-            
+            # name字段存储orgName
+            counts = self.storage.upsert_organizations(
+                rows, progress=ProgressReporter("同步组织", logger, total=len(rows)))
         except Exception as e:
-            conn.rollback()
             logger.error(f"组织同步过程出错: {e}", exc_info=True)
             raise
-        finally:
-            conn.close()
+        
+        self._record_changes('tmp_organization', **counts)
+        quarantined = self._record_quarantined(errors, 'tmp_organization')
+        errors.log_summary()
+        logger.info(f"组织同步完成 - 成功: {len(rows) - quarantined}, 失败: {errors.total}, "
+                    f"新增: {counts['inserted']}, 更新: {counts['updated']}")
+        
+        # 验证数据是否真的写入了（COUNT(*) 对大租户是全表扫描，只在调试日志级别执行，健康检查见 sync_health）
+        if logger.isEnabledFor(logging.DEBUG):
+            actual_count = self.storage.count_rows('tmp_organization')
+            logger.debug(f"验证：数据库中实际有 {actual_count} 条组织记录（租户ID: {self.tenant_id}）")
     
     def sync_user_org_relations(self, users: List[Dict]):
-        """同步用户-组织关系到临时表"""
+        """同步用户-组织关系到临时表（只写入新增的关系、删除已不存在的关系）"""
         if not users:
             logger.warning("没有用户数据，无法同步用户-组织关系")
             return
         
-        conn = self.get_db_connection()
+        errors = ErrorAggregator("用户-组织关系同步", logger)
+        desired = self._collect_relations(users, errors)
+        # 抽样模式下只比较抽中用户的关系，未抽中用户的关系保持不变
+        user_ids = [user_id for user_id in (get_user_id(u) for u in users) if user_id] if self.sample_size else None
         try:
-            cur = conn.cursor()
-            
-            # 先清空旧的关系数据
-            cur.execute(
-                "DELETE FROM tmp_org_user_relation WHERE tenant_id = %s",
-                (self.tenant_id,)
-            )
-            logger.info("已清空旧的用户-组织关系数据")
-            
-            success_count = 0
-            error_count = 0
-            
-            for user_data in users:
-                try:
-                    # 根据API文档，用户ID是sourceUserId（IdentityInfo对象）
-                    user_id = str(get_attr(user_data, 'sourceUserId') or get_attr(user_data, 'userId') or get_attr(user_data, 'id') or '')
-                    
-                    if not user_id:
-                        continue
-                    
-                    # 收集用户的所有组织ID（包括主组织和orgList中的所有组织）
-                    org_ids = set()
-                    
-                    # 添加主组织（mainOrg是MainOrgInfo对象）
-                    main_org = get_attr(user_data, 'mainOrg')
-                    if main_org:
-                        org_id = get_attr(main_org, 'orgId') or get_attr(main_org, 'sourceOrgId')
-                        if org_id:
-                            org_ids.add(str(org_id))
-                    
-                    # 添加orgList中的所有组织（orgList是OrgInfo对象列表）
-                    org_list = get_attr(user_data, 'orgList') or []
-                    if isinstance(org_list, list):
-                        for org in org_list:
-                            org_id = get_attr(org, 'orgId') or get_attr(org, 'sourceOrgId')
-                            if org_id:
-                                org_ids.add(str(org_id))
-                    
-                    # 为每个组织创建用户-组织关系
-                    for org_id in org_ids:
-                        try:
-                            cur.execute("""
-                                INSERT INTO tmp_org_user_relation
-                                    (id, org_id, user_id, tenant_id)
-                                VALUES (%s, %s, %s, %s)
-                                ON CONFLICT DO NOTHING
-                            """, (
-                                str(uuid.uuid4()),
-                                org_id,
-                                user_id,
-                                self.tenant_id
-                            ))
-                            success_count += 1
-                        except Exception as e:
-                            logger.warning(f"插入用户-组织关系失败 (user_id={user_id}, org_id={org_id}): {e}")
-                            error_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"同步用户-组织关系失败 {user_data}: {e}")
-                    error_count += 1
-            
-            conn.commit()
-            logger.info(f"用户-组织关系同步完成 - 成功: {success_count}, 失败: {error_count}")
-            
+            counts = self.storage.sync_relations(desired, user_ids=user_ids)
         except Exception as e:
-            conn.rollback()
             logger.error(f"用户-组织关系同步过程出错: {e}")
             raise
-        finally:
-            conn.close()
+        
+        self._record_changes('tmp_org_user_relation', **counts)
+        errors.log_summary()
+        logger.info(f"用户-组织关系同步完成 - 共: {len(desired)}, 新增: {counts['inserted']}, "
+                    f"删除: {counts['deleted']}, 失败: {errors.total}")
+    
+    def _check_run_lock(self):
+        """运行锁已丢失（被其他运行接管）时停止，避免两个同步交替标记删除和发布"""
+        if self.run_lock is not None:
+            self.run_lock.ensure_held()
     
     def mark_deleted_users(self, active_user_ids: List[str]):
         """标记已删除的用户"""
         if not active_user_ids:
             return
+        self._check_run_lock()
         
-        conn = self.get_db_connection()
         try:
-            cur = conn.cursor()
-            
             # 将不在活跃用户列表中的用户标记为已删除
-            cur.execute("""
-                UPDATE tmp_user
-                SET is_deleted = 1, updated_time = NOW()
-                WHERE tenant_id = %s AND id != ALL(%s)
-            """, (self.tenant_id, active_user_ids))
-            
-            deleted_count = cur.rowcount
-            conn.commit()
-            logger.info(f"标记删除用户数量: {deleted_count}")
-            
+            counts = self.storage.mark_missing_users_deleted(active_user_ids)
         except Exception as e:
-            conn.rollback()
             logger.error(f"标记删除用户过程出错: {e}")
             raise
-        finally:
-            conn.close()
+        self._record_changes('tmp_user', **counts)
+        logger.info(f"标记删除用户数量: {counts['deleted']}")
     
     def mark_deleted_organizations(self, active_org_ids: List[str]):
         """标记已删除的组织"""
         if not active_org_ids:
             return
+        self._check_run_lock()
+        
+        try:
+            # 将不在活跃组织列表中的组织标记为已删除
+            counts = self.storage.mark_missing_organizations_deleted(active_org_ids)
+        except Exception as e:
+            logger.error(f"标记删除组织过程出错: {e}")
+            raise
+        self._record_changes('tmp_organization', **counts)
+        logger.info(f"标记删除组织数量: {counts['deleted']}")
+    
+    def get_users_by_ids_from_idc(self, user_ids: List[str]) -> List:
+        """
+        按学工号（sourceUserId）从身份中台查询指定用户
         
+        Returns:
+            查询到的用户列表，身份中台中已不存在的用户不会出现在结果中
+        """
+        users = []
+        for user_id in user_ids:
+            request = IdentityPageRequest(current=0, size=10, sourceUserId=user_id)
+            response = self.identity_client.get_identity_list(request)
+            if response and response.data:
+                users.extend(get_attr(response.data, 'content') or [])
+        return users
+    
+    def replace_user_org_relations(self, users: List):
+        """
+        只替换指定用户的用户-组织关系（事件增量同步使用，不影响其他用户的关系）
+        """
+        user_ids = [user_id for user_id in (get_user_id(u) for u in users) if user_id]
+        if not user_ids:
+            return
+        
+        try:
+            counts = self.storage.sync_relations(self._collect_relations(users), user_ids=user_ids)
+        except Exception as e:
+            logger.error(f"替换用户-组织关系出错: {e}")
+            raise
+        self._record_changes('tmp_org_user_relation', **counts)
+        logger.info(f"已更新 {len(user_ids)} 个用户的用户-组织关系，新增 {counts['inserted']} 条，删除 {counts['deleted']} 条")
+    
+    def mark_users_deleted(self, user_ids: List[str]):
+        """将指定用户标记为已删除，并清除其用户-组织关系"""
+        if not user_ids:
+            return
+        
+        try:
+            counts = self.storage.mark_users_deleted(user_ids)
+        except Exception as e:
+            logger.error(f"标记删除用户过程出错: {e}")
+            raise
+        self._record_changes('tmp_user', deleted=counts['deleted'])
+        self._record_changes('tmp_org_user_relation', deleted=counts['relations_deleted'])
+        logger.info(f"标记删除用户数量: {counts['deleted']}")
+    
+    def mark_organizations_deleted(self, org_ids: List[str]):
+        """将指定组织标记为已删除"""
+        if not org_ids:
+            return
+        
+        try:
+            counts = self.storage.mark_organizations_deleted(org_ids)
+        except Exception as e:
+            logger.error(f"标记删除组织过程出错: {e}")
+            raise
+        self._record_changes('tmp_organization', **counts)
+        logger.info(f"标记删除组织数量: {counts['deleted']}")
+    
+    def _check_organizations(self, organizations: List[Dict], users: List):
+        """检查组织数据是否获取成功，失败时输出排查信息并终止同步"""
+        if not organizations:
+            logger.error("未获取到任何组织数据！")
+            logger.error("可能的原因：")
+            logger.error("1. 用户数据中没有组织信息（mainOrg和orgList都为空）")
+            logger.error("2. 组织提取逻辑有问题")
+            logger.error("3. 如果使用了FILTER_ORG_NAMES，可能过滤后没有匹配的组织")
+            logger.error("4. 用户数据为空，无法提取组织信息")
+            # 打印一些调试信息
+            if users:
+                sample_user = users[0] if len(users) > 0 else None
+                if sample_user:
+                    logger.info(f"示例用户数据结构: sourceUserId={get_attr(sample_user, 'sourceUserId')}")
+                    logger.info(f"示例用户 mainOrg: {get_attr(sample_user, 'mainOrg')}")
+                    logger.info(f"示例用户 orgList: {get_attr(sample_user, 'orgList')}")
+            raise Exception("未获取到组织数据，无法继续同步")
+        
+        logger.info(f"成功获取到 {len(organizations)} 个组织")
+        # 打印前几个组织的信息用于调试
+        if len(organizations) > 0:
+            logger.info(f"前3个组织示例: {organizations[:3]}")
+    
+    def reset_change_counts(self):
+        """清零各表的变更计数（每次同步或事件批次开始前调用）"""
+        self.change_counts = {table: {'inserted': 0, 'updated': 0, 'deleted': 0}
+                              for table in ('tmp_user', 'tmp_organization', 'tmp_org_user_relation')}
+        self.full_reload = False
+    
+    def _record_changes(self, table: str, **counts):
+        for change, count in counts.items():
+            self.change_counts[table][change] += count
+    
+    def has_changes(self) -> bool:
+        return self.full_reload or any(any(counts.values()) for counts in self.change_counts.values())
+    
+    def publish_change_notification(self) -> Optional[int]:
+        """
+        递增 tmp_sync_generation 中的同步版本号，并在同一事务中发送变更通知（NOTIFY）
+        
+        失败不影响已完成的同步，只记录警告（缓存会在过期后自动刷新）
+        
+        Returns:
+            新的同步版本号，失败或版本号表不存在时返回 None
+        """
         conn = self.get_db_connection()
         try:
+            generation = bump_generation(conn, self.tenant_id)
+            payload = build_payload(self.tenant_id, generation, self.change_counts, full_reload=self.full_reload)
             cur = conn.cursor()
+            send_change_notification(cur, self.notify_channel, payload)
+            conn.commit()
+            logger.info(f"同步版本号已更新: {generation}，已发送变更通知: {payload['tables']}")
+            return generation
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"更新同步版本号或发送变更通知失败: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    def append_reload_changes(self, tables: List[str]):
+        """整表替换后在变更日志中为每张表追加一条 reload 记录，增量消费者据此重新全量读取"""
+        conn = self.get_db_connection()
+        try:
+            cur = conn.cursor()
+            append_changes(cur, self.tenant_id, [(table, 'reload', '', None) for table in tables])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"写入变更日志失败: {e}")
+        finally:
+            conn.close()
+    
+    def prune_change_log(self):
+        """清理超过保留天数的变更日志"""
+        if self.change_log_retention_days <= 0:
+            return
+        try:
+            pruned = self.storage.prune_change_log(self.change_log_retention_days)
+            if pruned:
+                logger.info(f"已清理 {pruned} 条超过 {self.change_log_retention_days} 天的变更日志")
+        except Exception as e:
+            logger.warning(f"清理变更日志失败: {e}")
+    
+    def export_directory_index(self, generation: Optional[int] = None):
+        """
+        将临时表中的组织架构导出为目录索引文件（未配置 index_file 时不导出）
+        
+        导出失败不影响已完成的同步，读取方继续使用上一次的索引文件
+        """
+        if not self.index_file:
+            return
+        conn = self.get_db_connection()
+        try:
+            build_directory_index(conn, self.tenant_id, self.index_file, generation=generation)
+        except Exception as e:
+            logger.error(f"导出目录索引文件失败: {e}", exc_info=True)
+        finally:
+            conn.rollback()
+            conn.close()
+    
+    def finish_publish(self, export_index: bool = True):
+        """
+        数据发布完成后：数据有变化时递增同步版本号、发送变更通知并导出目录索引文件
+        
+        Args:
+            export_index: 是否导出目录索引文件（事件批次不导出，由下一次全量同步导出）
+        """
+        if self.db_backend == 'sqlite':
+            # 同步版本号、变更通知和目录索引依赖 PostgreSQL，本地 SQLite 运行时不发布
+            return
+        self._check_run_lock()
+        if not self.has_changes():
+            logger.info("本次同步没有数据变化，不发送变更通知")
+            if export_index and self.index_file and not os.path.exists(self.index_file):
+                self.export_directory_index()
+            return
+        generation = self.publish_change_notification()
+        if export_index:
+            with self.profiler.stage('export_index'):
+                self.export_directory_index(generation)
+    
+    def run_shadow_swap(self, users: List):
+        """
+        影子表发布模式：构建完整快照，加载到影子表后一次性原子切换
+        
+        同步过程中正式临时表保持上一次发布的完整状态，iam-adapter 不会读到半更新的数据
+        """
+        logger.info("\n[2/3] 从身份中台获取组织架构信息...")
+        with self.profiler.stage('fetch_organizations'):
+            organizations = self.get_organizations_from_idc(users=users)
+            self._check_organizations(organizations, users)
+        
+        logger.info("\n[3/3] 构建快照并通过影子表发布...")
+        with self.profiler.stage('build_snapshot'):
+            snapshot = build_snapshot(users, organizations, relations=self.extracted_relations)
+        logger.info(f"快照: 用户 {len(snapshot['users'])}, 组织 {len(snapshot['organizations'])}, "
+                    f"用户-组织关系 {len(snapshot['relations'])}")
+        counts = self._publish_shadow(snapshot)
+        self.finish_publish()
+        self.prune_change_log()
+        
+        logger.info("\n" + "=" * 50)
+        logger.info(f"同步完成（影子表发布）! 租户数据行数: {counts}")
+        logger.info("=" * 50)
+    
+    def _publish_shadow(self, snapshot: Dict[str, List[Tuple]]) -> Dict[str, int]:
+        """通过影子表发布快照，返回各表行数"""
+        self._check_run_lock()
+        with self.profiler.stage('shadow_publish'):
+            counts = ShadowTablePublisher(self.get_db_connection, self.tenant_id).publish(snapshot)
+        # 整表替换，通知下游全量重新加载
+        self.full_reload = True
+        self.change_counts = {table: {'rows': count} for table, count in counts.items()}
+        self.append_reload_changes(list(counts))
+        return counts
+    
+    def publish_snapshot(self, snapshot: Dict[str, List[Tuple]]):
+        """
+        发布已规范化的完整快照（如分布式获取合并后的数据），按发布模式写入临时表
+        
+        Args:
+            snapshot: 与 idc_records.build_snapshot 格式相同的快照
+        """
+        if not snapshot.get('users'):
+            raise Exception("快照中没有用户数据，拒绝发布（否则会将全部用户标记为删除）")
+        self.reset_change_counts()
+        if self.publish_mode == 'swap':
+            counts = self._publish_shadow(snapshot)
+        else:
+            with self.profiler.stage('sync_users'):
+                counts = self.storage.upsert_users(
+                    snapshot['users'], progress=ProgressReporter("同步用户", logger, total=len(snapshot['users'])))
+                self._record_changes('tmp_user', **counts)
+            with self.profiler.stage('sync_organizations'):
+                counts = self.storage.upsert_organizations(snapshot['organizations'])
+                self._record_changes('tmp_organization', **counts)
+            with self.profiler.stage('sync_relations'):
+                counts = self.storage.sync_relations({(user_id, org_id) for _, org_id, user_id in snapshot['relations']})
+                self._record_changes('tmp_org_user_relation', **counts)
+            with self.profiler.stage('mark_deleted'):
+                self.mark_deleted_users([row[0] for row in snapshot['users']])
+                self.mark_deleted_organizations([row[0] for row in snapshot['organizations']])
+            counts = self.change_counts
+        self.finish_publish()
+        self.prune_change_log()
+        logger.info(f"快照发布完成: {counts}")
+    
+    def plan(self, sample_size: int = 10) -> Dict[str, Dict]:
+        """
+        生成同步计划（dry-run）：获取身份中台数据并与临时表现有数据比较，不写入任何数据
+        
+        Args:
+            sample_size: 每类变更输出的示例数量
             
-            # 将不在活跃组织列表中的组织标记为已删除
-            cur.execute("""
-                UPDATE tmp_organization
-                SET is_deleted = 1, updated_time = NOW()
-                WHERE tenant_id = %s AND id != ALL(%s)
-            """, (self.tenant_id, active_org_ids))
+        Returns:
+            各表新增、更新、删除的数量及示例
+        """
+        if self.db_backend == 'sqlite':
+            raise ValueError("同步计划只支持 PostgreSQL 数据库后端")
+        if self.sample_size:
+            raise ValueError("同步计划不支持抽样模式（未抽中的数据会被统计为删除）")
+        logger.info("=" * 50)
+        logger.info("开始生成同步计划（dry-run）")
+        logger.info("=" * 50)
+        
+        logger.info("\n[1/3] 从身份中台获取用户信息...")
+        users = self.get_all_users_from_idc()
+        
+        logger.info("\n[2/3] 从身份中台获取组织架构信息...")
+        organizations = self.get_organizations_from_idc(users=users)
+        self._check_organizations(organizations, users)
+        
+        logger.info("\n[3/3] 与临时表现有数据进行比较...")
+        snapshot = build_snapshot(users, organizations, relations=self.extracted_relations)
+        report = SyncPlanner(self.get_db_connection, self.tenant_id, sample_size=sample_size).plan(snapshot)
+        log_plan_report(report)
+        return report
+    
+    def reconcile(self, buckets: Optional[int] = None, repair: bool = False, sample_size: int = 10) -> Dict[str, Dict]:
+        """
+        分桶摘要对账：比较身份中台与临时表，只读取摘要不同的桶中的记录（见 reconcile）
+        
+        Args:
+            buckets: 桶数，默认读取环境变量 RECONCILE_BUCKETS
+            repair: 是否只修复有差异的记录（写入缺失和不同的记录、软删除多余的记录、替换涉及用户的关系）
+            sample_size: 每类差异输出的示例数量
             
-            deleted_count = cur.rowcount
-            conn.commit()
-            logger.info(f"标记删除组织数量: {deleted_count}")
+        Returns:
+            各表的差异数量及示例
+        """
+        if self.db_backend == 'sqlite':
+            raise ValueError("对账只支持 PostgreSQL 数据库后端")
+        if self.sample_size:
+            raise ValueError("对账不支持抽样模式（未抽中的数据会被统计为多余）")
+        if buckets is None:
+            buckets = int(os.getenv('RECONCILE_BUCKETS', str(DEFAULT_BUCKETS)))
+        logger.info("=" * 50)
+        logger.info("开始对账（身份中台 vs 临时表）")
+        logger.info("=" * 50)
+        
+        logger.info("\n[1/3] 从身份中台获取用户信息...")
+        users = self.get_all_users_from_idc()
+        
+        logger.info("\n[2/3] 从身份中台获取组织架构信息...")
+        organizations = self.get_organizations_from_idc(users=users)
+        self._check_organizations(organizations, users)
+        
+        logger.info(f"\n[3/3] 比较 {buckets} 个桶的摘要...")
+        snapshot = build_snapshot(users, organizations, relations=self.extracted_relations)
+        reconciler = Reconciler(self.get_db_connection, self.tenant_id, buckets=buckets, sample_size=sample_size)
+        report = reconciler.compare(snapshot_records(snapshot))
+        log_reconcile_report(report)
+        
+        if repair and not is_consistent(report):
+            self.repair_differences(snapshot, reconciler.differences)
+        return report
+    
+    def repair_differences(self, snapshot: Dict[str, List[Tuple]], differences: Dict[str, Dict[str, List]]):
+        """只写入对账发现的差异记录，然后发送变更通知"""
+        logger.info("\n修复对账差异...")
+        self.reset_change_counts()
+        
+        users = differences['tmp_user']
+        user_rows = {row[0]: row for row in snapshot['users']}
+        rows = [user_rows[record[0]] for record in users['missing']] + \
+               [user_rows[record[0]] for record, _ in users['changed']]
+        if rows:
+            self._record_changes('tmp_user', **self.storage.upsert_users(rows))
+        if users['extra']:
+            counts = self.storage.mark_users_deleted([record[0] for record in users['extra']])
+            self._record_changes('tmp_user', deleted=counts['deleted'])
+            self._record_changes('tmp_org_user_relation', deleted=counts['relations_deleted'])
+        
+        orgs = differences['tmp_organization']
+        org_rows = {row[0]: row for row in snapshot['organizations']}
+        rows = [org_rows[record[0]] for record in orgs['missing']] + \
+               [org_rows[record[0]] for record, _ in orgs['changed']]
+        if rows:
+            self._record_changes('tmp_organization', **self.storage.upsert_organizations(rows))
+        if orgs['extra']:
+            self._record_changes('tmp_organization',
+                                 **self.storage.mark_organizations_deleted([record[0] for record in orgs['extra']]))
+        
+        relations = differences['tmp_org_user_relation']
+        user_ids = sorted({user_id for user_id, _ in relations['missing'] + relations['extra']})
+        if user_ids:
+            wanted = set(user_ids)
+            desired = {(user_id, org_id) for _, org_id, user_id in snapshot['relations'] if user_id in wanted}
+            self._record_changes('tmp_org_user_relation', **self.storage.sync_relations(desired, user_ids=user_ids))
+        
+        logger.info(f"对账修复完成: {self.change_counts}")
+        self.finish_publish()
+    
+    async def run_async(self):
+        """
+        使用 asyncpg 后端执行全量同步的数据写入部分
+        
+        在线程池中逐页调用SDK获取用户，每获取一页就在事件循环中发起写入，
+        获取下一页的同时上一页已在写入临时表。
+        """
+        storage = AsyncpgStorage(self.tmp_db_config, self.tenant_id)
+        await storage.open()
+        try:
+            loop = asyncio.get_running_loop()
+            
+            logger.info("\n[1/4] 从身份中台获取用户信息并写入临时表...")
+            users = []
+            seen_user_names = set()
+            late_rows = {}
+            writes = []
+            errors = ErrorAggregator("用户同步", logger)
+            progress = ProgressReporter("同步用户", logger)
+            pages = self.iter_user_pages()
+            try:
+                while True:
+                    page = await loop.run_in_executor(None, next, pages, None)
+                    if page is None:
+                        break
+                    if self.filter_org_names:
+                        page = self._filter_users_by_org_name(page)
+                    users.extend(page)
+                    rows = []
+                    for row in self._normalize_users(page, errors):
+                        # 跨页重复的用户名推迟到最后写入，保证以后出现的数据为准
+                        if row[1] in seen_user_names:
+                            late_rows[row[1]] = row
+                        else:
+                            seen_user_names.add(row[1])
+                            rows.append(row)
+                    if rows:
+                        writes.append(asyncio.ensure_future(storage.upsert_users(rows, progress=progress)))
+            except Exception as e:
+                logger.warning(f"方案1失败: {e}")
+                users = []
+            
+            if not users:
+                # 分页获取失败时回退到其他获取方案，获取完成后一次性写入
+                users = await loop.run_in_executor(None, self.get_all_users_from_idc)
+                late_rows = {row[1]: row for row in self._normalize_users(users, errors)}
+            
+            user_counts = {'inserted': 0, 'updated': 0}
+            for counts in await asyncio.gather(*writes):
+                for key, value in counts.items():
+                    user_counts[key] += value
+            if late_rows:
+                for key, value in (await storage.upsert_users(list(late_rows.values()), progress=progress)).items():
+                    user_counts[key] += value
+            progress.done()
+            self._record_changes('tmp_user', **user_counts)
+            self._record_quarantined(errors, 'tmp_user', storage.quarantined['tmp_user'])
+            errors.log_summary()
+            logger.info(f"用户同步完成 - 共: {len(users)}, 失败: {errors.total}, "
+                        f"新增: {user_counts['inserted']}, 更新: {user_counts['updated']}")
             
+            logger.info("\n[2/4] 从身份中台获取组织架构信息并写入临时表...")
+            organizations = await loop.run_in_executor(None, lambda: self.get_organizations_from_idc(users=users))
+            self._check_organizations(organizations, users)
+            org_errors = ErrorAggregator("组织同步", logger)
+            org_rows = self._normalize_organizations(organizations, org_errors)
+            org_counts = await storage.upsert_organizations(org_rows)
+            self._record_changes('tmp_organization', **org_counts)
+            org_quarantined = self._record_quarantined(org_errors, 'tmp_organization', storage.quarantined['tmp_organization'])
+            org_errors.log_summary()
+            logger.info(f"组织同步完成 - 成功: {len(org_rows) - org_quarantined}, 失败: {org_errors.total}, "
+                        f"新增: {org_counts['inserted']}, 更新: {org_counts['updated']}")
+            
+            logger.info("\n[3/4] 同步用户-组织关系到临时表...")
+            relation_errors = ErrorAggregator("用户-组织关系同步", logger)
+            desired = self._collect_relations(users, relation_errors)
+            relation_counts = await storage.sync_relations(desired)
+            self._record_changes('tmp_org_user_relation', **relation_counts)
+            relation_errors.log_summary()
+            logger.info(f"用户-组织关系同步完成 - 共: {len(desired)}, 新增: {relation_counts['inserted']}, "
+                        f"删除: {relation_counts['deleted']}")
+            
+            logger.info("\n[4/4] 标记已删除的用户和组织...")
+            active_user_ids = [user_id for user_id in (get_user_id(u) for u in users) if user_id]
+            active_org_ids = [row[0] for row in org_rows]
+            self._check_run_lock()
+            user_deleted, org_deleted = await asyncio.gather(
+                storage.mark_missing_users_deleted(active_user_ids),
+                storage.mark_missing_organizations_deleted(active_org_ids))
+            self._record_changes('tmp_user', **user_deleted)
+            self._record_changes('tmp_organization', **org_deleted)
+            logger.info(f"标记删除用户数量: {user_deleted['deleted']}, 标记删除组织数量: {org_deleted['deleted']}")
+        finally:
+            await storage.close()
+    
+    def _incremental_since(self) -> Optional[datetime]:
+        """增量获取模式下确定本次获取的起始时间，需要全量获取时返回 None"""
+        if self.fetch_mode != 'incremental':
+            return None
+        conn = self.get_db_connection()
+        try:
+            state = load_sync_state(conn, self.tenant_id)
+        finally:
+            conn.close()
+        since, reason = resolve_fetch_since(state, self.full_interval_days, self.overlap_minutes)
+        if since is None:
+            logger.info(f"增量获取模式: {reason}，本次执行全量获取")
+        else:
+            logger.info(f"增量获取模式: {reason}")
+        return since
+    
+    def _save_sync_state(self, fetch_started: datetime, full: bool):
+        """成功同步后保存高水位（抽样模式和 SQLite 后端不保存），失败只记录警告，下次按上一次的高水位获取"""
+        if self.sample_size or self.db_backend == 'sqlite':
+            return
+        conn = self.get_db_connection()
+        try:
+            if save_sync_state(conn, self.tenant_id, fetch_started, full):
+                conn.commit()
+                logger.info(f"同步高水位已更新: {fetch_started:%Y-%m-%d %H:%M:%S}{'（全量）' if full else ''}")
         except Exception as e:
             conn.rollback()
-            logger.error(f"标记删除组织过程出错: {e}")
-            raise
+            logger.warning(f"保存同步高水位失败: {e}")
         finally:
             conn.close()
     
+    def get_changed_users_from_idc(self, since: datetime, page_size: int = 100) -> List:
+        """获取更新时间不早于 since 的用户"""
+        users = []
+        for page_users in self.iter_user_pages(page_size, update_time_start=since.strftime(self.update_time_format)):
+            users.extend(page_users)
+        if self.filter_org_names:
+            users = self._filter_users_by_org_name(users)
+        return users
+    
+    def run_incremental(self, users: List):
+        """
+        只写入有更新的用户：更新用户、替换这些用户的组织关系并写入涉及的组织
+        
+        不标记删除（未出现在增量结果中的数据不代表已删除），身份中台中被删除的数据由定期全量获取处理
+        """
+        logger.info(f"\n[2/3] 同步 {len(users)} 个有更新的用户...")
+        if users:
+            with self.profiler.stage('sync_users'):
+                self.sync_users(users)
+            logger.info("\n[3/3] 同步涉及的组织和用户-组织关系...")
+            with self.profiler.stage('sync_organizations'):
+                organizations = self.get_organizations_from_idc(users=users)
+                if organizations:
+                    self.sync_organizations(organizations)
+            with self.profiler.stage('sync_relations'):
+                self.replace_user_org_relations(users)
+        self.finish_publish()
+        self.prune_change_log()
+    
+    def _start_deadline(self):
+        """设置了时间预算时创建本次运行的 SyncDeadline，使用上一次保存的阶段速率"""
+        self.deadline = None
+        self.last_deferred = []
+        if not self.time_budget_seconds:
+            return
+        state = None
+        if self.db_backend != 'sqlite':
+            conn = self.get_db_connection()
+            try:
+                state = load_sync_state(conn, self.tenant_id)
+            except Exception as e:
+                logger.warning(f"读取同步状态失败: {e}")
+            finally:
+                conn.close()
+        state = state or {}
+        self.last_deferred = state.get('deferred') or []
+        if self.last_deferred:
+            logger.warning("上一次同步延后的工作: " + ', '.join(
+                f"{item['stage']}（{item['pending']} 项）" for item in self.last_deferred) + "，本次优先继续")
+        self.deadline = SyncDeadline(self.time_budget_seconds, prior_rates=state.get('stage_rates'))
+        logger.info(f"时间预算: {self.time_budget_seconds / 60:g} 分钟")
+    
+    def _finish_run(self, fetch_started: datetime, full: bool, deferred: List[Dict]):
+        """保存调度状态；有延后的工作时不更新高水位，下一次仍从本次的起点获取"""
+        if self.deadline is not None:
+            self.deadline.log_summary()
+            if self.db_backend != 'sqlite':
+                conn = self.get_db_connection()
+                try:
+                    if save_schedule_state(conn, self.tenant_id, self.deadline.rates(), deferred):
+                        conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    logger.warning(f"保存调度状态失败: {e}")
+                finally:
+                    conn.close()
+        if deferred:
+            logger.warning("本次同步有延后的工作，不更新同步高水位")
+        else:
+            self._save_sync_state(fetch_started, full)
+    
+    def run_scheduled(self, users: List, full: bool) -> List[Dict]:
+        """
+        按时间预算和优先级写入（见 sync_scheduler）：用户（非正常状态优先）、标记删除、组织、用户-组织关系
+        
+        Args:
+            users: 本次获取的用户
+            full: 是否为完整的用户列表（增量获取、抽样时为 False，不标记删除、不清除其他用户的关系）
+            
+        Returns:
+            延后到下一次运行的工作
+        """
+        deadline = self.deadline
+        resume = {item['stage']: item for item in self.last_deferred}
+        if users:
+            logger.info("\n[3/7] 从身份中台获取组织架构信息...")
+            with self.profiler.stage('fetch_organizations'), deadline.measure('fetch_organizations'):
+                organizations = self.get_organizations_from_idc(users=users)
+                if full:
+                    self._check_organizations(organizations, users)
+            
+            # 禁用、删除等状态变化最先写入
+            errors = ErrorAggregator("用户同步", logger)
+            user_rows = self._normalize_users(users, errors)
+            user_rows.sort(key=lambda row: row[5] == 1)
+            logger.info(f"\n[4/7] 同步 {len(user_rows)} 个用户（非正常状态优先）...")
+            
+            def write_users(chunk):
+                self._record_changes('tmp_user', **self.storage.upsert_users(chunk))
+            
+            with self.profiler.stage('sync_users'):
+                deadline.run_chunks('sync_users', chunked(user_rows), write_users)
+            errors.log_summary()
+            
+            org_errors = ErrorAggregator("组织同步", logger)
+            org_rows = self._normalize_organizations(organizations, org_errors)
+            if full:
+                logger.info("\n[5/7] 标记已删除的用户和组织...")
+                if deadline.allows('mark_deleted'):
+                    with self.profiler.stage('mark_deleted'), deadline.measure('mark_deleted'):
+                        self.mark_deleted_users([row[0] for row in user_rows])
+                        self.mark_deleted_organizations([row[0] for row in org_rows])
+                else:
+                    deadline.defer('mark_deleted', 1)
+            
+            logger.info("\n[6/7] 同步组织...")
+            if org_rows:
+                if deadline.allows('sync_organizations', len(org_rows)):
+                    with self.profiler.stage('sync_organizations'), deadline.measure('sync_organizations', len(org_rows)):
+                        self._record_changes('tmp_organization', **self.storage.upsert_organizations(org_rows))
+                else:
+                    deadline.defer('sync_organizations', len(org_rows))
+            org_errors.log_summary()
+            
+            # 按用户分块替换关系，每块一个事务；从上一次延后的位置开始
+            logger.info("\n[7/7] 同步用户-组织关系（按用户分块）...")
+            desired_by_user = {}
+            for user_id, org_id in self._collect_relations(users):
+                desired_by_user.setdefault(user_id, set()).add((user_id, org_id))
+            relation_user_ids = {row[0] for row in user_rows} | set(desired_by_user)
+            if full:
+                # 已不在身份中台中的用户的关系也需要清除
+                relation_user_ids |= self.storage.relation_user_ids()
+            ordered = rotate_from(sorted(relation_user_ids), resume.get('sync_relations', {}).get('next_user_id'))
+            
+            def write_relations(chunk):
+                desired = set()
+                for user_id in chunk:
+                    desired |= desired_by_user.get(user_id, set())
+                self._record_changes('tmp_org_user_relation', **self.storage.sync_relations(desired, user_ids=chunk))
+            
+            with self.profiler.stage('sync_relations'):
+                deadline.run_chunks('sync_relations', chunked(ordered), write_relations,
+                                    detail=lambda chunk: {'next_user_id': chunk[0]})
+        
+        # 发布已写入的部分：每块都已完整提交，下游看到的是一致的状态
+        self.finish_publish()
+        if deadline.allows('prune_change_log'):
+            with deadline.measure('prune_change_log'):
+                self.prune_change_log()
+        return deadline.deferred
+    
+    def run_exclusive(self, on_conflict: str = 'exit', wait_timeout_seconds: float = 3600, target=None) -> bool:
+        """
+        持有租户级运行锁执行同步，同一租户同一时间只有一个全量同步在写入
+        
+        Args:
+            on_conflict: 已有同步在运行时的处理方式：exit=跳过本次，wait=等待其结束
+                         （等待期间已有新的同步成功完成时同样跳过）
+            wait_timeout_seconds: wait 模式下的最长等待时间（秒）
+            target: 持有锁时执行的函数，默认为 self.run
+            
+        Returns:
+            是否执行了同步（因重叠跳过时返回False）
+        """
+        target = target or self.run
+        if self.db_backend == 'sqlite':
+            # 本地 SQLite 文件不会被多个定时任务共享
+            target()
+            return True
+        coordinator = RunCoordinator(self.get_db_connection, self.tenant_id, on_conflict=on_conflict,
+                                     wait_timeout_seconds=wait_timeout_seconds)
+        with coordinator:
+            if not coordinator.acquired:
+                return False
+            self.run_lock = coordinator
+            try:
+                target()
+            finally:
+                self.run_lock = None
+        return True
+    
+    def run_maintenance(self):
+        """
+        对本次有写入的表执行 ANALYZE，死元组超过阈值时 VACUUM，并记录统计历史（见 db_maintenance）
+        
+        SQLite 后端、没有数据变化或时间预算已用完时跳过
+        """
+        if self.db_backend == 'sqlite':
+            logger.info("SQLite 后端，跳过维护")
+            return
+        if not self.has_changes():
+            logger.info("没有数据变化，跳过维护")
+            return
+        if self.deadline is not None and (self.deadline.deferred or not self.deadline.allows('maintenance')):
+            logger.warning("时间预算不足，跳过维护（由 autovacuum 处理）")
+            return
+        tables = [table for table, counts in self.change_counts.items() if self.full_reload or any(counts.values())]
+        # 有变更时都会追加变更日志并清理过期记录
+        tables.append('tmp_change_log')
+        logger.info(f"\n维护有写入的表: {', '.join(tables)}")
+        with self.profiler.stage('maintenance'):
+            if self.deadline is not None:
+                with self.deadline.measure('maintenance'):
+                    run_maintenance(self.get_db_connection, tables, tenant_id=self.tenant_id)
+            else:
+                run_maintenance(self.get_db_connection, tables, tenant_id=self.tenant_id)
+    
     def run(self):
-        """执行完整的同步流程"""
+        """执行完整的同步流程，启用维护阶段时最后执行维护"""
+        self.run_sync()
+        if self.maintenance:
+            self.run_maintenance()
+    
+    def run_sync(self):
+        """获取身份中台数据并写入临时表"""
         logger.info("=" * 50)
         logger.info("开始从身份中台同步组织架构数据到临时表")
         logger.info("=" * 50)
         
+        self.reset_change_counts()
+        fetch_started = datetime.now()
+        self._start_deadline()
         try:
+            since = self._incremental_since()
+            if since is not None:
+                logger.info("\n[1/3] 从身份中台获取有更新的用户...")
+                try:
+                    with self.profiler.stage('fetch_users'):
+                        users = self.get_changed_users_from_idc(since)
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    logger.warning(f"增量获取失败，回退为全量获取: {e}")
+                else:
+                    if self.deadline is not None:
+                        deferred = self.run_scheduled(users, full=False)
+                    else:
+                        self.run_incremental(users)
+                        deferred = []
+                    self._finish_run(fetch_started, False, deferred)
+                    logger.info("\n" + "=" * 50)
+                    logger.info(f"同步完成（增量获取，{len(users)} 个用户有更新）!")
+                    logger.info("=" * 50)
+                    return
+            
+            if self.db_backend == 'asyncpg' and not self.sample_size and self.deadline is None:
+                with self.profiler.stage('async_pipeline'):
+                    asyncio.run(self.run_async())
+                self.finish_publish()
+                self.prune_change_log()
+                self._save_sync_state(fetch_started, full=True)
+                logger.info("\n" + "=" * 50)
+                logger.info("同步完成!")
+                logger.info("=" * 50)
+                return
+            
             # 1. 获取用户信息
             logger.info("\n[1/5] 从身份中台获取用户信息...")
-            users = self.get_all_users_from_idc()
+            with self.profiler.stage('fetch_users'):
+                users = self.get_all_users_from_idc()
+            
+            if self.publish_mode == 'swap':
+                self.run_shadow_swap(users)
+                self._save_sync_state(fetch_started, full=True)
+                return
+            
+            if self.deadline is not None:
+                deferred = self.run_scheduled(users, full=not self.sample_size)
+                self._finish_run(fetch_started, True, deferred)
+                logger.info("\n" + "=" * 50)
+                logger.info("同步完成（有延后的工作）!" if deferred else "同步完成!")
+                logger.info("=" * 50)
+                return
             
             # 2. 同步用户
             logger.info("\n[2/5] 同步用户到临时表...")
-            self.sync_users(users)
-            active_user_ids = [str(get_attr(u, 'sourceUserId') or get_attr(u, 'userId') or get_attr(u, 'id') or '') for u in users if get_attr(u, 'sourceUserId') or get_attr(u, 'userId') or get_attr(u, 'id')]
+            with self.profiler.stage('sync_users'):
+                self.sync_users(users)
+            active_user_ids = [user_id for user_id in (get_user_id(u) for u in users) if user_id]
             
             # 3. 获取组织架构信息
             logger.info("\n[3/5] 从身份中台获取组织架构信息...")
-            organizations = self.get_organizations_from_idc()
-            
-            if not organizations:
-                logger.error("未获取到任何组织数据！")
-                logger.error("可能的原因：")
-                logger.error("1. 用户数据中没有组织信息（mainOrg和orgList都为空）")
-                logger.error("2. 组织提取逻辑有问题")
-                logger.error("3. 如果使用了FILTER_ORG_NAMES，可能过滤后没有匹配的组织")
-                logger.error("4. 用户数据为空，无法提取组织信息")
-                # 打印一些调试信息
-                if users:
-                    sample_user = users[0] if len(users) > 0 else None
-                    if sample_user:
-                        logger.info(f"示例用户数据结构: sourceUserId={get_attr(sample_user, 'sourceUserId')}")
-                        logger.info(f"示例用户 mainOrg: {get_attr(sample_user, 'mainOrg')}")
-                        logger.info(f"示例用户 orgList: {get_attr(sample_user, 'orgList')}")
-                raise Exception("未获取到组织数据，无法继续同步")
-            
-            logger.info(f"成功获取到 {len(organizations)} 个组织")
-            # 打印前几个组织的信息用于调试
-            if len(organizations) > 0:
-                logger.info(f"前3个组织示例: {organizations[:3]}")
+            with self.profiler.stage('fetch_organizations'):
+                organizations = self.get_organizations_from_idc(users=users)
+                self._check_organizations(organizations, users)
             
             # 4. 同步组织
             logger.info("\n[4/5] 同步组织到临时表...")
-            self.sync_organizations(organizations)
+            with self.profiler.stage('sync_organizations'):
+                self.sync_organizations(organizations)
             active_org_ids = [str(o.get('id') if isinstance(o, dict) else get_attr(o, 'id', '') or '') for o in organizations if (o.get('id') if isinstance(o, dict) else get_attr(o, 'id'))]
             
             # 5. 同步用户-组织关系
             logger.info("\n[5/5] 同步用户-组织关系到临时表...")
-            self.sync_user_org_relations(users)
+            with self.profiler.stage('sync_relations'):
+                self.sync_user_org_relations(users)
             
-            # 6. 标记已删除的用户和组织
-            logger.info("\n[6/6] 标记已删除的用户和组织...")
-            self.mark_deleted_users(active_user_ids)
-            self.mark_deleted_organizations(active_org_ids)
+            # 6. 标记已删除的用户和组织（抽样模式下未抽中的数据不能视为已删除）
+            if self.sample_size:
+                logger.info("\n[6/6] 抽样模式，跳过标记已删除的用户和组织")
+            else:
+                logger.info("\n[6/6] 标记已删除的用户和组织...")
+                with self.profiler.stage('mark_deleted'):
+                    self.mark_deleted_users(active_user_ids)
+                    self.mark_deleted_organizations(active_org_ids)
+            
+            self.finish_publish()
+            self.prune_change_log()
+            self._save_sync_state(fetch_started, full=True)
             
             logger.info("\n" + "=" * 50)
             logger.info("同步完成!")
             logger.info("=" * 50)
             
+        except DeadlineExceeded as e:
+            # 获取阶段超出预算：尚未写入任何数据，保存速率和延后项（保留上一次尚未完成的延后项），不更新高水位
+            carried = [item for item in self.last_deferred if item['stage'] != 'fetch_users']
+            self._finish_run(fetch_started, False, carried + self.deadline.deferred)
+            logger.warning("\n" + "=" * 50)
+            logger.warning(f"同步已中止，未写入任何数据: {e}")
+            logger.warning("=" * 50)
         except Exception as e:
             logger.error(f"同步过程出错: {e}", exc_info=True)
             raise
@@ -787,6 +1518,119 @@ def main():
         type=str,
         help='要过滤的组织名称列表（逗号分隔），例如：--filter-org-names "信息技术中心,计算机学院"'
     )
+    parser.add_argument(
+        '--extract-workers',
+        type=int,
+        help='从用户信息中提取组织时使用的进程数（0=根据数据量自动选择，1=串行）'
+    )
+    parser.add_argument(
+        '--publish-mode',
+        choices=PUBLISH_MODES,
+        help='发布模式：incremental=逐行写入临时表（默认），swap=加载影子表后原子切换'
+    )
+    
+    parser.add_argument(
+        '--sample',
+        type=int,
+        metavar='N',
+        help='抽样模式：按组织分层抽取N个用户进行同步（不标记删除），用于快速验证'
+    )
+    parser.add_argument(
+        '--fetch-mode',
+        choices=FETCH_MODES,
+        help='获取模式：full=获取全部身份（默认），incremental=只获取上次同步之后有更新的身份，'
+             '按 FULL_SYNC_INTERVAL_DAYS 定期全量获取（默认读取环境变量 SYNC_FETCH_MODE）'
+    )
+    parser.add_argument(
+        '--time-budget',
+        type=float,
+        metavar='MINUTES',
+        help='时间预算（分钟）：按优先级分块写入，剩余时间不足时在块边界停止并把剩余工作延后到下一次同步'
+             '（默认读取环境变量 SYNC_TIME_BUDGET_MINUTES）'
+    )
+    parser.add_argument(
+        '--maintenance',
+        action='store_true',
+        default=None,
+        help='同步完成后对有写入的表执行 ANALYZE，死元组超过阈值时 VACUUM，并记录统计历史'
+             '（默认读取环境变量 SYNC_MAINTENANCE）'
+    )
+    parser.add_argument(
+        '--fast-path',
+        action='store_true',
+        default=None,
+        help='使用原始JSON快速路径获取人员身份，跳过SDK模型构造（默认读取环境变量 IDC_FAST_PATH）'
+    )
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help='只生成同步计划（统计将要新增、更新、删除的数据），不写入数据库'
+    )
+    parser.add_argument(
+        '--plan-output',
+        type=str,
+        help='将同步计划或对账结果以JSON格式写入指定文件（配合 --plan / --reconcile 使用）'
+    )
+    parser.add_argument(
+        '--plan-samples',
+        type=int,
+        default=10,
+        help='同步计划和对账结果中每类变更输出的示例数量（默认：10）'
+    )
+    parser.add_argument(
+        '--reconcile',
+        action='store_true',
+        help='分桶摘要对账：比较身份中台与临时表，只读取摘要不同的桶，不写入数据库'
+    )
+    parser.add_argument(
+        '--repair',
+        action='store_true',
+        help='配合 --reconcile 使用，只修复对账发现的差异记录'
+    )
+    parser.add_argument(
+        '--reconcile-buckets',
+        type=int,
+        help=f'对账的桶数（默认读取环境变量 RECONCILE_BUCKETS，未设置时为 {DEFAULT_BUCKETS}）'
+    )
+    parser.add_argument(
+        '--on-conflict',
+        choices=ON_CONFLICT_MODES,
+        default=os.getenv('SYNC_ON_CONFLICT', 'exit'),
+        help='同一租户已有同步在运行时的处理方式：exit=跳过本次（默认），wait=等待其结束'
+             '（默认读取环境变量 SYNC_ON_CONFLICT）'
+    )
+    parser.add_argument(
+        '--wait-timeout',
+        type=float,
+        default=3600,
+        help='--on-conflict wait 时的最长等待秒数（默认：3600）'
+    )
+    parser.add_argument(
+        '--db-backend',
+        choices=DB_BACKENDS,
+        help='写入临时表使用的数据库后端：psycopg2（默认），asyncpg=数据写入与获取身份中台数据并行，'
+             'sqlite=写入本地 SQLite 文件（本地运行和测试）'
+    )
+    parser.add_argument(
+        '--sqlite-path',
+        type=str,
+        help='sqlite 后端的数据库文件路径，:memory: 表示内存数据库（默认读取环境变量 TMP_DB_SQLITE_PATH）'
+    )
+    parser.add_argument(
+        '--index-file',
+        type=str,
+        help='同步完成后导出目录索引文件的路径（默认读取环境变量 DIRECTORY_INDEX_FILE）'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='对同步的每个阶段进行性能分析（cProfile + tracemalloc），输出各阶段报告'
+    )
+    parser.add_argument(
+        '--profile-dir',
+        type=str,
+        help='性能分析报告的输出目录（默认：sync_org.log 所在目录下的 sync_profile）'
+    )
     
     args = parser.parse_args()
     
@@ -796,8 +1640,33 @@ def main():
         filter_org_names = [name.strip() for name in args.filter_org_names.split(',') if name.strip()]
     
     try:
-        sync = OrgSyncFromIDC(filter_org_names=filter_org_names)
-        sync.run()
+        profiler = StageProfiler(args.profile_dir) if args.profile else None
+        sync = OrgSyncFromIDC(filter_org_names=filter_org_names, publish_mode=args.publish_mode,
+                              extract_workers=args.extract_workers, profiler=profiler,
+                              index_file=args.index_file, db_backend=args.db_backend,
+                              sqlite_path=args.sqlite_path, sample_size=args.sample, fast_path=args.fast_path,
+                              fetch_mode=args.fetch_mode, time_budget_minutes=args.time_budget,
+                              maintenance=args.maintenance)
+        if args.plan:
+            report = sync.plan(sample_size=args.plan_samples)
+            if args.plan_output:
+                with open(args.plan_output, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
+                logger.info(f"同步计划已写入: {args.plan_output}")
+        elif args.reconcile and args.repair:
+            if not sync.run_exclusive(args.on_conflict, args.wait_timeout, target=lambda: sync.reconcile(
+                    args.reconcile_buckets, repair=True, sample_size=args.plan_samples)):
+                logger.info("已有同步在运行，本次未执行")
+        elif args.reconcile:
+            report = sync.reconcile(args.reconcile_buckets, sample_size=args.plan_samples)
+            if args.plan_output:
+                with open(args.plan_output, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
+                logger.info(f"对账结果已写入: {args.plan_output}")
+            if not is_consistent(report):
+                sys.exit(2)
+        elif not sync.run_exclusive(args.on_conflict, args.wait_timeout):
+            logger.info("已有同步在运行，本次未执行")
     except KeyboardInterrupt:
         logger.info("\n用户中断同步")
         sys.exit(1)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+同步计划（dry-run）
+
+将本次从身份中台获取的快照写入会话临时表，与 tmp_user、tmp_organization、
+tmp_org_user_relation 的现有数据做集合比较，统计将要新增、更新、删除的数据并给出示例，
+整个过程在一个最终回滚的事务中完成，不会修改任何正式表。
+"""
+
+import time
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from db_utils import create_snapshot_tables
+
+logger = logging.getLogger(__name__)
+
+
+# 每类变更的 (统计SQL, 示例列名)，SQL 中第一个参数为租户ID
+_PLAN_QUERIES = {
+    'tmp_user': {
+        'insert': ("""
+            SELECT s.id, s.user_name, s.display_name, s.status
+            FROM _snapshot_user s
+            WHERE NOT EXISTS (SELECT 1 FROM tmp_user t WHERE t.tenant_id = %(tenant_id)s AND t.user_name = s.user_name)
+        """, ('id', 'user_name', 'display_name', 'status')),
+        'update': ("""
+            SELECT t.id, t.user_name,
+                   concat_ws(',',
+                       CASE WHEN t.display_name IS DISTINCT FROM s.display_name THEN 'display_name' END,
+                       CASE WHEN t.email IS DISTINCT FROM s.email THEN 'email' END,
+                       CASE WHEN t.mobile IS DISTINCT FROM s.mobile THEN 'mobile' END,
+                       CASE WHEN t.status IS DISTINCT FROM s.status THEN 'status' END,
+                       CASE WHEN t.description <> '' THEN 'description' END,
+                       CASE WHEN t.is_deleted <> 0 THEN 'is_deleted' END)
+            FROM _snapshot_user s
+            JOIN tmp_user t ON t.tenant_id = %(tenant_id)s AND t.user_name = s.user_name
+            WHERE (t.display_name, t.email, t.mobile, t.status, t.description, t.is_deleted)
+                  IS DISTINCT FROM (s.display_name, s.email, s.mobile, s.status, '', 0)
+        """, ('id', 'user_name', 'changed_fields')),
+        'delete': ("""
+            SELECT t.id, t.user_name, t.display_name
+            FROM tmp_user t
+            WHERE t.tenant_id = %(tenant_id)s AND t.is_deleted = 0
+              AND NOT EXISTS (SELECT 1 FROM _snapshot_user s WHERE s.id = t.id)
+        """, ('id', 'user_name', 'display_name')),
+    },
+    'tmp_organization': {
+        'insert': ("""
+            SELECT s.id, s.name, s.org_code
+            FROM _snapshot_org s
+            WHERE NOT EXISTS (SELECT 1 FROM tmp_organization t WHERE t.tenant_id = %(tenant_id)s AND t.org_code = s.org_code)
+        """, ('id', 'name', 'org_code')),
+        'update': ("""
+            SELECT t.id, t.org_code,
+                   concat_ws(',',
+                       CASE WHEN t.name IS DISTINCT FROM s.name THEN 'name' END,
+                       CASE WHEN t.pid IS DISTINCT FROM s.pid THEN 'pid' END,
+                       CASE WHEN t.is_deleted <> 0 THEN 'is_deleted' END)
+            FROM _snapshot_org s
+            JOIN tmp_organization t ON t.tenant_id = %(tenant_id)s AND t.org_code = s.org_code
+            WHERE (t.name, t.pid, t.is_deleted) IS DISTINCT FROM (s.name, s.pid, 0)
+        """, ('id', 'org_code', 'changed_fields')),
+        'delete': ("""
+            SELECT t.id, t.name, t.org_code
+            FROM tmp_organization t
+            WHERE t.tenant_id = %(tenant_id)s AND t.is_deleted = 0
+              AND NOT EXISTS (SELECT 1 FROM _snapshot_org s WHERE s.id = t.id)
+        """, ('id', 'name', 'org_code')),
+    },
+    'tmp_org_user_relation': {
+        'insert': ("""
+            SELECT s.user_id, s.org_id
+            FROM _snapshot_relation s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM tmp_org_user_relation r
+                WHERE r.tenant_id = %(tenant_id)s AND r.user_id = s.user_id AND r.org_id = s.org_id
+            )
+        """, ('user_id', 'org_id')),
+        'delete': ("""
+            SELECT r.user_id, r.org_id
+            FROM tmp_org_user_relation r
+            WHERE r.tenant_id = %(tenant_id)s
+              AND NOT EXISTS (SELECT 1 FROM _snapshot_relation s WHERE s.user_id = r.user_id AND s.org_id = r.org_id)
+        """, ('user_id', 'org_id')),
+    },
+}
+
+
+class SyncPlanner:
+    """对比快照与临时表现有数据，生成同步计划"""
+
+    def __init__(self, get_connection: Callable, tenant_id: str, sample_size: int = 10):
+        """
+        Args:
+            get_connection: 获取数据库连接的函数
+            tenant_id: 租户ID
+            sample_size: 每类变更保留的示例数量
+        """
+        self.get_connection = get_connection
+        self.tenant_id = tenant_id
+        self.sample_size = sample_size
+
+    def plan(self, snapshot: Dict[str, List[Tuple]]) -> Dict[str, Dict]:
+        """
+        生成同步计划
+
+        Args:
+            snapshot: idc_records.build_snapshot 构建的快照
+
+        Returns:
+            {表名: {变更类型: {'count': 数量, 'samples': [示例, ...]}}}
+        """
+        start = time.time()
+        conn = self.get_connection()
+        try:
+            cur = conn.cursor()
+            create_snapshot_tables(cur, snapshot, relations=True)
+
+            report = {}
+            for table, queries in _PLAN_QUERIES.items():
+                report[table] = {}
+                for change, (sql, columns) in queries.items():
+                    # 用窗口函数在同一条查询中得到总数和前N条示例
+                    cur.execute(f"SELECT *, COUNT(*) OVER () FROM ({sql}) AS diff LIMIT %(limit)s",
+                                {'tenant_id': self.tenant_id, 'limit': max(self.sample_size, 1)})
+                    rows = cur.fetchall()
+                    report[table][change] = {
+                        'count': rows[0][-1] if rows else 0,
+                        'samples': [dict(zip(columns, row[:-1])) for row in rows[:self.sample_size]],
+                    }
+            cur.close()
+        finally:
+            # 只读计划：回滚事务，临时表随之删除
+            conn.rollback()
+            conn.close()
+
+        logger.info(f"同步计划生成完成，耗时 {time.time() - start:.2f}s")
+        return report
+
+
+def log_plan_report(report: Dict[str, Dict]):
+    """将同步计划输出到日志"""
+    logger.info("=" * 50)
+    logger.info("同步计划（不会写入任何数据）")
+    logger.info("=" * 50)
+    for table, changes in report.items():
+        summary = ', '.join(f"{change}: {detail['count']}" for change, detail in changes.items())
+        logger.info(f"{table} - {summary}")
+        for change, detail in changes.items():
+            for sample in detail['samples']:
+                logger.info(f"  [{change}] {sample}")
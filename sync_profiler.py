@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+同步流程的分阶段性能分析
+
+对每个阶段分别使用 cProfile 和 tracemalloc 采集数据，输出到一次运行对应的目录中：
+- <序号>_<阶段>.pstats: cProfile 统计数据，可用 `python -m pstats` 或 snakeviz 查看
+- <序号>_<阶段>_cpu.txt: 按累计耗时排序的前N个函数
+- <序号>_<阶段>_alloc.txt: 阶段结束时相对阶段开始新增内存最多的代码行
+- summary.txt: 各阶段的耗时、CPU时间、内存峰值汇总，便于比较不同运行
+"""
+
+import io
+import os
+import time
+import pstats
+import cProfile
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# 默认输出目录（与 sync_org.log 位于同一目录）
+DEFAULT_PROFILE_DIR = 'sync_profile'
+
+# 报告中输出的函数/代码行数量
+TOP_N = 30
+
+
+class StageProfiler:
+    """分阶段性能分析器，未启用时 stage() 不做任何处理"""
+
+    def __init__(self, output_dir: Optional[str] = None, enabled: bool = True, top_n: int = TOP_N):
+        """
+        Args:
+            output_dir: 输出根目录，每次运行在其下创建以时间命名的子目录
+            enabled: 是否启用
+            top_n: 报告中输出的函数/代码行数量
+        """
+        self.enabled = enabled
+        self.top_n = top_n
+        self.stages: List[Dict] = []
+        self.run_dir = None
+        if enabled:
+            root = output_dir or DEFAULT_PROFILE_DIR
+            self.run_dir = os.path.join(root, datetime.now().strftime('%Y%m%d_%H%M%S'))
+            os.makedirs(self.run_dir, exist_ok=True)
+            logger.info(f"性能分析已启用，报告输出目录: {self.run_dir}")
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        对一个阶段进行性能分析
+
+        Args:
+            name: 阶段名称，用于报告文件名
+        """
+        if not self.enabled:
+            yield
+            return
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(25)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+
+        profiler = cProfile.Profile()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            self._write_stage(name, profiler, before, after, wall, cpu, current, peak)
+
+    def _write_stage(self, name: str, profiler: cProfile.Profile, before, after,
+                     wall: float, cpu: float, current: int, peak: int):
+        """写出单个阶段的报告"""
+        prefix = os.path.join(self.run_dir, f"{len(self.stages) + 1:02d}_{name}")
+        profiler.dump_stats(f"{prefix}.pstats")
+
+        buffer = io.StringIO()
+        pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(self.top_n)
+        with open(f"{prefix}_cpu.txt", 'w', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+
+        # 排除 tracemalloc 自身的内存占用
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        with open(f"{prefix}_alloc.txt", 'w', encoding='utf-8') as f:
+            f.write(f"阶段: {name}\n")
+            f.write(f"内存峰值: {peak / 1024 / 1024:.1f} MiB, 阶段结束时: {current / 1024 / 1024:.1f} MiB\n\n")
+            for stat in diff[:self.top_n]:
+                f.write(f"{stat}\n")
+
+        self.stages.append({'name': name, 'wall': wall, 'cpu': cpu, 'peak': peak, 'current': current})
+        logger.info(f"[性能分析] {name}: 耗时 {wall:.2f}s, CPU {cpu:.2f}s, 内存峰值 {peak / 1024 / 1024:.1f} MiB")
+        self._write_summary()
+
+    def _write_summary(self):
+        """写出（覆盖）各阶段汇总，阶段中途失败时也保留已完成阶段的数据"""
+        with open(os.path.join(self.run_dir, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"{'阶段':<24}{'耗时(s)':>12}{'CPU(s)':>12}{'峰值(MiB)':>14}{'结束(MiB)':>14}\n")
+            for stage in self.stages:
+                f.write(f"{stage['name']:<24}{stage['wall']:>12.2f}{stage['cpu']:>12.2f}"
+                        f"{stage['peak'] / 1024 / 1024:>14.1f}{stage['current'] / 1024 / 1024:>14.1f}\n")
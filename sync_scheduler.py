@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+带时间预算的同步调度
+
+同步窗口固定时，身份中台变慢会让同步超时被强制终止，终止点落在关系同步中间时
+下游看到的是最差的状态。设置时间预算（--time-budget / SYNC_TIME_BUDGET_MINUTES）后，
+写入阶段按优先级执行并切分为小块，每块是一个独立事务：
+
+1. 用户（状态为禁用、删除等非正常状态的用户排在最前）
+2. 标记删除的用户和组织
+3. 组织
+4. 用户-组织关系（按用户分块替换）
+
+每块开始前根据本次运行已观测到的速率（没有观测时使用上一次运行保存的速率）估算耗时，
+剩余时间不够时在块边界停止，未完成的工作记录为延后项，下一次运行从延后的位置继续。
+
+获取用户也计入预算：每页请求前按已观测的获取速率检查，身份中台变慢、获取阶段就会超出预算时
+抛出 DeadlineExceeded，本次运行在写入任何数据前中止并记录为延后。
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+# 估算耗时的放大系数，给速率波动留出余量
+DEFAULT_SAFETY_FACTOR = 1.5
+
+# 每块的用户数
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class DeadlineExceeded(Exception):
+    """写入开始前（获取阶段）时间预算已不够，本次运行中止，延后项已记录在 SyncDeadline.deferred 中"""
+
+
+class SyncDeadline:
+    """
+    用法：
+        deadline = SyncDeadline(3600, prior_rates=state['stage_rates'])
+        with deadline.measure('fetch_users'):
+            users = fetch()
+        done = deadline.run_chunks('sync_users', chunks, write_chunk)
+        if deadline.deferred:
+            ...
+    """
+
+    def __init__(self, budget_seconds: float, prior_rates: Optional[Dict[str, float]] = None,
+                 safety_factor: float = DEFAULT_SAFETY_FACTOR, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            budget_seconds: 时间预算（秒）
+            prior_rates: 上一次运行各阶段每项耗时（秒），本次尚未观测到的阶段使用
+            safety_factor: 估算耗时的放大系数
+            clock: 单调时钟
+        """
+        self.budget_seconds = budget_seconds
+        self.prior_rates = dict(prior_rates or {})
+        self.safety_factor = safety_factor
+        self.clock = clock
+        self.started = clock()
+        # 阶段 -> [耗时, 项数]
+        self.observed: Dict[str, List[float]] = {}
+        # [{'stage': 阶段, 'pending': 未完成项数, 'reason': 原因, ...}]
+        self.deferred: List[Dict] = []
+
+    def elapsed(self) -> float:
+        return self.clock() - self.started
+
+    def remaining(self) -> float:
+        return self.budget_seconds - self.elapsed()
+
+    def rate(self, stage: str) -> Optional[float]:
+        """阶段每项耗时（秒），没有观测数据时返回 None"""
+        seconds, items = self.observed.get(stage, (0.0, 0))
+        if items:
+            return seconds / items
+        return self.prior_rates.get(stage)
+
+    def estimate(self, stage: str, items: int = 1) -> Optional[float]:
+        rate = self.rate(stage)
+        return None if rate is None else rate * items * self.safety_factor
+
+    def allows(self, stage: str, items: int = 1) -> bool:
+        """剩余时间是否足够执行该阶段的 items 项，没有速率数据时只要还有剩余时间就允许"""
+        remaining = self.remaining()
+        estimate = self.estimate(stage, items)
+        if estimate is None:
+            return remaining > 0
+        return estimate <= remaining
+
+    @contextmanager
+    def measure(self, stage: str, items: int = 1):
+        """记录阶段耗时"""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            seconds, count = self.observed.get(stage, (0.0, 0))
+            self.observed[stage] = [seconds + self.clock() - start, count + items]
+
+    def defer(self, stage: str, pending: int, reason: Optional[str] = None, **detail):
+        """记录延后到下一次运行的工作"""
+        if reason is None:
+            estimate = self.estimate(stage, pending)
+            reason = (f"剩余 {max(self.remaining(), 0):.0f} 秒，预计需要 {estimate:.0f} 秒" if estimate is not None
+                      else "时间预算已用完")
+        item = {'stage': stage, 'pending': pending, 'reason': reason}
+        item.update(detail)
+        self.deferred.append(item)
+        logger.warning(f"时间预算不足，延后 {stage}（{pending} 项）到下一次同步: {reason}")
+
+    def run_chunks(self, stage: str, chunks: Sequence[Sequence], apply: Callable[[Sequence], None],
+                   detail: Optional[Callable[[Sequence], Dict]] = None) -> int:
+        """
+        逐块执行，每块开始前检查剩余时间
+
+        Args:
+            stage: 阶段名称
+            chunks: 分块后的工作项
+            apply: 执行一块的函数
+            detail: 延后时根据第一块未完成的工作项生成附加信息（如续跑位置）
+
+        Returns:
+            已完成的块数
+        """
+        for index, chunk in enumerate(chunks):
+            if not self.allows(stage, len(chunk)):
+                pending = sum(len(rest) for rest in chunks[index:])
+                self.defer(stage, pending, **(detail(chunk) if detail else {}))
+                return index
+            with self.measure(stage, len(chunk)):
+                apply(chunk)
+        return len(chunks)
+
+    def rates(self) -> Dict[str, float]:
+        """各阶段每项耗时（本次观测覆盖上一次保存的速率），保存后供下一次运行估算"""
+        rates = dict(self.prior_rates)
+        for stage in self.observed:
+            rates[stage] = self.rate(stage)
+        return rates
+
+    def log_summary(self):
+        stages = ', '.join(f"{stage} {seconds:.1f}s/{int(items)}项" for stage, (seconds, items) in self.observed.items())
+        logger.info(f"时间预算: {self.budget_seconds:.0f} 秒，已用 {self.elapsed():.0f} 秒（{stages}）")
+        if self.deferred:
+            logger.warning(f"本次同步延后的工作: {', '.join(item['stage'] for item in self.deferred)}")
+
+
+def chunked(items: Sequence, size: int = DEFAULT_CHUNK_SIZE) -> List[Sequence]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def rotate_from(items: Sequence[str], start: Optional[str]) -> List[str]:
+    """将已排序的 items 从第一个不小于 start 的元素开始轮转，上一次延后的位置排在最前"""
+    items = list(items)
+    if not start:
+        return items
+    for index, item in enumerate(items):
+        if item >= start:
+            return items[index:] + items[:index]
+    return items
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量获取的同步状态（tmp_sync_state 表）
+
+每个租户一行，记录上一次成功同步开始获取数据的时间（高水位）和上一次全量获取的时间。
+增量获取时只请求 updateTime 不早于 高水位 - 重叠时间 的身份（身份中台与本机的时钟偏差、
+获取过程中发生的修改都落在重叠时间内），超过全量间隔后自动回退为全量获取，
+以便处理身份中台中被物理删除、不会再出现在增量结果里的数据。
+
+设置时间预算时还保存各阶段的速率和延后到下一次运行的工作（见 sync_scheduler）。
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# 获取模式：full=每次获取全部身份，incremental=只获取上次同步之后有更新的身份
+FETCH_MODES = ('full', 'incremental')
+
+# 默认全量获取间隔（天）
+DEFAULT_FULL_INTERVAL_DAYS = 7
+
+# 默认重叠时间（分钟）
+DEFAULT_OVERLAP_MINUTES = 10
+
+
+def sync_state_exists(cur) -> bool:
+    cur.execute("SELECT to_regclass('tmp_sync_state') IS NOT NULL")
+    return cur.fetchone()[0]
+
+
+def load_sync_state(conn, tenant_id: str) -> Optional[Dict]:
+    """
+    读取租户的同步状态
+
+    Returns:
+        {'watermark', 'last_full_time', 'stage_rates', 'deferred'}，没有记录或表不存在时返回 None
+    """
+    cur = conn.cursor()
+    if not sync_state_exists(cur):
+        logger.warning("tmp_sync_state 表不存在，无法增量获取（请执行 init_tables.sql）")
+        return None
+    cur.execute("SELECT watermark, last_full_time, stage_rates, deferred FROM tmp_sync_state WHERE tenant_id = %s",
+                (tenant_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return {'watermark': row[0], 'last_full_time': row[1], 'stage_rates': row[2] or {}, 'deferred': row[3] or []}
+
+
+def save_sync_state(conn, tenant_id: str, watermark: datetime, full: bool) -> bool:
+    """
+    保存成功同步后的高水位（由调用方提交事务）
+
+    Args:
+        conn: 数据库连接
+        tenant_id: 租户ID
+        watermark: 本次同步开始获取数据的时间
+        full: 本次是否为全量获取
+
+    Returns:
+        是否已保存，表不存在时返回 False
+    """
+    cur = conn.cursor()
+    if not sync_state_exists(cur):
+        return False
+    cur.execute("""
+        INSERT INTO tmp_sync_state (tenant_id, watermark, last_full_time)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (tenant_id) DO UPDATE SET
+            watermark = EXCLUDED.watermark,
+            last_full_time = COALESCE(EXCLUDED.last_full_time, tmp_sync_state.last_full_time),
+            updated_time = CURRENT_TIMESTAMP
+    """, (tenant_id, watermark, watermark if full else None))
+    return True
+
+
+def save_schedule_state(conn, tenant_id: str, stage_rates: Dict[str, float], deferred: List[Dict]) -> bool:
+    """
+    保存时间预算调度的各阶段速率和延后的工作（由调用方提交事务），不修改高水位
+
+    Returns:
+        是否已保存，表不存在时返回 False
+    """
+    cur = conn.cursor()
+    if not sync_state_exists(cur):
+        return False
+    cur.execute("""
+        INSERT INTO tmp_sync_state (tenant_id, stage_rates, deferred)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (tenant_id) DO UPDATE SET
+            stage_rates = EXCLUDED.stage_rates,
+            deferred = EXCLUDED.deferred,
+            updated_time = CURRENT_TIMESTAMP
+    """, (tenant_id, json.dumps(stage_rates), json.dumps(deferred, ensure_ascii=False)))
+    return True
+
+
+def resolve_fetch_since(state: Optional[Dict], full_interval_days: float, overlap_minutes: float,
+                        now: Optional[datetime] = None) -> Tuple[Optional[datetime], str]:
+    """
+    根据同步状态确定本次增量获取的起始时间
+
+    Returns:
+        (起始时间, 说明)，需要全量获取时起始时间为 None
+    """
+    now = now or datetime.now()
+    if not state or not state.get('watermark'):
+        return None, "没有上一次成功同步的记录"
+    last_full_time = state.get('last_full_time')
+    if not last_full_time:
+        return None, "没有全量获取的记录"
+    if full_interval_days > 0 and now - last_full_time >= timedelta(days=full_interval_days):
+        return None, f"距上次全量获取已超过 {full_interval_days:g} 天（{last_full_time:%Y-%m-%d %H:%M}）"
+    since = state['watermark'] - timedelta(minutes=overlap_minutes)
+    return since, f"获取 {since:%Y-%m-%d %H:%M:%S} 之后有更新的身份"
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 """
 测试数据库连接脚本
+
+python test_db_connection.py [--exact]   # --exact 时统计当前租户的精确记录数
 """
 
 import os
@@ -12,8 +14,46 @@ import psycopg2
 # 加载环境变量
 load_dotenv()
 
+def test_sqlite_connection():
+    """测试 SQLite 数据库（TMP_DB_BACKEND=sqlite）"""
+    from db_utils import get_sqlite_path
+    from storage import TABLES, SqliteStorage
+    
+    path = get_sqlite_path()
+    print("=" * 50)
+    print("测试数据库连接（SQLite）")
+    print("=" * 50)
+    print(f"文件: {path}")
+    print("=" * 50)
+    
+    try:
+        storage = SqliteStorage(path, os.getenv('TENANT_ID', '0'))
+        print("✓ 数据库打开成功！")
+        
+        print("\n检查临时表（当前租户）:")
+        ok = True
+        for table in TABLES:
+            columns = storage.describe_table(table)
+            if not columns:
+                print(f"  ✗ {table} - 不存在")
+                ok = False
+                continue
+            print(f"  ✓ {table} - 存在 (字段: {len(columns)}, 记录数: {storage.count_rows(table)})")
+        
+        storage.close()
+        if not ok:
+            return False
+        print("\n✓ 测试完成！")
+        return True
+    except Exception as e:
+        print(f"✗ 发生错误: {e}")
+        return False
+
 def test_connection():
     """测试数据库连接"""
+    if os.getenv('TMP_DB_BACKEND', 'psycopg2').strip().lower() == 'sqlite':
+        return test_sqlite_connection()
+    
     db_config = {
         "host": os.getenv('TMP_DB_HOST', 'localhost'),
         "port": int(os.getenv('TMP_DB_PORT', '5432')),
@@ -35,32 +75,16 @@ def test_connection():
         conn = psycopg2.connect(**db_config)
         print("✓ 数据库连接成功！")
         
-        # 检查临时表是否存在
-        cur = conn.cursor()
-        tables = ['tmp_user', 'tmp_organization', 'tmp_org_user_relation']
+        # 检查临时表：只读取系统目录（估算行数、索引有效性），不执行 COUNT(*) 全表扫描
+        from sync_health import check_health, format_report
         
         print("\n检查临时表:")
-        for table in tables:
-            cur.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = %s
-                );
-            """, (table,))
-            exists = cur.fetchone()[0]
-            if exists:
-                # 获取表记录数
-                cur.execute(f"SELECT COUNT(*) FROM {table};")
-                count = cur.fetchone()[0]
-                print(f"  ✓ {table} - 存在 (记录数: {count})")
-            else:
-                print(f"  ✗ {table} - 不存在")
+        report = check_health(conn, os.getenv('TENANT_ID', '0'), exact='--exact' in sys.argv)
+        print(format_report(report))
         
-        cur.close()
         conn.close()
         print("\n✓ 测试完成！")
-        return True
+        return report['healthy']
         
     except psycopg2.OperationalError as e:
         print(f"✗ 数据库连接失败: {e}")
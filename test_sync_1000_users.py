@@ -1,14 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-测试脚本：仅获取1000个用户进行同步测试
-用于验证同步功能是否正常工作
+测试脚本：按组织分层抽取1000个用户进行同步测试
+用于验证同步功能是否正常工作（抽样逻辑见 user_sampling，与 sync_org_from_idc.py --sample 相同）
 """
 
 import os
 import sys
 import logging
-from typing import List, Dict
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -37,176 +36,14 @@ logger = logging.getLogger(__name__)
 
 
 class TestSync1000Users(OrgSyncFromIDC):
-    """测试类：仅同步1000个用户"""
+    """测试类：按组织分层抽样同步1000个用户"""
     
     def __init__(self, max_users=1000):
-        """初始化，设置最大用户数"""
-        super().__init__()
+        """初始化，设置抽样用户数"""
+        super().__init__(sample_size=max_users)
         self.max_users = max_users
         logger.info(f"测试模式：最多同步 {self.max_users} 个用户")
     
-    def get_all_users_from_idc(self):
-        """
-        重写父类方法，限制获取的用户数量
-        """
-        users = []
-        page_size = 100  # 每页大小
-        current_page = 0
-        
-        logger.info(f"开始从身份中台获取用户信息（限制：{self.max_users}个）...")
-        
-        # 方案1: 尝试不传 sourceUserId，直接分页获取所有用户
-        logger.info("方案1: 不传 sourceUserId，直接分页获取用户...")
-        try:
-            from cqhyxk.models import IdentityPageRequest
-            
-            while len(users) < self.max_users:
-                # 计算本页需要获取的数量
-                remaining = self.max_users - len(users)
-                current_page_size = min(page_size, remaining)
-                
-                request = IdentityPageRequest(
-                    current=current_page,
-                    size=current_page_size
-                )
-                
-                response = self.idc_client.get_identity_list(request)
-                
-                if not response or not response.data:
-                    break
-                
-                # 获取分页信息
-                page_info = get_attr(response.data, 'page')
-                total_count = get_attr(page_info, 'total', 0) if page_info else 0
-                
-                # 获取用户列表
-                page_users = get_attr(response.data, 'content') or []
-                
-                if not page_users:
-                    break
-                
-                # 只添加需要的数量
-                remaining = self.max_users - len(users)
-                if remaining > 0:
-                    users.extend(page_users[:remaining])
-                
-                logger.info(f"已获取 {len(users)}/{min(self.max_users, total_count)} 个用户（第 {current_page + 1} 页，本页 {len(page_users)} 条）...")
-                
-                # 如果已经获取了足够的用户或没有更多数据
-                if len(users) >= self.max_users or len(page_users) < page_size:
-                    break
-                
-                current_page += 1
-            
-            if users:
-                logger.info(f"方案1成功！总共获取到 {len(users)} 个用户（限制：{self.max_users}）")
-                return users
-            else:
-                logger.warning("方案1未获取到数据，尝试其他方案...")
-        except Exception as e:
-            logger.warning(f"方案1失败: {e}")
-            logger.info("尝试使用示例用户ID进行测试...")
-        
-        # 方案2: 使用示例用户ID进行测试（如果方案1失败）
-        sample_user_id = os.getenv('SAMPLE_USER_ID')
-        if sample_user_id:
-            logger.warning("方案2: 使用示例用户ID进行测试（仅返回单个用户）...")
-            try:
-                from cqhyxk.models import IdentityPageRequest
-                request = IdentityPageRequest(
-                    current=0,
-                    size=1,
-                    sourceUserId=sample_user_id
-                )
-                response = self.idc_client.get_identity_list(request)
-                if response and response.data:
-                    page_users = get_attr(response.data, 'content') or []
-                    if page_users:
-                        users = page_users[:1]  # 只取1个用户
-                        logger.warning(f"方案2: 使用示例用户ID获取到 {len(users)} 个用户（仅用于测试）")
-                        return users
-            except Exception as e:
-                logger.error(f"方案2也失败: {e}")
-        
-        # 所有方案都失败
-        error_msg = f"""
-无法获取用户信息！可能的原因：
-1. API必须传 sourceUserId 参数，且未配置用户ID列表
-2. 需要先调用其他API获取用户ID列表
-3. 需要联系身份中台提供批量查询所有用户的API
-
-建议解决方案：
-1. 在 .env 文件中配置 USER_ID_LIST，格式：USER_ID_LIST=user1,user2,user3
-2. 或者联系身份中台确认是否有直接获取所有用户的API
-        """
-        logger.error(error_msg)
-        raise Exception("无法获取用户信息，请检查配置或联系身份中台确认API使用方式")
-    
-    def get_organizations_from_idc(self, users: List = None) -> List[Dict]:
-        """
-        重写父类方法，使用已获取的用户列表提取组织信息
-        避免重新获取所有用户
-        """
-        organizations = []
-        
-        logger.info("开始从用户信息中提取组织架构信息...")
-        
-        # 如果没有传入用户列表，使用已获取的用户（通过重写的get_all_users_from_idc）
-        if users is None:
-            users = self.get_all_users_from_idc()
-        
-        if not users:
-            logger.warning("没有用户数据，无法提取组织信息")
-            return organizations
-        
-        logger.info(f"开始从 {len(users)} 个用户中提取组织信息...")
-        org_set = set()
-        processed_count = 0
-        
-        for user in users:
-            processed_count += 1
-            # 提取主组织信息
-            main_org = get_attr(user, 'mainOrg')
-            if main_org:
-                org_id = str(get_attr(main_org, 'orgId') or get_attr(main_org, 'sourceOrgId') or '')
-                org_name = str(get_attr(main_org, 'orgName') or '')
-                if org_id:
-                    org_key = (org_id, org_name, '')
-                    if org_key not in org_set:
-                        org_set.add(org_key)
-                        organizations.append({
-                            'id': org_id,
-                            'name': org_name or org_id,
-                            'orgName': org_name,
-                            'org_code': org_id,
-                            'pid': ''
-                        })
-            
-            # 提取orgList中的所有组织信息
-            org_list = get_attr(user, 'orgList') or []
-            if isinstance(org_list, list):
-                for org in org_list:
-                    org_id = str(get_attr(org, 'orgId') or get_attr(org, 'sourceOrgId') or '')
-                    org_name = str(get_attr(org, 'orgName') or '')
-                    if org_id:
-                        org_key = (org_id, org_name, '')
-                        if org_key not in org_set:
-                            org_set.add(org_key)
-                            organizations.append({
-                                'id': org_id,
-                                'name': org_name or org_id,
-                                'orgName': org_name,
-                                'org_code': org_id,
-                                'pid': ''
-                            })
-            
-            # 每处理100个用户输出一次进度
-            if processed_count % 100 == 0:
-                logger.info(f"已处理 {processed_count}/{len(users)} 个用户，提取到 {len(organizations)} 个组织...")
-        
-        logger.info(f"从 {len(users)} 个用户信息中提取到 {len(organizations)} 个组织")
-        return organizations
-    
     def run(self):
         """执行测试同步流程"""
         logger.info("=" * 50)
@@ -249,12 +86,7 @@ class TestSync1000Users(OrgSyncFromIDC):
                 # 验证组织是否成功写入数据库
                 logger.info("\n[验证] 检查组织数据是否成功写入数据库...")
                 try:
-                    conn = self.get_db_connection()
-                    cur = conn.cursor()
-                    cur.execute("SELECT COUNT(*) FROM tmp_organization WHERE tenant_id = %s", (self.tenant_id,))
-                    db_count = cur.fetchone()[0]
-                    cur.close()
-                    conn.close()
+                    db_count = self.storage.count_rows('tmp_organization')
                     logger.info(f"数据库中实际有 {db_count} 条组织记录（租户ID: {self.tenant_id}）")
                     if db_count == 0:
                         logger.error("警告：组织数据未成功写入数据库！请检查日志了解详情。")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按组织分层的用户抽样（--sample N）
+
+逐页读取用户时按主组织分层，每个组织维护一个蓄水池（reservoir sampling），
+配额为 ceil(N / 已发现的组织数)。发现新组织时配额变小，已有蓄水池随机缩减到新配额，
+仍是该组织已读取用户的均匀抽样。
+
+连续 idle_pages 页既没有出现新组织、也没有组织的蓄水池仍未填满时（即所有组织的配额都已满），
+认为组织结构已经覆盖完整，停止获取后续页面。
+"""
+
+import math
+import random
+import logging
+from typing import Dict, List, Optional
+
+from idc_records import iter_user_org_ids
+
+logger = logging.getLogger(__name__)
+
+
+# 连续多少页没有新信息时停止获取
+DEFAULT_IDLE_PAGES = 5
+
+
+class StratifiedUserSampler:
+    """
+    用法：
+        sampler = StratifiedUserSampler(1000)
+        for page_users in pages:
+            sampler.add_page(page_users)
+            if sampler.is_complete():
+                break
+        users = sampler.result()
+    """
+
+    def __init__(self, sample_size: int, idle_pages: int = DEFAULT_IDLE_PAGES, seed: Optional[int] = None):
+        """
+        Args:
+            sample_size: 抽取的用户数量
+            idle_pages: 连续多少页没有新组织且所有组织配额已满时停止
+            seed: 随机种子，指定后抽样结果可复现
+        """
+        if sample_size <= 0:
+            raise ValueError("抽样数量必须大于0")
+        self.sample_size = sample_size
+        self.idle_pages = idle_pages
+        self._random = random.Random(seed)
+        # 主组织ID -> [已读取的用户数, 蓄水池]，没有组织的用户归入 ''
+        self._strata: Dict[str, list] = {}
+        self._idle = 0
+        self.pages = 0
+        self.users_seen = 0
+
+    @property
+    def quota(self) -> int:
+        """每个组织的抽样配额"""
+        return max(1, math.ceil(self.sample_size / max(1, len(self._strata))))
+
+    @property
+    def org_count(self) -> int:
+        return len(self._strata)
+
+    def add_page(self, users: List):
+        """加入一页用户"""
+        useful = False
+        for user in users:
+            org_ids = iter_user_org_ids(user)
+            key = org_ids[0] if org_ids else ''
+            stratum = self._strata.get(key)
+            if stratum is None:
+                stratum = self._strata[key] = [0, []]
+                self._shrink()
+                useful = True
+            stratum[0] += 1
+            quota = self.quota
+            reservoir = stratum[1]
+            if len(reservoir) < quota:
+                reservoir.append(user)
+                useful = True
+            else:
+                j = self._random.randrange(stratum[0])
+                if j < quota:
+                    reservoir[j] = user
+        self.pages += 1
+        self.users_seen += len(users)
+        self._idle = 0 if useful else self._idle + 1
+
+    def _shrink(self):
+        """组织数增加后将超出配额的蓄水池随机缩减"""
+        quota = self.quota
+        for stratum in self._strata.values():
+            if len(stratum[1]) > quota:
+                stratum[1] = self._random.sample(stratum[1], quota)
+
+    def is_complete(self) -> bool:
+        """是否可以停止获取后续页面"""
+        return self._idle >= self.idle_pages
+
+    def result(self) -> List:
+        """
+        抽样结果：各组织轮流取一个用户，直到达到抽样数量
+
+        各组织配额之和可能略大于抽样数量，轮流取可以保证每个组织都有代表；
+        读取到的用户总数不足抽样数量时返回全部用户。
+        """
+        reservoirs = []
+        for key in sorted(self._strata):
+            reservoir = list(self._strata[key][1])
+            self._random.shuffle(reservoir)
+            reservoirs.append(reservoir)
+        # 组织顺序也随机，最后一轮不足时不会总是截掉同一批组织
+        self._random.shuffle(reservoirs)
+
+        users = []
+        depth = 0
+        while len(users) < self.sample_size:
+            layer = [reservoir[depth] for reservoir in reservoirs if depth < len(reservoir)]
+            if not layer:
+                break
+            users.extend(layer[:self.sample_size - len(users)])
+            depth += 1
+        return users